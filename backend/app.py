@@ -1,7 +1,22 @@
-from flask import Flask, jsonify, request, session, render_template, g
+from flask import Flask, Response, jsonify, request, render_template, g, stream_with_context
 from flask_cors import CORS
-from backend.db import Database
+from mysql.connector import Error
+from backend.db import Database, ConnectionPool, query_hooks
+from backend.pagination import get_page_args, get_stream_format, paginate, stream_response
+from backend.telemetria import TelemetryBuffer, parse_traccia
+from backend.live import TrackBroker, parse_timestamp, QUERY_ULTIMA
+from backend.posizioni import PositionIndex
+from backend.catalogo import CatalogIndex, LIMITE_PAGINA
+from backend.geo import encode_polyline, simplify_mask
+from backend.cache import ResponseCache
+from backend.serializzazione import JSONProvider
+from backend.condizionale import condizionale, segnale_tracce, versione_tabelle
+from backend.metrics import Metrics
+from backend import auth, bulk, compressione, dispatcher, domanda, manutenzione, rollup, sentiment
+from backend.rotte import RouteAnalytics
+import io
 import os
+import threading
 from dotenv import load_dotenv
 from datetime import datetime
 
@@ -12,7 +27,13 @@ load_dotenv()
 app = Flask(__name__, 
             template_folder='../templates',
             static_folder='../static')
-app.secret_key = os.getenv('SECRET_KEY', 'default-secret-key-change-in-production')
+# Firma i token di autenticazione: senza una chiave vera login e route protette sono disattivati
+app.secret_key = os.getenv('SECRET_KEY')
+if not auth.chiave_valida(app.secret_key):
+    print("ATTENZIONE: SECRET_KEY non configurata o di esempio, login e route protette disattivati")
+
+# Date, orari e DECIMAL di MySQL serializzati direttamente (orjson se disponibile)
+app.json = JSONProvider(app)
 
 # Abilita CORS per permettere richieste dal frontend
 CORS(app)
@@ -21,22 +42,75 @@ CORS(app)
 # GESTIONE DATABASE EFFICIENTE
 # ============================================
 
+# Pool di connessioni condiviso (DB_POOL_SIZE=0 per disattivarlo)
+db_pool = ConnectionPool() if int(os.getenv('DB_POOL_SIZE', 5)) > 0 else None
+
 def get_db():
     """
-    Apre una nuova connessione al database se non ce n'è una per la richiesta corrente.
+    Preleva una connessione dal pool se non ce n'è una per la richiesta corrente.
     """
     if 'db' not in g:
-        g.db = Database()
+        g.db = Database(pool=db_pool)
         g.db.connect()
     return g.db
 
 @app.teardown_appcontext
 def close_db(e=None):
-    """Chiude la connessione al database alla fine della richiesta."""
+    """Restituisce la connessione al pool alla fine della richiesta."""
     db = g.pop('db', None)
     if db is not None:
         db.disconnect()
 
+# Latenza per route e per query SQL, esposta su /api/metrics
+metriche = Metrics()
+metriche.init_app(app)
+query_hooks.append(metriche.record_query)
+
+# Compressione gzip/brotli delle risposte sopra COMPRESS_MIN_SIZE byte
+compressione.init_app(app)
+
+# Cache delle risposte di statistiche e report, invalidata per tag dalle scritture
+# di questo worker e, tramite VersioneTabella, da quelle servite dagli altri worker
+TABELLE_CACHE = {
+    'Missioni': ('missioni',),
+    'Drone': ('droni',),
+    'Pilota': ('piloti',),
+    'Ordine': ('ordini',),
+    'Contiene': ('ordini',)
+}
+cache = ResponseCache(db_factory=lambda: Database(pool=db_pool), tabelle=TABELLE_CACHE)
+
+# Metriche dei percorsi per missione (cache delle missioni completate)
+rotte = RouteAnalytics()
+
+# Coda write-behind per l'ingest delle tracce GPS
+telemetria = TelemetryBuffer(lambda: Database(pool=db_pool))
+
+# Broker per il tracciamento live (SSE), alimentato dall'ingest e da un polling condiviso
+live = TrackBroker(lambda: Database(pool=db_pool))
+telemetria.listeners.append(live.publish)
+
+# Con wsgi:app ogni stream SSE occupa un thread del worker: oltre LIVE_MAX_STREAM stream
+# aperti la risposta è 503, così restano thread per le altre richieste (il server ASGI
+# serve gli stream senza thread e non passa da qui)
+LIVE_MAX_STREAM = int(os.getenv('LIVE_MAX_STREAM', max(1, int(os.getenv('WEB_THREADS', 8)) // 2)))
+LIVE_RETRY_AFTER = 30
+stream_live = threading.BoundedSemaphore(LIVE_MAX_STREAM)
+
+# Indice in memoria delle ultime posizioni per missione e per drone
+posizioni = PositionIndex(lambda: Database(pool=db_pool))
+telemetria.listeners.append(posizioni.update)
+
+# Indice di ricerca del catalogo prodotti, riallineato con la versione della tabella
+catalogo = CatalogIndex(lambda: Database(pool=db_pool))
+
+# Accumulatori di usura per drone (tempo di volo, distanza, missioni), aggiornati dall'ingest
+usura = manutenzione.UsuraFlotta(lambda: Database(pool=db_pool))
+telemetria.listeners.append(usura.update)
+
+# Pool dedicato alla verifica delle password: l'hash lento non occupa i thread delle richieste
+hash_pool = auth.PoolHash()
+
 # ============================================
 # ROUTE PAGINE WEB (SPA)
 # ============================================
@@ -79,15 +153,51 @@ def test_db():
         'message': 'Connessione al database fallita'
     }), 500
 
+@app.route('/api/db/pool')
+@auth.richiede_ruolo(auth.RUOLO_ADMIN)
+def get_pool_metrics():
+    """Restituisce le metriche del pool di connessioni"""
+    if db_pool is None:
+        return jsonify({'enabled': False})
+    return jsonify(dict(db_pool.metrics(), enabled=True))
+
+@app.route('/api/metrics')
+@auth.richiede_ruolo(auth.RUOLO_ADMIN)
+def get_metrics():
+    """Percentili di latenza per route e per query (formato di esposizione Prometheus)"""
+    return Response(metriche.render(), mimetype='text/plain; version=0.0.4')
+
 # ============================================
 # ENDPOINTS DRONI
 # ============================================
 
 @app.route('/api/droni', methods=['GET'])
+@condizionale('droni', lambda: versione_tabelle(get_db(), 'Drone'))
 def get_droni():
-    """Restituisce tutti i droni"""
+    """Restituisce tutti i droni (paginazione opzionale con limit/after, streaming con stream=ndjson|json)"""
+    try:
+        limit, after = get_page_args(1)
+        stream = get_stream_format()
+    except ValueError:
+        return jsonify({'error': 'Parametri di paginazione non validi'}), 400
+
     db = get_db()
     query = "SELECT * FROM Drone"
+    params = []
+    if after:
+        query += " WHERE ID > %s"
+        params.append(after[0])
+    query += " ORDER BY ID"
+
+    if stream:
+        return stream_response(db.stream_query(query, params), stream)
+
+    if limit:
+        query += " LIMIT %s"
+        params.append(limit + 1)
+        droni = db.fetch_query(query, params)
+        return jsonify(paginate(droni, limit, lambda d: [d['ID']]))
+
     droni = db.fetch_query(query)
     return jsonify(droni)
 
@@ -103,6 +213,7 @@ def get_drone(id):
     return jsonify({'error': 'Drone non trovato'}), 404
 
 @app.route('/api/droni', methods=['POST'])
+@auth.richiede_ruolo(auth.RUOLO_ADMIN)
 def create_drone():
     """Crea un nuovo drone"""
     data = request.get_json()
@@ -117,6 +228,7 @@ def create_drone():
         data['Capacita'],
         data['Batteria']
     ))
+    cache.invalidate('droni')
     
     return jsonify({
         'message': 'Drone creato con successo',
@@ -124,6 +236,7 @@ def create_drone():
     }), 201
 
 @app.route('/api/droni/<int:id>', methods=['PUT'])
+@auth.richiede_ruolo(auth.RUOLO_ADMIN)
 def update_drone(id):
     """Aggiorna un drone esistente"""
     data = request.get_json()
@@ -140,18 +253,56 @@ def update_drone(id):
         data['Batteria'],
         id
     ))
+    cache.invalidate('droni')
     
     return jsonify({'message': 'Drone aggiornato con successo'})
 
 @app.route('/api/droni/<int:id>', methods=['DELETE'])
+@auth.richiede_ruolo(auth.RUOLO_ADMIN)
 def delete_drone(id):
     """Elimina un drone"""
     db = get_db()
     query = "DELETE FROM Drone WHERE ID = %s"
     db.execute_query(query, (id,))
+    cache.invalidate('droni')
     
     return jsonify({'message': 'Drone eliminato con successo'})
 
+@app.route('/api/droni/<int:id>/manutenzione', methods=['GET'])
+def get_manutenzione_drone(id):
+    """Usura attuale, interventi registrati e metriche di volo delle ultime missioni di un drone"""
+    try:
+        missioni = int(request.args.get('missioni', 20))
+    except ValueError:
+        return jsonify({'error': 'Parametri non validi'}), 400
+    if not 1 <= missioni <= 200:
+        return jsonify({'error': 'missioni deve essere compreso tra 1 e 200'}), 400
+
+    db = get_db()
+    risultato = manutenzione.storico(db, id, missioni)
+    if risultato is None:
+        return jsonify({'error': 'Drone non trovato'}), 404
+    return jsonify(risultato)
+
+@app.route('/api/droni/<int:id>/manutenzione', methods=['POST'])
+@auth.richiede_ruolo(auth.RUOLO_ADMIN)
+def add_manutenzione_drone(id):
+    """Registra un intervento ('ordinaria' o 'batteria') e azzera i contatori corrispondenti"""
+    data = request.get_json(silent=True) or {}
+    tipo = data.get('Tipo', 'ordinaria')
+    if tipo not in manutenzione.TIPI_INTERVENTO:
+        return jsonify({'error': 'Tipo intervento non valido'}), 400
+
+    db = get_db()
+    if not db.fetch_one("SELECT ID FROM Drone WHERE ID = %s", (id,)):
+        return jsonify({'error': 'Drone non trovato'}), 404
+    intervento_id = manutenzione.registra_intervento(db, id, tipo, data.get('Note'))
+
+    return jsonify({
+        'message': 'Intervento registrato con successo',
+        'id': intervento_id
+    }), 201
+
 # ============================================
 # ENDPOINTS PILOTI
 # ============================================
@@ -162,11 +313,10 @@ def get_piloti():
     db = get_db()
     query = """
         SELECT p.*, 
-               COUNT(m.ID) as NumMissioni,
-               AVG(m.Valutazione) as MediaValutazione
+               COALESCE(s.NumMissioni, 0) as NumMissioni,
+               s.SommaValutazioni / NULLIF(s.NumValutazioni, 0) as MediaValutazione
         FROM Pilota p
-        LEFT JOIN Missioni m ON p.ID = m.IdPilota
-        GROUP BY p.ID
+        LEFT JOIN StatPilota s ON p.ID = s.ID_Pilota
     """
     piloti = db.fetch_query(query)
     return jsonify(piloti)
@@ -183,6 +333,7 @@ def get_pilota(id):
     return jsonify({'error': 'Pilota non trovato'}), 404
 
 @app.route('/api/piloti', methods=['POST'])
+@auth.richiede_ruolo(auth.RUOLO_ADMIN)
 def create_pilota():
     """Crea un nuovo pilota"""
     data = request.get_json()
@@ -198,6 +349,7 @@ def create_pilota():
         data['Email'],
         data['NumeroLicenza']
     ))
+    cache.invalidate('piloti')
     
     return jsonify({
         'success': True,
@@ -206,19 +358,26 @@ def create_pilota():
     }), 201
 
 @app.route('/api/piloti/<int:id>', methods=['DELETE'])
+@auth.richiede_ruolo(auth.RUOLO_ADMIN)
 def delete_pilota(id):
     """Elimina un pilota"""
     db = get_db()
     
-    # Verifica se il pilota ha missioni
-    check_query = "SELECT COUNT(*) as count FROM Missioni WHERE IdPilota = %s"
-    result = db.fetch_one(check_query, (id,))
+    # Elimina solo se il pilota non ha missioni, in un'unica istruzione
+    query = """
+        DELETE FROM Pilota
+        WHERE ID = %s
+          AND NOT EXISTS (SELECT 1 FROM Missioni WHERE IdPilota = %s)
+    """
+    eliminati = db.execute_rowcount(query, (id, id))
     
-    if result and result['count'] > 0:
+    if not eliminati:
+        pilota = db.fetch_one("SELECT ID FROM Pilota WHERE ID = %s", (id,))
+        if not pilota:
+            return jsonify({'error': 'Pilota non trovato'}), 404
         return jsonify({'error': 'Impossibile eliminare: pilota con missioni assegnate'}), 400
     
-    query = "DELETE FROM Pilota WHERE ID = %s"
-    db.execute_query(query, (id,))
+    cache.invalidate('piloti')
     
     return jsonify({
         'success': True,
@@ -231,9 +390,28 @@ def delete_pilota(id):
 
 @app.route('/api/missioni', methods=['GET'])
 def get_missioni():
-    """Restituisce tutte le missioni con informazioni su drone e pilota"""
+    """
+    Restituisce le missioni con informazioni su drone e pilota.
+    Paginazione keyset opzionale su (DataMissione, Ora, ID) con limit/after, streaming con stream=ndjson|json.
+    """
+    try:
+        limit, after = get_page_args(3)
+        stream = get_stream_format()
+    except ValueError:
+        return jsonify({'error': 'Parametri di paginazione non validi'}), 400
+
     db = get_db()
-    query = """
+    where = ""
+    params = []
+    if after:
+        data, ora, id_missione = after
+        where = """
+        WHERE m.DataMissione < %s
+           OR (m.DataMissione = %s AND (m.Ora < %s OR (m.Ora = %s AND m.ID < %s)))
+        """
+        params = [data, data, ora, ora, id_missione]
+
+    query = f"""
         SELECT m.*, 
                d.Modello as DroneModello, 
                p.Nome as PilotaNome, 
@@ -241,17 +419,20 @@ def get_missioni():
         FROM Missioni m
         JOIN Drone d ON m.IdDrone = d.ID
         JOIN Pilota p ON m.IdPilota = p.ID
-        ORDER BY m.DataMissione DESC, m.Ora DESC
+        {where}
+        ORDER BY m.DataMissione DESC, m.Ora DESC, m.ID DESC
     """
-    missioni = db.fetch_query(query)
-    
-    # Converti date e time in stringhe
-    for missione in missioni:
-        if missione['DataMissione']:
-            missione['DataMissione'] = missione['DataMissione'].strftime('%Y-%m-%d')
-        if missione['Ora']:
-            missione['Ora'] = str(missione['Ora'])
-    
+
+    if stream:
+        return stream_response(db.stream_query(query, params), stream)
+
+    if limit:
+        query += " LIMIT %s"
+        params.append(limit + 1)
+    missioni = db.fetch_query(query, params)
+
+    if limit:
+        return jsonify(paginate(missioni, limit, lambda m: [m['DataMissione'], m['Ora'], m['ID']]))
     return jsonify(missioni)
 
 @app.route('/api/missioni/<int:id>', methods=['GET'])
@@ -271,10 +452,6 @@ def get_missione(id):
     missione = db.fetch_one(query, (id,))
     
     if missione:
-        if missione['DataMissione']:
-            missione['DataMissione'] = missione['DataMissione'].strftime('%Y-%m-%d')
-        if missione['Ora']:
-            missione['Ora'] = str(missione['Ora'])
         return jsonify(missione)
     return jsonify({'error': 'Missione non trovata'}), 404
 
@@ -294,64 +471,368 @@ def get_missioni_by_stato(stato):
         ORDER BY m.DataMissione DESC, m.Ora DESC
     """
     missioni = db.fetch_query(query, (stato,))
-    
-    for missione in missioni:
-        if missione['DataMissione']:
-            missione['DataMissione'] = missione['DataMissione'].strftime('%Y-%m-%d')
-        if missione['Ora']:
-            missione['Ora'] = str(missione['Ora'])
-    
+
     return jsonify(missioni)
 
+@app.route('/api/missioni/<int:id>/stato', methods=['PUT'])
+@auth.richiede_ruolo(auth.RUOLO_ADMIN, auth.RUOLO_OPERATORE)
+def update_stato_missione(id):
+    """Aggiorna lo stato di una missione"""
+    data = request.get_json(silent=True) or {}
+    nuovo_stato = data.get('Stato')
+    if nuovo_stato not in ('programmata', 'in corso', 'completata', 'annullata'):
+        return jsonify({'error': 'Stato non valido'}), 400
+
+    db = get_db()
+    with db.transaction():
+        rollup.aggiorna_stato(db, id, nuovo_stato)
+        aggiornate = db.execute_rowcount("UPDATE Missioni SET Stato = %s WHERE ID = %s", (nuovo_stato, id))
+
+    if not aggiornate:
+        return jsonify({'error': 'Missione non trovata'}), 404
+    cache.invalidate('missioni')
+    rotte.invalida(id)
+
+    return jsonify({
+        'success': True,
+        'message': 'Stato missione aggiornato'
+    })
+
+# Batteria minima (%) per assegnare un drone a una nuova missione
+DISPATCH_BATTERIA_MIN = int(os.getenv('DISPATCH_BATTERIA_MIN', 30))
+
+@app.route('/api/missioni/assign', methods=['POST'])
+@auth.richiede_ruolo(auth.RUOLO_ADMIN, auth.RUOLO_OPERATORE)
+def assign_missioni():
+    """
+    Assegna uno o più ordini al drone disponibile più vicino al punto di prelievo
+    e crea le missioni corrispondenti (stato 'programmata').
+    Accetta un ordine o {"ordini": [...], "batteria_min": 30, "dry_run": false};
+    se l'ordine contiene Tipo, IndirizzoDestinazione e ID_Utente viene creato anche l'Ordine.
+    """
+    data = request.get_json(silent=True)
+    if isinstance(data, dict) and 'ordini' in data:
+        richieste = data['ordini']
+    else:
+        richieste = [data]
+        data = {}
+    if not isinstance(richieste, list) or not richieste or not all(isinstance(r, dict) for r in richieste):
+        return jsonify({'error': 'Atteso un ordine o un array di ordini'}), 400
+
+    campi = ('PesoTotale', 'LatPrelievo', 'LongPrelievo', 'LatConsegna', 'LongConsegna')
+    for i, richiesta in enumerate(richieste):
+        try:
+            for campo in campi:
+                float(richiesta[campo])
+        except (KeyError, TypeError, ValueError):
+            return jsonify({'error': f"Ordine {i}: campi obbligatori {', '.join(campi)}"}), 400
+        for campo in ('IdPilota', 'ID_Utente'):
+            valore = richiesta.get(campo)
+            if valore is not None and (not isinstance(valore, int) or isinstance(valore, bool)):
+                return jsonify({'error': f"Ordine {i}: {campo} deve essere un intero", 'indice': i}), 400
+
+    try:
+        batteria_min = int(data.get('batteria_min', DISPATCH_BATTERIA_MIN))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'batteria_min deve essere un intero'}), 400
+    db = get_db()
+
+    # Piloti e utenti indicati devono esistere: un errore di chiave esterna annullerebbe tutto il blocco
+    for campo, tabella in (('IdPilota', 'Pilota'), ('ID_Utente', 'Utente')):
+        richiesti = {r[campo] for r in richieste if r.get(campo)}
+        if not richiesti:
+            continue
+        esistenti = {r['ID'] for r in db.fetch_query(
+            f"SELECT ID FROM {tabella} WHERE ID IN ({', '.join(['%s'] * len(richiesti))})",
+            tuple(richiesti)) or []}
+        for i, richiesta in enumerate(richieste):
+            if richiesta.get(campo) and richiesta[campo] not in esistenti:
+                return jsonify({'error': f"Ordine {i}: {campo} {richiesta[campo]} inesistente", 'indice': i}), 400
+
+    # Droni con batteria sufficiente e senza missioni programmate o in corso
+    droni = db.fetch_query("""
+        SELECT d.ID, d.Capacita, d.Batteria
+        FROM Drone d
+        WHERE d.Batteria >= %s
+          AND NOT EXISTS (
+              SELECT 1 FROM Missioni m
+              WHERE m.IdDrone = d.ID AND m.Stato IN ('programmata', 'in corso')
+          )
+    """, (batteria_min,))
+    ultime = posizioni.get_droni([d['ID'] for d in droni])
+    # I droni senza una posizione nota non possono essere confrontati per distanza
+    candidati = [
+        {**d, 'Latitudine': float(ultime[d['ID']]['Latitudine']),
+         'Longitudine': float(ultime[d['ID']]['Longitudine'])}
+        for d in droni if d['ID'] in ultime
+    ]
+    assegnati = dispatcher.assegna(richieste, candidati)
+
+    risultati = []
+    non_assegnati = [i for i in range(len(richieste)) if i not in assegnati]
+    if data.get('dry_run'):
+        for i, (id_drone, distanza) in sorted(assegnati.items()):
+            risultati.append({'indice': i, 'ID_Drone': id_drone, 'distanza_km': round(distanza / 1000, 3)})
+        return jsonify({'assegnazioni': risultati, 'non_assegnati': non_assegnati})
+
+    # Piloti in ordine di carico (missioni programmate o in corso), assegnati a rotazione
+    piloti = [p['ID'] for p in db.fetch_query("""
+        SELECT p.ID, COUNT(m.ID) as Attive
+        FROM Pilota p
+        LEFT JOIN Missioni m ON m.IdPilota = p.ID AND m.Stato IN ('programmata', 'in corso')
+        GROUP BY p.ID
+        ORDER BY Attive, p.ID
+    """)]
+    if not piloti and any('IdPilota' not in r for r in richieste):
+        return jsonify({'error': 'Nessun pilota disponibile'}), 400
+
+    adesso = datetime.now()
+    # L'INSERT è condizionale: un drone occupato nel frattempo da un'altra richiesta viene scartato
+    insert_missione = """
+        INSERT INTO Missioni
+            (DataMissione, Ora, LatPrelievo, LongPrelievo, LatConsegna, LongConsegna, IdDrone, IdPilota, Stato)
+        SELECT %s, %s, %s, %s, %s, %s, d.ID, %s, 'programmata'
+        FROM Drone d
+        WHERE d.ID = %s
+          AND NOT EXISTS (
+              SELECT 1 FROM Missioni m
+              WHERE m.IdDrone = d.ID AND m.Stato IN ('programmata', 'in corso')
+          )
+    """
+    insert_ordine = """
+        INSERT INTO Ordine (Tipo, PesoTotale, Orario, IndirizzoDestinazione, ID_Missione, ID_Utente)
+        VALUES (%s, %s, %s, %s, %s, %s)
+    """
+    i = None
+    try:
+        with db.transaction():
+            for n, (i, (id_drone, distanza)) in enumerate(sorted(assegnati.items())):
+                richiesta = richieste[i]
+                id_pilota = richiesta.get('IdPilota') or piloti[n % len(piloti)]
+                id_missione = db.execute_query(insert_missione, (
+                    adesso.date(), adesso.time(),
+                    richiesta['LatPrelievo'], richiesta['LongPrelievo'],
+                    richiesta['LatConsegna'], richiesta['LongConsegna'],
+                    id_pilota, id_drone
+                ))
+                if not id_missione:
+                    non_assegnati.append(i)
+                    continue
+                rollup.registra_missione(db, id_drone, id_pilota, adesso.date(), 'programmata')
+
+                risultato = {
+                    'indice': i,
+                    'ID_Missione': id_missione,
+                    'ID_Drone': id_drone,
+                    'IdPilota': id_pilota,
+                    'distanza_km': round(distanza / 1000, 3)
+                }
+                if all(richiesta.get(c) for c in ('Tipo', 'IndirizzoDestinazione', 'ID_Utente')):
+                    risultato['ID_Ordine'] = db.execute_query(insert_ordine, (
+                        richiesta['Tipo'], richiesta['PesoTotale'], adesso,
+                        richiesta['IndirizzoDestinazione'], id_missione, richiesta['ID_Utente']
+                    ))
+                    domanda.registra_ordine(
+                        db, adesso, richiesta['Tipo'],
+                        richiesta['LatConsegna'], richiesta['LongConsegna'], richiesta['PesoTotale']
+                    )
+                risultati.append(risultato)
+    except Error as e:
+        # Ad esempio un pilota o un utente eliminati nel frattempo: nessuna missione del blocco viene creata
+        return jsonify({'error': f"Ordine {i}: {e.msg}", 'indice': i}), 409
+
+    if risultati:
+        cache.invalidate('missioni', 'ordini')
+
+    return jsonify({
+        'assegnazioni': risultati,
+        'non_assegnati': sorted(non_assegnati)
+    }), 201 if risultati else 200
+
 # ============================================
 # ENDPOINTS TRACCE
 # ============================================
 
 @app.route('/api/tracce/missione/<int:id_missione>', methods=['GET'])
+@condizionale('tracce', lambda id_missione: segnale_tracce(get_db(), id_missione))
 def get_tracce_missione(id_missione):
-    """Restituisce tutte le tracce di una missione"""
+    """
+    Restituisce le tracce di una missione.
+    Parametri opzionali: `since` (solo punti successivi), `tolerance` (metri) e `max_points`
+    per semplificare il percorso, `format=polyline` per l'output compatto Encoded Polyline.
+    """
+    since = request.args.get('since')
+    tolerance = request.args.get('tolerance', type=float)
+    max_points = request.args.get('max_points', type=int)
+    formato = request.args.get('format')
+
+    if since is not None:
+        since = parse_timestamp(since)
+        if since is None:
+            return jsonify({'error': 'Parametro since non valido'}), 400
+    if (tolerance is not None and tolerance < 0) or (max_points is not None and max_points < 2):
+        return jsonify({'error': 'Parametri di semplificazione non validi'}), 400
+
     db = get_db()
     query = """
         SELECT * FROM Traccia 
         WHERE ID_Missione = %s 
-        ORDER BY TIMESTAMP ASC
     """
-    tracce = db.fetch_query(query, (id_missione,))
-    
-    # Converti timestamp in stringhe
-    for traccia in tracce:
-        if traccia['TIMESTAMP']:
-            traccia['TIMESTAMP'] = traccia['TIMESTAMP'].strftime('%Y-%m-%d %H:%M:%S')
-    
+    params = [id_missione]
+    if since:
+        query += " AND TIMESTAMP > %s"
+        params.append(since)
+    query += " ORDER BY TIMESTAMP ASC"
+    tracce = db.fetch_query(query, params)
+
+    # Semplificazione del percorso lato server (Douglas-Peucker)
+    if tracce and (tolerance is not None or max_points is not None):
+        keep = simplify_mask(
+            [t['Latitudine'] for t in tracce],
+            [t['Longitudine'] for t in tracce],
+            tolerance=tolerance,
+            max_points=max_points
+        )
+        tracce = [t for t, k in zip(tracce, keep) if k]
+
+    if formato == 'polyline':
+        return jsonify({
+            'polyline': encode_polyline(
+                [t['Latitudine'] for t in tracce],
+                [t['Longitudine'] for t in tracce]
+            ),
+            'punti': len(tracce),
+            'inizio': tracce[0]['TIMESTAMP'] if tracce else None,
+            'fine': tracce[-1]['TIMESTAMP'] if tracce else None
+        })
+
     return jsonify(tracce)
 
 @app.route('/api/tracce/ultima/<int:id_missione>', methods=['GET'])
 def get_ultima_traccia(id_missione):
     """Restituisce l'ultima posizione di un drone per una missione"""
-    db = get_db()
-    query = """
-        SELECT * FROM Traccia 
-        WHERE ID_Missione = %s 
-        ORDER BY TIMESTAMP DESC 
-        LIMIT 1
-    """
-    traccia = db.fetch_one(query, (id_missione,))
-    
+    traccia = posizioni.get_missione(id_missione)
+
+    if traccia is None:
+        # Missione non ancora presente nell'indice: lettura dal database
+        db = get_db()
+        traccia = db.fetch_one(QUERY_ULTIMA, (id_missione,))
+        if traccia:
+            posizioni.update([traccia])
+
     if traccia:
-        if traccia['TIMESTAMP']:
-            traccia['TIMESTAMP'] = traccia['TIMESTAMP'].strftime('%Y-%m-%d %H:%M:%S')
         return jsonify(traccia)
     return jsonify({'error': 'Nessuna traccia trovata'}), 404
 
+@app.route('/api/tracce/posizioni', methods=['GET'])
+def get_posizioni_flotta():
+    """Restituisce la posizione attuale dei droni di tutte le missioni in corso"""
+    db = get_db()
+    query = """
+        SELECT m.ID as ID_Missione, m.IdDrone as ID_Drone, d.Modello as DroneModello
+        FROM Missioni m
+        JOIN Drone d ON m.IdDrone = d.ID
+        WHERE m.Stato = 'in corso'
+    """
+    missioni = db.fetch_query(query)
+    ultime = posizioni.get_missioni([m['ID_Missione'] for m in missioni])
+
+    risultati = []
+    for missione in missioni:
+        traccia = ultime.get(missione['ID_Missione'])
+        if traccia is None:
+            continue
+        risultati.append({
+            'ID_Missione': missione['ID_Missione'],
+            'ID_Drone': missione['ID_Drone'],
+            'DroneModello': missione['DroneModello'],
+            'Latitudine': traccia['Latitudine'],
+            'Longitudine': traccia['Longitudine'],
+            'TIMESTAMP': traccia['TIMESTAMP']
+        })
+
+    return jsonify(risultati)
+
+@app.route('/api/tracce/stream/<int:id_missione>', methods=['GET'])
+def stream_tracce(id_missione):
+    """
+    Stream Server-Sent Events con le nuove posizioni di una missione.
+    Invia solo le tracce successive a `since` (o all'header Last-Event-ID in caso di riconnessione).
+    """
+    since = (parse_timestamp(request.headers.get('Last-Event-ID'))
+             or parse_timestamp(request.args.get('since')))
+    if not stream_live.acquire(blocking=False):
+        return (jsonify({'error': 'Troppi stream live aperti, riprovare più tardi'}), 503,
+                {'Retry-After': str(LIVE_RETRY_AFTER)})
+    response = Response(
+        live.stream(id_missione, since),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+    # Chiamato alla chiusura della risposta anche se il generatore non è mai partito
+    response.call_on_close(stream_live.release)
+    return response
+
+@app.route('/api/tracce/batch', methods=['POST'])
+@auth.richiede_ruolo(auth.RUOLO_ADMIN, auth.RUOLO_OPERATORE)
+def add_tracce_batch():
+    """Riceve un blocco di posizioni GPS e le accoda per l'inserimento multi-riga"""
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        data = data.get('tracce')
+    if not isinstance(data, list) or not data:
+        return jsonify({'error': 'Atteso un array di tracce'}), 400
+
+    try:
+        tracce = [parse_traccia(item) for item in data]
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        accettate = telemetria.add(tracce)
+    except OverflowError:
+        return jsonify({'error': 'Coda telemetria piena, riprovare più tardi'}), 503
+    except ConnectionError:
+        return jsonify({'error': 'Database non disponibile'}), 503
+
+    return jsonify({
+        'success': True,
+        'ricevute': len(tracce),
+        'accettate': accettate,
+        'duplicate': len(tracce) - accettate
+    }), 202
+
+@app.route('/api/tracce/batch/metrics', methods=['GET'])
+def get_tracce_batch_metrics():
+    """Restituisce le metriche della coda di ingest (profondità e tempi di flush)"""
+    return jsonify(telemetria.metrics())
+
 # ============================================
 # ENDPOINTS ORDINI
 # ============================================
 
 @app.route('/api/ordini', methods=['GET'])
+@auth.richiede_ruolo(auth.RUOLO_ADMIN, auth.RUOLO_OPERATORE)
 def get_ordini():
-    """Restituisce tutti gli ordini"""
+    """
+    Restituisce gli ordini con nome e mail dei clienti (solo ad amministratori e operatori).
+    Paginazione keyset opzionale su (Orario, ID) con limit/after, streaming con stream=ndjson|json.
+    """
+    try:
+        limit, after = get_page_args(2)
+        stream = get_stream_format()
+    except ValueError:
+        return jsonify({'error': 'Parametri di paginazione non validi'}), 400
+
     db = get_db()
-    query = """
+    where = ""
+    params = []
+    if after:
+        orario, id_ordine = after
+        where = "WHERE o.Orario < %s OR (o.Orario = %s AND o.ID < %s)"
+        params = [orario, orario, id_ordine]
+
+    query = f"""
         SELECT o.*, 
                u.Nome as ClienteNome, 
                u.Mail as ClienteMail,
@@ -359,20 +840,77 @@ def get_ordini():
         FROM Ordine o
         JOIN Utente u ON o.ID_Utente = u.ID
         JOIN Missioni m ON o.ID_Missione = m.ID
-        ORDER BY o.Orario DESC
+        {where}
+        ORDER BY o.Orario DESC, o.ID DESC
     """
-    ordini = db.fetch_query(query)
-    
-    for ordine in ordini:
-        if ordine['Orario']:
-            ordine['Orario'] = ordine['Orario'].strftime('%Y-%m-%d %H:%M:%S')
-    
+
+    if stream:
+        return stream_response(db.stream_query(query, params), stream)
+
+    if limit:
+        query += " LIMIT %s"
+        params.append(limit + 1)
+    ordini = db.fetch_query(query, params)
+
+    if limit:
+        return jsonify(paginate(ordini, limit, lambda o: [o['Orario'], o['ID']]))
     return jsonify(ordini)
 
+def raggruppa_prodotti(rows):
+    """
+    Raggruppa le righe di un JOIN Ordine/Contiene/Prodotto in ordini con la lista `Prodotti`,
+    mantenendo l'ordinamento della query.
+    """
+    ordini = {}
+    for row in rows:
+        prodotto = {
+            'ID': row.pop('ProdottoID'),
+            'nome': row.pop('nome'),
+            'peso': row.pop('peso'),
+            'categoria': row.pop('categoria'),
+            'Quantita': row.pop('Quantita')
+        }
+        ordine = ordini.get(row['ID'])
+        if ordine is None:
+            ordine = ordini[row['ID']] = row
+            ordine['Prodotti'] = []
+        if prodotto['ID'] is not None:
+            ordine['Prodotti'].append(prodotto)
+    return list(ordini.values())
+
 @app.route('/api/ordini/utente/<int:id_utente>', methods=['GET'])
+@auth.richiede_ruolo()
 def get_ordini_utente(id_utente):
-    """Restituisce gli ordini di un utente specifico"""
+    """
+    Restituisce gli ordini di un utente specifico (solo all'utente stesso o a un amministratore).
+    Con `include=prodotti` restituisce anche i prodotti di ogni ordine, con un'unica query.
+    """
+    if not auth.puo_accedere(id_utente):
+        return jsonify({'error': 'Operazione non consentita'}), 403
     db = get_db()
+
+    if request.args.get('include') == 'prodotti':
+        query = """
+            SELECT o.*, 
+                   u.Nome as ClienteNome, 
+                   u.Mail as ClienteMail,
+                   m.Stato as StatoMissione,
+                   m.ID as MissioneID,
+                   m.DataMissione,
+                   m.Ora as OraMissione,
+                   p.ID as ProdottoID, p.nome, p.peso, p.categoria, c.Quantita
+            FROM Ordine o
+            JOIN Utente u ON o.ID_Utente = u.ID
+            JOIN Missioni m ON o.ID_Missione = m.ID
+            LEFT JOIN Contiene c ON c.ID_Ordine = o.ID
+            LEFT JOIN Prodotto p ON p.ID = c.ID_Prodotto
+            WHERE o.ID_Utente = %s
+            ORDER BY o.Orario DESC, o.ID DESC
+        """
+        ordini = raggruppa_prodotti(db.fetch_query(query, (id_utente,)))
+
+        return jsonify(ordini)
+
     query = """
         SELECT o.*, 
                m.Stato as StatoMissione,
@@ -384,66 +922,99 @@ def get_ordini_utente(id_utente):
         ORDER BY o.Orario DESC
     """
     ordini = db.fetch_query(query, (id_utente,))
-    
-    for ordine in ordini:
-        if ordine['Orario']:
-            ordine['Orario'] = ordine['Orario'].strftime('%Y-%m-%d %H:%M:%S')
-        if ordine['DataMissione']:
-            ordine['DataMissione'] = ordine['DataMissione'].strftime('%Y-%m-%d')
-        if ordine['OraMissione']:
-            ordine['OraMissione'] = str(ordine['OraMissione'])
-    
+
     return jsonify(ordini)
 
+# Ordine e prodotti in un'unica query
+QUERY_ORDINE = """
+    SELECT o.*, 
+           u.Nome as ClienteNome, 
+           u.Mail as ClienteMail,
+           m.Stato as StatoMissione,
+           m.ID as MissioneID,
+           p.ID as ProdottoID, p.nome, p.peso, p.categoria, c.Quantita
+    FROM Ordine o
+    JOIN Utente u ON o.ID_Utente = u.ID
+    JOIN Missioni m ON o.ID_Missione = m.ID
+    LEFT JOIN Contiene c ON c.ID_Ordine = o.ID
+    LEFT JOIN Prodotto p ON p.ID = c.ID_Prodotto
+    WHERE o.ID = %s
+"""
+
 @app.route('/api/ordini/<int:id>', methods=['GET'])
+@auth.richiede_ruolo()
 def get_ordine(id):
-    """Restituisce un ordine specifico con i prodotti"""
+    """Restituisce un ordine specifico con i prodotti (solo al cliente che l'ha fatto o a un amministratore)"""
     db = get_db()
+    ordini = raggruppa_prodotti(db.fetch_query(QUERY_ORDINE, (id,)) or [])
     
-    # Query per l'ordine
-    query_ordine = """
-        SELECT o.*, 
-               u.Nome as ClienteNome, 
-               u.Mail as ClienteMail,
-               m.Stato as StatoMissione,
-               m.ID as MissioneID
-        FROM Ordine o
-        JOIN Utente u ON o.ID_Utente = u.ID
-        JOIN Missioni m ON o.ID_Missione = m.ID
-        WHERE o.ID = %s
-    """
-    ordine = db.fetch_one(query_ordine, (id,))
-    
-    if ordine:
-        if ordine['Orario']:
-            ordine['Orario'] = ordine['Orario'].strftime('%Y-%m-%d %H:%M:%S')
-        
-        # Query per i prodotti dell'ordine
-        query_prodotti = """
-            SELECT p.*, c.Quantita
-            FROM Prodotto p
-            JOIN Contiene c ON p.ID = c.ID_Prodotto
-            WHERE c.ID_Ordine = %s
-        """
-        prodotti = db.fetch_query(query_prodotti, (id,))
-        ordine['Prodotti'] = prodotti
-        return jsonify(ordine)
-    
-    return jsonify({'error': 'Ordine non trovato'}), 404
+    if not ordini:
+        return jsonify({'error': 'Ordine non trovato'}), 404
+    if not auth.puo_accedere(ordini[0]['ID_Utente']):
+        return jsonify({'error': 'Operazione non consentita'}), 403
+    return jsonify(ordini[0])
 
 # ============================================
 # ENDPOINTS PRODOTTI
 # ============================================
 
 @app.route('/api/prodotti', methods=['GET'])
+@condizionale('catalogo', lambda: versione_tabelle(get_db(), 'Prodotto'))
 def get_prodotti():
-    """Restituisce tutti i prodotti"""
+    """Restituisce tutti i prodotti (paginazione opzionale con limit/after, streaming con stream=ndjson|json)"""
+    try:
+        limit, after = get_page_args(1)
+        stream = get_stream_format()
+    except ValueError:
+        return jsonify({'error': 'Parametri di paginazione non validi'}), 400
+
     db = get_db()
     query = "SELECT * FROM Prodotto"
+    params = []
+    if after:
+        query += " WHERE ID > %s"
+        params.append(after[0])
+    query += " ORDER BY ID"
+
+    if stream:
+        return stream_response(db.stream_query(query, params), stream)
+
+    if limit:
+        query += " LIMIT %s"
+        params.append(limit + 1)
+        prodotti = db.fetch_query(query, params)
+        return jsonify(paginate(prodotti, limit, lambda p: [p['ID']]))
+
     prodotti = db.fetch_query(query)
     return jsonify(prodotti)
 
+@app.route('/api/prodotti/search', methods=['GET'])
+@condizionale('catalogo', lambda: catalogo.versione())
+def search_prodotti():
+    """
+    Ricerca nel catalogo dall'indice in memoria: `q` (parole del nome, l'ultima anche come prefisso,
+    senza distinzione di maiuscole e accenti), `categoria`, `max_peso`, paginazione con limit/after.
+    Restituisce anche il totale, i conteggi per categoria e i completamenti dell'ultima parola.
+    """
+    try:
+        limit, after = get_page_args(1)
+        max_peso = float(request.args['max_peso']) if request.args.get('max_peso') else None
+    except ValueError:
+        return jsonify({'error': 'Parametri non validi'}), 400
+    # Il cursore viene confrontato con gli ID dell'indice: deve essere un intero
+    if after and (not isinstance(after[0], int) or isinstance(after[0], bool)):
+        return jsonify({'error': 'Cursore non valido'}), 400
+
+    limit = limit or LIMITE_PAGINA
+    prodotti, totale, facet, suggerimenti = catalogo.cerca(
+        request.args.get('q', ''), request.args.get('categoria') or None, max_peso,
+        limit, after[0] if after else None)
+    risultato = paginate(prodotti, limit, lambda p: [p['ID']])
+    risultato.update({'totale': totale, 'facet': {'categoria': facet}, 'suggerimenti': suggerimenti})
+    return jsonify(risultato)
+
 @app.route('/api/prodotti/categoria/<categoria>', methods=['GET'])
+@condizionale('catalogo', lambda categoria: versione_tabelle(get_db(), 'Prodotto'))
 def get_prodotti_by_categoria(categoria):
     """Restituisce i prodotti di una categoria specifica"""
     db = get_db()
@@ -456,6 +1027,7 @@ def get_prodotti_by_categoria(categoria):
 # ============================================
 
 @app.route('/api/utenti', methods=['GET'])
+@auth.richiede_ruolo(auth.RUOLO_ADMIN)
 def get_utenti():
     """Restituisce tutti gli utenti (senza password)"""
     db = get_db()
@@ -465,37 +1037,44 @@ def get_utenti():
 
 @app.route('/api/login', methods=['POST'])
 def login():
-    """Endpoint per il login utente"""
-    data = request.get_json()
-    
+    """
+    Endpoint per il login utente: verifica la password sul pool dell'hash e restituisce
+    un token firmato (header `Authorization: Bearer <token>`) con ID e ruolo.
+    """
+    data = request.get_json(silent=True) or {}
+    mail, password = data.get('Mail'), data.get('Password')
+    if not isinstance(mail, str) or not isinstance(password, str):
+        return jsonify({'error': 'Mail e Password sono obbligatori'}), 400
+
     db = get_db()
-    query = "SELECT * FROM Utente WHERE Mail = %s AND Password = %s"
-    utente = db.fetch_one(query, (data['Mail'], data['Password']))
-    
-    if utente:
-        # Salva l'utente nella sessione
-        session['user_id'] = utente['ID']
-        session['user_role'] = utente['Ruolo']
-        
+    righe = db.fetch_query(auth.QUERY_UTENTE, (mail,))
+    if righe is None:
+        print(auth.ERRORE_QUERY_UTENTE)
+        return jsonify({'error': 'Errore durante il login'}), 500
+    utente = righe[0] if righe else None
+    try:
+        valida, nuovo_hash = hash_pool.submit(auth.verifica, utente, password).result()
+    except OverflowError:
+        return jsonify({'error': 'Troppi login in corso, riprovare'}), 503
+
+    if not valida:
         return jsonify({
-            'success': True,
-            'user': {
-                'ID': utente['ID'],
-                'Nome': utente['Nome'],
-                'Mail': utente['Mail'],
-                'Ruolo': utente['Ruolo']
-            }
-        })
-    
-    return jsonify({
-        'success': False,
-        'message': 'Credenziali non valide'
-    }), 401
+            'success': False,
+            'message': 'Credenziali non valide'
+        }), 401
+
+    # Password in chiaro o con un hash superato: sostituita al primo login riuscito
+    if nuovo_hash:
+        db.execute_rowcount(auth.QUERY_REHASH, (nuovo_hash, utente['ID'], utente['Password']))
+
+    try:
+        return jsonify(auth.risposta_login(app.secret_key, utente))
+    except auth.ChiaveNonConfigurata:
+        return jsonify({'error': 'Autenticazione non configurata sul server'}), 503
 
 @app.route('/api/logout', methods=['POST'])
 def logout():
-    """Endpoint per il logout utente"""
-    session.clear()
+    """Endpoint per il logout utente: i token sono senza stato, il client scarta il proprio"""
     return jsonify({'success': True, 'message': 'Logout effettuato'})
 
 # ============================================
@@ -503,33 +1082,52 @@ def logout():
 # ============================================
 
 @app.route('/api/missioni/<int:id>/valutazione', methods=['POST'])
+@auth.richiede_ruolo()
 def add_valutazione(id):
-    """Aggiunge una valutazione a una missione completata"""
-    data = request.get_json()
+    """
+    Aggiunge una valutazione a una missione completata, con il sentiment del commento.
+    Solo il cliente che ha ordinato la consegna (o un amministratore) può valutarla.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Atteso un oggetto JSON'}), 400
+    valutazione = data.get('Valutazione')
+    commento = data.get('Commento') or ''
+    # bool è una sottoclasse di int: true/false non sono punteggi
+    if not isinstance(valutazione, int) or isinstance(valutazione, bool) or not 1 <= valutazione <= 10:
+        return jsonify({'error': 'Valutazione deve essere un intero tra 1 e 10'}), 400
+    if not isinstance(commento, str) or len(commento) > 255:
+        return jsonify({'error': 'Commento deve essere un testo di al massimo 255 caratteri'}), 400
     
     db = get_db()
+    if g.utente['ruolo'] != auth.RUOLO_ADMIN and not db.fetch_one(
+            "SELECT 1 FROM Ordine WHERE ID_Missione = %s AND ID_Utente = %s LIMIT 1", (id, g.utente['id'])):
+        if not db.fetch_one("SELECT ID FROM Missioni WHERE ID = %s", (id,)):
+            return jsonify({'error': 'Missione non trovata'}), 404
+        return jsonify({'error': 'Puoi valutare solo le consegne dei tuoi ordini'}), 403
     
-    # Verifica che la missione sia completata
-    check_query = "SELECT Stato FROM Missioni WHERE ID = %s"
-    missione = db.fetch_one(check_query, (id,))
-    
-    if not missione:
-        return jsonify({'error': 'Missione non trovata'}), 404
-    
-    if missione['Stato'] != 'completata':
-        return jsonify({'error': 'Puoi valutare solo missioni completate'}), 400
-    
-    # Aggiorna la valutazione
+    # Aggiorna la valutazione solo se la missione è completata (nessuna SELECT di controllo preventiva)
     update_query = """
         UPDATE Missioni 
-        SET Valutazione = %s, Commento = %s 
-        WHERE ID = %s
+        SET Valutazione = %s, Commento = %s, Sentiment = %s 
+        WHERE ID = %s AND Stato = 'completata'
     """
-    db.execute_query(update_query, (
-        data.get('Valutazione'),
-        data.get('Commento', ''),
-        id
-    ))
+    with db.transaction():
+        rollup.aggiorna_valutazione(db, id, valutazione)
+        aggiornate = db.execute_rowcount(update_query, (
+            valutazione,
+            commento,
+            sentiment.punteggio(commento),
+            id
+        ))
+    
+    if not aggiornate:
+        missione = db.fetch_one("SELECT Stato FROM Missioni WHERE ID = %s", (id,))
+        if not missione:
+            return jsonify({'error': 'Missione non trovata'}), 404
+        return jsonify({'error': 'Puoi valutare solo missioni completate'}), 400
+    
+    cache.invalidate('missioni')
     
     return jsonify({
         'success': True,
@@ -551,212 +1149,329 @@ def get_valutazione(id):
 # ENDPOINTS STATISTICHE
 # ============================================
 
+# Query delle statistiche, condivise con le route asincrone (backend/asgi.py)
+QUERY_STATISTICHE_MISSIONI = """
+    SELECT 
+        Stato,
+        COUNT(*) as Totale,
+        AVG(Valutazione) as MediaValutazione
+    FROM Missioni
+    GROUP BY Stato
+"""
+
+QUERY_STATISTICHE_DRONI = """
+    SELECT 
+        d.ID,
+        d.Modello,
+        d.Batteria,
+        COALESCE(s.NumMissioni, 0) as NumeroMissioni,
+        s.SommaValutazioni / NULLIF(s.NumValutazioni, 0) as MediaValutazione
+    FROM Drone d
+    LEFT JOIN StatDrone s ON d.ID = s.ID_Drone
+    ORDER BY NumeroMissioni DESC
+"""
+
+QUERY_STATISTICHE_PILOTI = """
+    SELECT 
+        p.ID,
+        p.Nome,
+        p.Cognome,
+        COALESCE(s.NumMissioni, 0) as NumeroMissioni,
+        s.SommaValutazioni / NULLIF(s.NumValutazioni, 0) as MediaValutazione,
+        COALESCE(s.MissioniCompletate, 0) as MissioniCompletate
+    FROM Pilota p
+    LEFT JOIN StatPilota s ON p.ID = s.ID_Pilota
+    ORDER BY MediaValutazione DESC
+"""
+
+QUERY_REPORT_CONSEGNE = """
+    SELECT 
+        o.Tipo,
+        COUNT(*) as Totale,
+        AVG(o.PesoTotale) as PesoMedio
+    FROM Ordine o
+    GROUP BY o.Tipo
+"""
+
 @app.route('/api/statistiche/missioni', methods=['GET'])
+@cache.cached('missioni')
 def get_statistiche_missioni():
     """Restituisce statistiche sulle missioni"""
     db = get_db()
-    
-    query = """
-        SELECT 
-            Stato,
-            COUNT(*) as Totale,
-            AVG(Valutazione) as MediaValutazione
-        FROM Missioni
-        GROUP BY Stato
-    """
-    stats = db.fetch_query(query)
+    stats = db.fetch_query(QUERY_STATISTICHE_MISSIONI)
     
     return jsonify(stats)
 
 @app.route('/api/statistiche/droni', methods=['GET'])
+@cache.cached('droni', 'missioni')
 def get_statistiche_droni():
     """Restituisce statistiche sui droni"""
     db = get_db()
-    
-    query = """
-        SELECT 
-            d.ID,
-            d.Modello,
-            d.Batteria,
-            COUNT(m.ID) as NumeroMissioni,
-            AVG(m.Valutazione) as MediaValutazione
-        FROM Drone d
-        LEFT JOIN Missioni m ON d.ID = m.IdDrone
-        GROUP BY d.ID, d.Modello, d.Batteria
-        ORDER BY NumeroMissioni DESC
-    """
-    stats = db.fetch_query(query)
+    stats = db.fetch_query(QUERY_STATISTICHE_DRONI)
     
     return jsonify(stats)
 
 @app.route('/api/statistiche/piloti', methods=['GET'])
+@cache.cached('piloti', 'missioni')
 def get_statistiche_piloti():
     """Restituisce statistiche sui piloti (top performers)"""
     db = get_db()
-    
-    query = """
-        SELECT 
-            p.ID,
-            p.Nome,
-            p.Cognome,
-            COUNT(m.ID) as NumeroMissioni,
-            AVG(m.Valutazione) as MediaValutazione,
-            SUM(CASE WHEN m.Stato = 'completata' THEN 1 ELSE 0 END) as MissioniCompletate
-        FROM Pilota p
-        LEFT JOIN Missioni m ON p.ID = m.IdPilota
-        GROUP BY p.ID, p.Nome, p.Cognome
-        ORDER BY MediaValutazione DESC
-    """
-    stats = db.fetch_query(query)
+    stats = db.fetch_query(QUERY_STATISTICHE_PILOTI)
     
     return jsonify(stats)
 
 @app.route('/api/report/consegne', methods=['GET'])
+@cache.cached('ordini')
 def get_report_consegne():
     """Report sulle consegne per tipo"""
     db = get_db()
-    
-    query = """
-        SELECT 
-            o.Tipo,
-            COUNT(*) as Totale,
-            AVG(o.PesoTotale) as PesoMedio
-        FROM Ordine o
-        GROUP BY o.Tipo
-    """
-    report = db.fetch_query(query)
-    
+    report = db.fetch_query(QUERY_REPORT_CONSEGNE)
+
     return jsonify(report)
 
+# ============================================
+# DASHBOARD AMMINISTRATIVA
+# ============================================
+
+# Droni più impiegati, con il totale della flotta calcolato nella stessa query
+QUERY_DASHBOARD_DRONI = """
+    SELECT
+        d.ID,
+        d.Modello,
+        d.Batteria,
+        COALESCE(s.NumMissioni, 0) as NumeroMissioni,
+        COUNT(*) OVER () as TotaleDroni
+    FROM Drone d
+    LEFT JOIN StatDrone s ON d.ID = s.ID_Drone
+    ORDER BY NumeroMissioni DESC
+    LIMIT 5
+"""
+
+QUERY_DASHBOARD_PILOTI = """
+    SELECT
+        p.ID,
+        p.Nome,
+        p.Cognome,
+        s.NumMissioni as NumeroMissioni,
+        s.SommaValutazioni / s.NumValutazioni as MediaValutazione
+    FROM Pilota p
+    JOIN StatPilota s ON p.ID = s.ID_Pilota
+    WHERE s.NumValutazioni > 0
+    ORDER BY MediaValutazione DESC
+    LIMIT 5
+"""
+
+QUERY_DASHBOARD_RECENTI = """
+    SELECT m.ID, m.DataMissione, m.Stato, m.Valutazione,
+           d.Modello as DroneModello,
+           p.Nome as PilotaNome,
+           p.Cognome as PilotaCognome
+    FROM Missioni m
+    JOIN Drone d ON m.IdDrone = d.ID
+    JOIN Pilota p ON m.IdPilota = p.ID
+    ORDER BY m.DataMissione DESC, m.Ora DESC, m.ID DESC
+    LIMIT 10
+"""
+
+# Nell'ordine degli argomenti di componi_dashboard
+QUERY_DASHBOARD = (
+    QUERY_STATISTICHE_MISSIONI, QUERY_DASHBOARD_DRONI, QUERY_DASHBOARD_PILOTI,
+    QUERY_REPORT_CONSEGNE, QUERY_DASHBOARD_RECENTI
+)
+
+def componi_dashboard(missioni, droni, piloti, consegne, recenti):
+    """Documento unico della dashboard a partire dai risultati delle cinque query"""
+    per_stato = {s['Stato']: s for s in missioni}
+    completate = per_stato.get('completata')
+    return {
+        'contatori': {
+            'droni': droni[0]['TotaleDroni'] if droni else 0,
+            'missioni_in_corso': per_stato['in corso']['Totale'] if 'in corso' in per_stato else 0,
+            'missioni_completate': completate['Totale'] if completate else 0,
+            'valutazione_media': completate['MediaValutazione'] if completate else None
+        },
+        'missioni': missioni,
+        'droni': [
+            {'ID': d['ID'], 'Modello': d['Modello'], 'Batteria': d['Batteria'], 'NumeroMissioni': d['NumeroMissioni']}
+            for d in droni
+        ],
+        'piloti': piloti,
+        'consegne': consegne,
+        'recenti': recenti
+    }
+
+def risposta_condizionale(response):
+    """Aggiunge l'ETag del contenuto e risponde 304 se coincide con If-None-Match"""
+    response.add_etag()
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+@cache.cached('droni', 'missioni', 'piloti', 'ordini')
+def _dashboard():
+    db = get_db()
+    risultati = [db.fetch_query(query) for query in QUERY_DASHBOARD]
+    if any(r is None for r in risultati):
+        return jsonify({'error': 'Errore nel calcolo della dashboard'}), 500
+    return jsonify(componi_dashboard(*risultati))
+
+@app.route('/api/dashboard', methods=['GET'])
+def get_dashboard():
+    """
+    Contatori, statistiche, classifiche e missioni recenti della dashboard in un'unica risposta,
+    con una sola connessione. Supporta If-None-Match (304 se la dashboard non è cambiata).
+    """
+    return risposta_condizionale(_dashboard())
+
+@app.route('/api/cache/stats', methods=['GET'])
+@auth.richiede_ruolo(auth.RUOLO_ADMIN)
+def get_cache_stats():
+    """Restituisce hit/miss e dimensione della cache delle statistiche"""
+    return jsonify(cache.metrics())
+
+# ============================================
+# ENDPOINTS IMPORT / EXPORT MASSIVI
+# ============================================
+
+# Tag della cache da invalidare dopo l'import di ogni dataset
+TAG_DATASET = {
+    'droni': ('droni',),
+    'missioni': ('missioni',),
+    'ordini': ('ordini',),
+    'contiene': ('ordini',)
+}
+
+@app.route('/api/admin/export/<dataset>', methods=['GET'])
+@auth.richiede_ruolo(auth.RUOLO_ADMIN)
+def export_dataset(dataset):
+    """Esporta un dataset in streaming (`?format=ndjson|csv`), con memoria costante"""
+    fmt = request.args.get('format', 'ndjson')
+    if dataset not in bulk.DATASET:
+        return jsonify({'error': 'Dataset non trovato'}), 404
+    if fmt not in bulk.FORMATI:
+        return jsonify({'error': 'Formato non supportato'}), 400
+
+    db = get_db()
+    return Response(
+        stream_with_context(bulk.esporta(db, dataset, fmt)),
+        mimetype=bulk.FORMATI[fmt],
+        headers={'Content-Disposition': f'attachment; filename={dataset}.{fmt}'}
+    )
+
+@app.route('/api/admin/import/<dataset>', methods=['POST'])
+@auth.richiede_ruolo(auth.RUOLO_ADMIN)
+def import_dataset(dataset):
+    """
+    Importa un dataset CSV o NDJSON letto in streaming dal corpo della richiesta.
+    Parametri: format (default dal Content-Type), chunk_size, skip (ripresa dopo un errore).
+    """
+    if dataset not in bulk.DATASET:
+        return jsonify({'error': 'Dataset non trovato'}), 404
+    fmt = request.args.get('format') or ('csv' if request.mimetype == 'text/csv' else 'ndjson')
+    if fmt not in bulk.FORMATI:
+        return jsonify({'error': 'Formato non supportato'}), 400
+    try:
+        chunk_size = int(request.args.get('chunk_size', bulk.CHUNK_SIZE))
+        skip = int(request.args.get('skip', 0))
+    except ValueError:
+        return jsonify({'error': 'Parametri non validi'}), 400
+    if chunk_size < 1 or skip < 0:
+        return jsonify({'error': 'Parametri non validi'}), 400
+
+    db = get_db()
+    stream = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+    try:
+        risultato = bulk.importa(db, dataset, bulk.leggi_righe(stream, fmt), chunk_size, skip)
+    except bulk.ImportInterrotto as e:
+        return jsonify({'error': str(e), 'righe': e.righe, 'skip': e.righe}), 400
+    finally:
+        cache.invalidate(*TAG_DATASET.get(dataset, ()))
+        if dataset in ('missioni', 'tracce'):
+            rotte.svuota()
+        if dataset == 'prodotti':
+            catalogo.invalida()
+
+    return jsonify(risultato)
+
 # ============================================
 # ENDPOINTS ANALYTICS / ML
 # ============================================
 
 @app.route('/api/analytics/demand-prediction', methods=['GET'])
+@cache.cached('ordini')
 def get_demand_prediction():
-    """Previsione domanda basata su dati storici"""
-    db = get_db()
-    
-    # Calcola media ordini per settimana
-    query = """
-        SELECT 
-            COUNT(*) as TotaleOrdini,
-            COUNT(DISTINCT DATE(o.DataConsegna)) as GiorniAttivi
-        FROM Ordine o
-        WHERE o.DataConsegna IS NOT NULL
     """
-    result = db.fetch_one(query)
-    
-    if result and result['GiorniAttivi'] > 0:
-        media_giornaliera = result['TotaleOrdini'] / result['GiorniAttivi']
-        previsione_settimanale = round(media_giornaliera * 7)
-    else:
-        previsione_settimanale = 0
-    
-    return jsonify({
-        'previsione_settimanale': previsione_settimanale,
-        'media_giornaliera': round(media_giornaliera, 1) if result else 0,
-        'totale_storico': result['TotaleOrdini'] if result else 0
-    })
+    Previsione oraria degli ordini per i prossimi 7 giorni (stagionalità giorno × ora e trend),
+    con totali giornalieri e ripartizione per zona e Tipo.
+    Parametri opzionali: `settimane` di storico, `tipo`, `zona` ('CellaLat:CellaLon').
+    """
+    try:
+        settimane = int(request.args.get('settimane', domanda.SETTIMANE_STORICO))
+        zona = domanda.parse_zona(request.args['zona']) if request.args.get('zona') else None
+    except ValueError:
+        return jsonify({'error': 'Parametri non validi'}), 400
+    if not 1 <= settimane <= 104:
+        return jsonify({'error': 'settimane deve essere compreso tra 1 e 104'}), 400
+
+    db = get_db()
+    return jsonify(domanda.prevedi(db, settimane=settimane, tipo=request.args.get('tipo'), zona_filtro=zona))
 
 @app.route('/api/analytics/route-analysis', methods=['GET'])
 def get_route_analysis():
-    """Analisi percorsi e tempi medi"""
-    db = get_db()
-    
-    # Analizza tempi tra prima e ultima traccia
-    query = """
-        SELECT 
-            m.ID,
-            MIN(t.Timestamp) as InizioVolo,
-            MAX(t.Timestamp) as FineVolo,
-            COUNT(t.ID) as NumTracce
-        FROM Missioni m
-        JOIN Traccia t ON m.ID = t.IdMissione
-        WHERE m.Stato = 'completata'
-        GROUP BY m.ID
     """
-    tracce = db.fetch_query(query)
-    
-    if tracce:
-        # Calcola tempo medio in minuti (approssimativo)
-        tempo_medio = len(tracce) * 5  # Ogni traccia ~ 5 min
-    else:
-        tempo_medio = 0
-    
-    return jsonify({
-        'tempo_medio_consegna': tempo_medio,
-        'missioni_analizzate': len(tracce) if tracce else 0,
-        'tracce_totali': sum(t['NumTracce'] for t in tracce) if tracce else 0
-    })
+    Analisi dei percorsi delle missioni completate: durata, distanza, velocità e deviazione.
+    Con `dettaglio=1` include le metriche di ogni missione.
+    """
+    db = get_db()
+    missioni = rotte.analizza(db)
+
+    def media(campo):
+        valori = [m[campo] for m in missioni if m[campo] is not None]
+        return round(sum(valori) / len(valori), 2) if valori else 0
+
+    risultato = {
+        'tempo_medio_consegna': media('durata_min'),
+        'distanza_media_km': media('distanza_km'),
+        'velocita_media_kmh': media('velocita_media_kmh'),
+        'velocita_picco_kmh': max((m['velocita_picco_kmh'] for m in missioni), default=0),
+        'rapporto_deviazione_medio': media('rapporto_deviazione'),
+        'missioni_analizzate': len(missioni),
+        'tracce_totali': sum(m['tracce'] for m in missioni)
+    }
+    if request.args.get('dettaglio') == '1':
+        risultato['missioni'] = missioni
+
+    return jsonify(risultato)
 
 @app.route('/api/analytics/maintenance-prediction', methods=['GET'])
 def get_maintenance_prediction():
-    """Previsione manutenzione droni"""
-    db = get_db()
-    
-    query = """
-        SELECT 
-            d.ID,
-            d.Modello,
-            d.Batteria,
-            COUNT(m.ID) as NumMissioni
-        FROM Drone d
-        LEFT JOIN Missioni m ON d.ID = m.IdDrone
-        GROUP BY d.ID, d.Modello, d.Batteria
     """
-    droni = db.fetch_query(query)
-    
-    # Logica predittiva semplice
-    risultati = []
-    for d in droni:
-        if d['Batteria'] < 30 or d['NumMissioni'] > 50:
-            stato = 'critico'
-        elif d['Batteria'] < 50 or d['NumMissioni'] > 30:
-            stato = 'attenzione'
-        else:
-            stato = 'ok'
-        
-        risultati.append({
-            'id': d['ID'],
-            'modello': d['Modello'],
-            'batteria': d['Batteria'],
-            'missioni': d['NumMissioni'],
-            'stato': stato
-        })
-    
-    return jsonify(risultati)
+    Droni ordinati per indice di usura (ore di volo, km e missioni dall'ultimo intervento,
+    cicli della batteria), calcolato dagli accumulatori della telemetria.
+    Parametri opzionali: `stato` (ok, attenzione, critico) e `limite`.
+    """
+    stato = request.args.get('stato')
+    if stato and stato not in manutenzione.STATI:
+        return jsonify({'error': 'Stato non valido'}), 400
+    try:
+        limite = int(request.args['limite']) if request.args.get('limite') else None
+    except ValueError:
+        return jsonify({'error': 'Parametri non validi'}), 400
+
+    db = get_db()
+    return jsonify(manutenzione.classifica(db, stato=stato, limite=limite))
 
 @app.route('/api/analytics/sentiment', methods=['GET'])
+@cache.cached('missioni')
 def get_sentiment_analysis():
-    """Analisi sentiment delle valutazioni"""
-    db = get_db()
-    
-    query = """
-        SELECT Valutazione, Commento
-        FROM Missioni
-        WHERE Valutazione IS NOT NULL
     """
-    valutazioni = db.fetch_query(query)
-    
-    positivi = 0
-    neutri = 0
-    negativi = 0
-    
-    for v in valutazioni:
-        if v['Valutazione'] >= 8:
-            positivi += 1
-        elif v['Valutazione'] >= 5:
-            neutri += 1
-        else:
-            negativi += 1
-    
-    return jsonify({
-        'positivi': positivi,
-        'neutri': neutri,
-        'negativi': negativi,
-        'totale': len(valutazioni)
-    })
+    Sentiment dei commenti delle missioni valutate (positivi, neutri, negativi), dai punteggi
+    salvati con la valutazione; `in_attesa` conta i commenti non ancora analizzati dal backfill.
+    """
+    db = get_db()
+    risultato = sentiment.statistiche(db)
+    if risultato is None:
+        return jsonify({'error': 'Errore durante il calcolo del sentiment'}), 500
+    return jsonify(risultato)
 
 # ============================================
 # AVVIO SERVER
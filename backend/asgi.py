@@ -0,0 +1,330 @@
+"""
+Applicazione ASGI: route di sola lettura servite in modo asincrono, il resto
+dell'API Flask invariato.
+
+Statistiche, report, dashboard, dettaglio ordine, ultima posizione, stream SSE delle
+tracce e login non occupano un thread mentre attendono il database o nuove posizioni:
+un singolo processo regge molti più spettatori live e molte più letture
+concorrenti. Tutte le altre route sono inoltrate all'app Flask (backend.app)
+tramite un pool di thread, con la stessa cache, le stesse metriche e gli
+stessi indici in memoria.
+
+Uso:
+    uvicorn backend.asgi:app --port 5001
+    gunicorn backend.asgi:app -k uvicorn.workers.UvicornWorker
+"""
+import asyncio
+import os
+import time
+from functools import wraps
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Mount, Route
+from werkzeug.http import generate_etag, parse_etags
+from backend.app import (
+    app as flask_app, cache, hash_pool, live, metriche, posizioni, raggruppa_prodotti, componi_dashboard,
+    QUERY_STATISTICHE_MISSIONI, QUERY_STATISTICHE_DRONI, QUERY_STATISTICHE_PILOTI,
+    QUERY_REPORT_CONSEGNE, QUERY_ORDINE, QUERY_DASHBOARD
+)
+from backend import auth, compressione
+from backend.db_async import AsyncDatabase, tempo_db
+from backend.serializzazione import dumps_bytes
+from backend.live import EVENTO_ERRORE, TracceViste, format_event, parse_timestamp, QUERY_BACKLOG, QUERY_ULTIMA
+
+db = AsyncDatabase()
+
+# Thread dedicati alle richieste inoltrate all'app Flask
+WSGI_THREADS = int(os.getenv('ASGI_WSGI_THREADS', 10))
+
+# ============================================
+# SUPPORTO
+# ============================================
+
+def json_response(data, status=200, headers=None):
+    """Risposta JSON identica a quella di jsonify (stesso encoder per date e Decimal)"""
+    body = dumps_bytes(data) + b'\n'
+    return Response(body, status_code=status, media_type='application/json', headers=headers)
+
+def autentica(request, *ruoli):
+    """Come auth.richiede_ruolo: (contenuto del token, None) oppure (None, risposta 401/403)"""
+    utente, stato = auth.utente_richiesta(flask_app.secret_key, request.headers.get('authorization'), ruoli)
+    if stato == 401:
+        return None, json_response({'error': 'Autenticazione richiesta'}, 401, {'WWW-Authenticate': 'Bearer'})
+    if stato == 403:
+        return None, json_response({'error': 'Operazione non consentita'}, 403)
+    return utente, None
+
+def comprimi_risposta(request, response):
+    """Stessa compressione dell'hook after_request di Flask (backend/compressione.py)"""
+    response.headers.add_vary_header('Accept-Encoding')
+    codifica = compressione.scegli_codifica(request.headers.get('accept-encoding'))
+    if codifica is None or not compressione.comprimibile(
+            response.status_code, response.media_type, len(response.body), response.headers):
+        return response
+
+    response.body = compressione.comprimi(response.body, codifica)
+    response.headers['Content-Length'] = str(len(response.body))
+    response.headers['Content-Encoding'] = codifica
+    etag = response.headers.get('etag')
+    if etag and not etag.startswith('W/'):
+        response.headers['ETag'] = f"W/{etag}"
+    return response
+
+def misurato(rule):
+    """
+    Registra durata e tempo nel database della route nelle metriche, con la regola Flask come etichetta,
+    e comprime la risposta
+    """
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request):
+            start = time.perf_counter()
+            totale = [0.0]
+            token = tempo_db.set(totale)
+            status = 500
+            try:
+                response = comprimi_risposta(request, await view(request))
+                status = response.status_code
+                return response
+            finally:
+                tempo_db.reset(token)
+                metriche.record_request(rule, request.method, status, time.perf_counter() - start, totale[0])
+        return wrapper
+    return decorator
+
+def cached(*tags):
+    """Come ResponseCache.cached, con la stessa chiave (path?query) e le stesse voci delle route Flask"""
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request):
+            key = f"{request.url.path}?{request.url.query}"
+            hit = cache.get(key)
+            if hit is not None:
+                body, mimetype = hit
+                return Response(body, media_type=mimetype, headers={'X-Cache': 'HIT'})
+
+            generazione = cache.generazione(tags)
+            response = await view(request)
+            if response.status_code == 200:
+                cache.set(key, (response.body, response.media_type), tags, generazione)
+                response.headers['X-Cache'] = 'MISS'
+            return response
+        return wrapper
+    return decorator
+
+def errore_db():
+    return json_response({'error': 'Database non disponibile'}, 503)
+
+# ============================================
+# STATISTICHE E REPORT
+# ============================================
+
+def statistiche(query):
+    async def view(request):
+        try:
+            righe = await db.fetch_query(query)
+        except ConnectionError:
+            return errore_db()
+        return json_response(righe)
+    return view
+
+get_statistiche_missioni = misurato('/api/statistiche/missioni')(
+    cached('missioni')(statistiche(QUERY_STATISTICHE_MISSIONI)))
+get_statistiche_droni = misurato('/api/statistiche/droni')(
+    cached('droni', 'missioni')(statistiche(QUERY_STATISTICHE_DRONI)))
+get_statistiche_piloti = misurato('/api/statistiche/piloti')(
+    cached('piloti', 'missioni')(statistiche(QUERY_STATISTICHE_PILOTI)))
+get_report_consegne = misurato('/api/report/consegne')(
+    cached('ordini')(statistiche(QUERY_REPORT_CONSEGNE)))
+
+# ============================================
+# DASHBOARD AMMINISTRATIVA
+# ============================================
+
+@cached('droni', 'missioni', 'piloti', 'ordini')
+async def _dashboard(request):
+    # Le cinque query in parallelo, ognuna su una connessione del pool
+    try:
+        risultati = await asyncio.gather(*(db.fetch_query(query) for query in QUERY_DASHBOARD))
+    except ConnectionError:
+        return errore_db()
+    if any(r is None for r in risultati):
+        return json_response({'error': 'Errore nel calcolo della dashboard'}, 500)
+    return json_response(componi_dashboard(*risultati))
+
+@misurato('/api/dashboard')
+async def get_dashboard(request):
+    """Come la route Flask: stesso documento, stesso ETag e 304 se coincide con If-None-Match"""
+    response = await _dashboard(request)
+    if response.status_code != 200:
+        return response
+    etag = generate_etag(response.body)
+    headers = {'ETag': f'"{etag}"', 'Cache-Control': 'no-cache'}
+    if parse_etags(request.headers.get('if-none-match')).contains_weak(etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return response
+
+# ============================================
+# ORDINI E TRACCE
+# ============================================
+
+@misurato('/api/ordini/<int:id>')
+async def get_ordine(request):
+    """Restituisce un ordine specifico con i prodotti (solo al cliente che l'ha fatto o a un amministratore)"""
+    utente, errore = autentica(request)
+    if errore is not None:
+        return errore
+    try:
+        righe = await db.fetch_query(QUERY_ORDINE, (request.path_params['id'],))
+    except ConnectionError:
+        return errore_db()
+    ordini = raggruppa_prodotti(righe or [])
+
+    if not ordini:
+        return json_response({'error': 'Ordine non trovato'}, 404)
+    if not auth.puo_accedere(ordini[0]['ID_Utente'], utente):
+        return json_response({'error': 'Operazione non consentita'}, 403)
+    return json_response(ordini[0])
+
+@misurato('/api/tracce/ultima/<int:id_missione>')
+async def get_ultima_traccia(request):
+    """Restituisce l'ultima posizione di un drone per una missione"""
+    id_missione = request.path_params['id_missione']
+    # Il primo accesso all'indice può caricarlo dal database: fuori dall'event loop
+    traccia = await asyncio.to_thread(posizioni.get_missione, id_missione)
+
+    if traccia is None:
+        try:
+            traccia = await db.fetch_one(QUERY_ULTIMA, (id_missione,))
+        except ConnectionError:
+            return errore_db()
+        if traccia:
+            posizioni.update([traccia])
+
+    if traccia:
+        return json_response(traccia)
+    return json_response({'error': 'Nessuna traccia trovata'}, 404)
+
+
+class _AsyncSubscriber:
+    """Spettatore del broker live: consegna le tracce alla coda asyncio dal thread che le pubblica"""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.queue = asyncio.Queue()
+
+    def put(self, tracce):
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, tracce)
+
+
+async def _eventi(id_missione, since):
+    subscriber = live.subscribe(id_missione, since, _AsyncSubscriber(asyncio.get_running_loop()))
+    try:
+        inviate = TracceViste(since, live.finestra)
+        ultimo = since
+        yield f"retry: {int(live.poll_interval * 1000)}\n\n"
+
+        try:
+            if since:
+                batch = await db.fetch_query(QUERY_BACKLOG, (id_missione, since)) or []
+            else:
+                ultima = await db.fetch_one(QUERY_ULTIMA, (id_missione,))
+                batch = [ultima] if ultima else []
+        except ConnectionError as e:
+            # La risposta è già iniziata: niente 503, l'evento di errore chiude lo stream
+            print(f"Impossibile leggere le tracce della missione {id_missione}: {e}")
+            yield EVENTO_ERRORE
+            return
+        # Le tracce trovate qui sono inoltrate anche agli altri spettatori della missione
+        live.publish(batch)
+        while True:
+            for traccia in inviate.filtra(batch):
+                ultimo = max(ultimo, traccia['TIMESTAMP']) if ultimo else traccia['TIMESTAMP']
+                yield format_event(traccia, ultimo)
+            try:
+                batch = await asyncio.wait_for(subscriber.queue.get(), live.keepalive)
+            except asyncio.TimeoutError:
+                batch = []
+                yield ": keepalive\n\n"
+    finally:
+        live.unsubscribe(id_missione, subscriber)
+
+async def stream_tracce(request):
+    """
+    Stream Server-Sent Events con le nuove posizioni di una missione.
+    Invia solo le tracce successive a `since` (o all'header Last-Event-ID in caso di riconnessione).
+    """
+    since = (parse_timestamp(request.headers.get('last-event-id'))
+             or parse_timestamp(request.query_params.get('since')))
+    return StreamingResponse(
+        _eventi(request.path_params['id_missione'], since),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+# ============================================
+# LOGIN
+# ============================================
+
+@misurato('/api/login')
+async def login(request):
+    """Come la route Flask: l'event loop attende la verifica della password sul pool dell'hash"""
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    if not isinstance(data, dict) or not isinstance(data.get('Mail'), str) \
+            or not isinstance(data.get('Password'), str):
+        return json_response({'error': 'Mail e Password sono obbligatori'}, 400)
+
+    try:
+        righe = await db.fetch_query(auth.QUERY_UTENTE, (data['Mail'],))
+        if righe is None:
+            print(auth.ERRORE_QUERY_UTENTE)
+            return json_response({'error': 'Errore durante il login'}, 500)
+        utente = righe[0] if righe else None
+        valida, nuovo_hash = await asyncio.wrap_future(
+            hash_pool.submit(auth.verifica, utente, data['Password']))
+        if valida and nuovo_hash:
+            await db.execute_rowcount(auth.QUERY_REHASH, (nuovo_hash, utente['ID'], utente['Password']))
+    except ConnectionError:
+        return errore_db()
+    except OverflowError:
+        return json_response({'error': 'Troppi login in corso, riprovare'}, 503)
+
+    if not valida:
+        return json_response({'success': False, 'message': 'Credenziali non valide'}, 401)
+    try:
+        return json_response(auth.risposta_login(flask_app.secret_key, utente))
+    except auth.ChiaveNonConfigurata:
+        return json_response({'error': 'Autenticazione non configurata sul server'}, 503)
+
+# ============================================
+# APPLICAZIONE
+# ============================================
+
+async def _chiudi():
+    await db.close()
+
+app = Starlette(
+    routes=[
+        Route('/api/statistiche/missioni', get_statistiche_missioni, methods=['GET']),
+        Route('/api/statistiche/droni', get_statistiche_droni, methods=['GET']),
+        Route('/api/statistiche/piloti', get_statistiche_piloti, methods=['GET']),
+        Route('/api/report/consegne', get_report_consegne, methods=['GET']),
+        Route('/api/dashboard', get_dashboard, methods=['GET']),
+        Route('/api/ordini/{id:int}', get_ordine, methods=['GET']),
+        Route('/api/tracce/ultima/{id_missione:int}', get_ultima_traccia, methods=['GET']),
+        Route('/api/tracce/stream/{id_missione:int}', stream_tracce, methods=['GET']),
+        Route('/api/login', login, methods=['POST']),
+        # Tutto il resto (scritture, pagine, route protette) resta all'app Flask
+        Mount('/', WSGIMiddleware(flask_app, workers=WSGI_THREADS)),
+    ],
+    # Stessi header CORS di flask_cors, anche per le route asincrone
+    middleware=[Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])],
+    on_shutdown=[_chiudi]
+)
@@ -0,0 +1,106 @@
+"""
+Audit delle query SQL tramite EXPLAIN.
+
+Estrae tutte le stringhe SQL da backend/app.py (o dai file indicati), esegue
+EXPLAIN su un database MySQL/MariaDB locale configurato nel file .env e
+segnala full table scan, filesort e tabelle temporanee.
+
+Uso:
+    python -m backend.audit
+    python -m backend.audit backend/app.py backend/rollup.py --min-rows 100
+"""
+import argparse
+import ast
+import os
+import re
+import sys
+from backend.db import Database
+
+DEFAULT_FILES = [os.path.join(os.path.dirname(__file__), 'app.py')]
+
+SQL_RE = re.compile(r'^\s*(SELECT|INSERT|UPDATE|DELETE)\s+\S', re.IGNORECASE)
+
+def _testo(node):
+    """Testo di una stringa o f-string (le parti interpolate vengono omesse)"""
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return node.value
+    if isinstance(node, ast.JoinedStr):
+        return ''.join(v.value for v in node.values if isinstance(v, ast.Constant))
+    return None
+
+def estrai_query(percorso):
+    """Restituisce [(riga, funzione, sql)] per ogni stringa SQL nel file"""
+    with open(percorso, encoding='utf-8') as f:
+        tree = ast.parse(f.read(), filename=percorso)
+
+    query = []
+
+    def visita(node, funzione):
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                visita(child, child.name)
+                continue
+            testo = _testo(child)
+            if testo is not None:
+                if SQL_RE.match(testo):
+                    query.append((child.lineno, funzione, ' '.join(testo.split())))
+                continue
+            visita(child, funzione)
+
+    visita(tree, '<modulo>')
+    return query
+
+def prepara(sql):
+    """Sostituisce i parametri con valori fittizi, accettati da EXPLAIN"""
+    return sql.replace('%s', '1')
+
+def analizza(piano, min_rows=0):
+    """Restituisce i problemi trovati nelle righe di un piano EXPLAIN"""
+    problemi = []
+    for riga in piano:
+        tabella = riga.get('table')
+        rows = riga.get('rows') or 0
+        extra = riga.get('Extra') or ''
+        if riga.get('type') == 'ALL' and rows >= min_rows:
+            problemi.append(f"FULL SCAN su {tabella} (rows={rows})")
+        if 'Using filesort' in extra:
+            problemi.append(f"FILESORT su {tabella}")
+        if 'Using temporary' in extra:
+            problemi.append(f"TABELLA TEMPORANEA su {tabella}")
+    return problemi
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Esegue EXPLAIN sulle query SQL del backend")
+    parser.add_argument('files', nargs='*', default=DEFAULT_FILES, help="file Python da analizzare")
+    parser.add_argument('--min-rows', type=int, default=0,
+                        help="segnala i full scan solo sopra questo numero di righe stimate")
+    args = parser.parse_args(argv)
+
+    db = Database()
+    db.connect()
+    segnalate = 0
+    try:
+        for percorso in args.files:
+            for riga, funzione, sql in estrai_query(percorso):
+                piano = db.fetch_query("EXPLAIN " + prepara(sql))
+                if piano is None:
+                    print(f"{percorso}:{riga} {funzione}\n  ERRORE: EXPLAIN non riuscito\n")
+                    segnalate += 1
+                    continue
+                problemi = analizza(piano, args.min_rows)
+                if problemi:
+                    segnalate += 1
+                    print(f"{percorso}:{riga} {funzione}")
+                    for problema in problemi:
+                        print(f"  {problema}")
+                    print()
+    finally:
+        db.disconnect()
+
+    print(f"Query con problemi: {segnalate}")
+    return 1 if segnalate else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
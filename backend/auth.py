@@ -0,0 +1,346 @@
+"""
+Autenticazione: password con hash lento, token firmati con scadenza e ruoli.
+
+Le password sono salvate con l'hash predefinito di Werkzeug (scrypt, circa
+0,1 s per verifica). Verifica e calcolo dell'hash girano su un pool dedicato
+di AUTH_HASH_WORKERS thread: il thread della richiesta (o l'event loop ASGI)
+attende senza eseguire l'hash, e un picco di login non occupa più CPU di
+quella assegnata al pool; oltre AUTH_MAX_CODA login in attesa la risposta è 503.
+
+Il login restituisce un token firmato con SECRET_KEY (HMAC-SHA256) che
+contiene ID e ruolo dell'utente e scade dopo AUTH_TOKEN_TTL secondi: le route
+protette lo verificano con `richiede_ruolo`, senza interrogare il database.
+Senza una SECRET_KEY configurata (o con uno dei valori di esempio) nessun
+token viene emesso né accettato: il login risponde 503 e le route protette 401.
+
+Le password ancora in chiaro (PasswordInChiaro, migrazione 006) sono
+confrontate in tempo costante e sostituite con l'hash al primo login riuscito.
+
+Creazione di un utente (ad esempio il primo amministratore) con la password già con hash:
+    python -m backend.auth --crea-utente admin@esempio.it --nome "Admin" --ruolo amministratore
+
+Benchmark del login con client concorrenti:
+    python -m backend.auth --benchmark --client 16 --login 200
+"""
+import argparse
+import getpass
+import hashlib
+import hmac
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, wraps
+from flask import current_app, g, jsonify, request
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from werkzeug.security import check_password_hash, generate_password_hash
+
+# Metodo di hash per le nuove password (formato di werkzeug.security)
+METODO_HASH = os.getenv('AUTH_HASH_METODO', 'scrypt')
+TOKEN_TTL = int(os.getenv('AUTH_TOKEN_TTL', 8 * 3600))
+RUOLO_ADMIN = os.getenv('AUTH_RUOLO_ADMIN', 'amministratore')
+# Sistemi di bordo e operatori di volo: ingest della telemetria, stato e assegnazione delle missioni
+RUOLO_OPERATORE = os.getenv('AUTH_RUOLO_OPERATORE', 'operatore')
+
+# Valori di esempio (README, QUICK_START, vecchio default): chiunque potrebbe firmare un token
+CHIAVI_ESEMPIO = {
+    'default-secret-key-change-in-production',
+    'your-secret-key-here',
+    'your-secret-key',
+}
+
+class ChiaveNonConfigurata(RuntimeError):
+    """SECRET_KEY mancante o di esempio: i token non possono essere firmati"""
+
+QUERY_UTENTE = """
+    SELECT ID, Nome, Mail, Password, PasswordInChiaro, Ruolo
+    FROM Utente
+    WHERE Mail = %s
+"""
+
+# Se QUERY_UTENTE fallisce il login risponde 500, non "Credenziali non valide"
+ERRORE_QUERY_UTENTE = ("Login non disponibile: lettura dell'utente fallita "
+                       "(migrazione 006_password_hash applicata? python -m backend.migrate)")
+
+# Condizione sulla password letta: un cambio concorrente non viene sovrascritto
+QUERY_REHASH = """
+    UPDATE Utente
+    SET Password = %s, PasswordInChiaro = FALSE
+    WHERE ID = %s AND Password = %s
+"""
+
+def hash_password(password):
+    return generate_password_hash(password, method=METODO_HASH)
+
+@lru_cache(maxsize=1)
+def _prefisso_corrente():
+    # Metodo e parametri di un hash appena calcolato, ad esempio 'scrypt:32768:8:1'
+    return hash_password('').split('$', 1)[0]
+
+@lru_cache(maxsize=1)
+def _hash_fittizio():
+    return hash_password('utente-inesistente')
+
+def necessita_rehash(hash_salvato):
+    """True se l'hash è stato calcolato con un metodo o parametri diversi da quelli attuali"""
+    return hash_salvato.split('$', 1)[0] != _prefisso_corrente()
+
+def verifica(utente, password):
+    """
+    Controlla la password di un utente letto con QUERY_UTENTE (None se la mail non esiste).
+    Restituisce (valida, nuovo_hash): nuovo_hash è da salvare se la password era in chiaro
+    o con un hash superato. Da eseguire sul pool dell'hash.
+    """
+    if utente is None:
+        # Stesso tempo di risposta di un utente esistente: la mail non si può indovinare dal timing
+        check_password_hash(_hash_fittizio(), password)
+        return False, None
+    if utente['PasswordInChiaro']:
+        # Hash fittizio anche qui: dal tempo di risposta non si capisce quali account sono ancora in chiaro
+        check_password_hash(_hash_fittizio(), password)
+        valida = hmac.compare_digest(utente['Password'].encode('utf-8'), password.encode('utf-8'))
+    else:
+        valida = check_password_hash(utente['Password'], password)
+    if valida and (utente['PasswordInChiaro'] or necessita_rehash(utente['Password'])):
+        return True, hash_password(password)
+    return valida, None
+
+
+class PoolHash:
+    """Thread dedicati al calcolo degli hash, con un limite alle richieste in attesa"""
+
+    def __init__(self, workers=None, max_coda=None):
+        # Metà dei core: anche durante un picco di login resta CPU per le altre richieste
+        self.workers = workers or int(os.getenv('AUTH_HASH_WORKERS', max(1, (os.cpu_count() or 2) // 2)))
+        self.max_coda = max_coda or int(os.getenv('AUTH_MAX_CODA', 64))
+        self._executor = None
+        self._lock = threading.Lock()
+        self._in_coda = 0
+        self.rifiutate = 0
+
+    def submit(self, fn, *args):
+        """Accoda `fn(*args)` e restituisce un Future; OverflowError se la coda è piena"""
+        with self._lock:
+            if self._in_coda >= self.max_coda:
+                self.rifiutate += 1
+                raise OverflowError("Troppi login in attesa")
+            self._in_coda += 1
+            # Creato al primo utilizzo, così funziona anche dopo un fork dei worker
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='auth-hash')
+        future = self._executor.submit(fn, *args)
+        future.add_done_callback(self._completato)
+        return future
+
+    def _completato(self, _future):
+        with self._lock:
+            self._in_coda -= 1
+
+    def metrics(self):
+        with self._lock:
+            return {'workers': self.workers, 'in_coda': self._in_coda, 'rifiutate': self.rifiutate}
+
+# ============================================
+# TOKEN
+# ============================================
+
+def chiave_valida(secret_key):
+    return bool(secret_key) and secret_key not in CHIAVI_ESEMPIO
+
+@lru_cache(maxsize=4)
+def _serializer(secret_key):
+    return URLSafeTimedSerializer(secret_key, salt='auth-token', signer_kwargs={'digest_method': hashlib.sha256})
+
+def crea_token(secret_key, utente):
+    """Token firmato con ID e ruolo; ChiaveNonConfigurata se SECRET_KEY manca o è di esempio"""
+    if not chiave_valida(secret_key):
+        raise ChiaveNonConfigurata("SECRET_KEY non configurata: impossibile emettere token")
+    return _serializer(secret_key).dumps({'id': utente['ID'], 'ruolo': utente['Ruolo']})
+
+def leggi_token(secret_key, token, max_age=None):
+    """
+    Contenuto del token ({'id', 'ruolo'}), None se la firma non è valida, il token è scaduto
+    o SECRET_KEY manca o è di esempio
+    """
+    if not chiave_valida(secret_key):
+        return None
+    try:
+        return _serializer(secret_key).loads(token, max_age=max_age or TOKEN_TTL)
+    except BadSignature:
+        return None
+
+def token_richiesta(authorization):
+    """Token dall'header 'Authorization: Bearer <token>'"""
+    schema, _, token = (authorization or '').partition(' ')
+    return token.strip() if schema.lower() == 'bearer' and token.strip() else None
+
+def risposta_login(secret_key, utente):
+    return {
+        'success': True,
+        'user': {
+            'ID': utente['ID'],
+            'Nome': utente['Nome'],
+            'Mail': utente['Mail'],
+            'Ruolo': utente['Ruolo']
+        },
+        'token': crea_token(secret_key, utente),
+        'token_type': 'Bearer',
+        'expires_in': TOKEN_TTL
+    }
+
+def utente_richiesta(secret_key, authorization, ruoli=()):
+    """
+    Verifica dell'header Authorization (per richiede_ruolo e per le route ASGI):
+    restituisce (contenuto del token, None) oppure (None, stato 401 o 403)
+    """
+    token = token_richiesta(authorization)
+    utente = leggi_token(secret_key, token) if token else None
+    if utente is None:
+        return None, 401
+    if ruoli and utente['ruolo'] not in ruoli:
+        return None, 403
+    return utente, None
+
+def richiede_ruolo(*ruoli):
+    """
+    Decoratore per le route Flask protette: richiede un token valido (401) e, se indicati,
+    uno dei `ruoli` (403). Il contenuto del token è disponibile in `g.utente`.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            utente, stato = utente_richiesta(current_app.secret_key, request.headers.get('Authorization'), ruoli)
+            if stato == 401:
+                response = jsonify({'error': 'Autenticazione richiesta'})
+                response.status_code = 401
+                response.headers['WWW-Authenticate'] = 'Bearer'
+                return response
+            if stato == 403:
+                return jsonify({'error': 'Operazione non consentita'}), 403
+            g.utente = utente
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def puo_accedere(id_utente, utente=None):
+    """True se l'utente autenticato (di default `g.utente`) è `id_utente` oppure un amministratore"""
+    utente = utente or g.utente
+    return utente['id'] == id_utente or utente['ruolo'] == RUOLO_ADMIN
+
+# ============================================
+# BENCHMARK
+# ============================================
+
+def benchmark(client=16, login=200, workers=None):
+    """
+    Login al secondo e latenze con `client` thread concorrenti (utenti in memoria al posto
+    della SELECT), confrontando il pool dell'hash con l'hash sul thread della richiesta.
+    Una sonda misura intanto la latenza di una richiesta leggera (verifica di un token).
+    """
+    password = 'pass123'
+    utente = {'ID': 1, 'Nome': 'Bench', 'Mail': 'bench@local', 'Ruolo': 'cliente',
+              'Password': hash_password(password), 'PasswordInChiaro': False}
+    segreto = 'benchmark'
+    token = crea_token(segreto, utente)
+    risultati = {}
+
+    for modalita in ('pool', 'thread_richiesta'):
+        pool = PoolHash(workers=workers, max_coda=client * 2)
+        latenze, sonda = [], []
+        fine_carico = threading.Event()
+
+        def esegui_login():
+            for _ in range(login // client):
+                start = time.perf_counter()
+                if modalita == 'pool':
+                    valida, _ = pool.submit(verifica, utente, password).result()
+                else:
+                    valida, _ = verifica(utente, password)
+                assert valida
+                crea_token(segreto, utente)
+                latenze.append(time.perf_counter() - start)
+
+        def esegui_sonda():
+            while not fine_carico.is_set():
+                start = time.perf_counter()
+                leggi_token(segreto, token)
+                sonda.append(time.perf_counter() - start)
+                time.sleep(0.005)
+
+        thread_sonda = threading.Thread(target=esegui_sonda)
+        thread_sonda.start()
+        start = time.perf_counter()
+        threads = [threading.Thread(target=esegui_login) for _ in range(client)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        durata = time.perf_counter() - start
+        fine_carico.set()
+        thread_sonda.join()
+
+        latenze.sort()
+        sonda.sort()
+        risultati[modalita] = {
+            'login_s': round(len(latenze) / durata, 1),
+            'login_p50_ms': round(latenze[len(latenze) // 2] * 1000, 1),
+            'login_p95_ms': round(latenze[int(len(latenze) * 0.95)] * 1000, 1),
+            'sonda_p95_ms': round(sonda[int(len(sonda) * 0.95)] * 1000, 2) if sonda else None,
+            'workers': pool.workers if modalita == 'pool' else client
+        }
+
+    start = time.perf_counter()
+    for _ in range(10000):
+        leggi_token(segreto, token)
+    risultati['verifica_token_s'] = round(10000 / (time.perf_counter() - start))
+    return risultati
+
+
+def crea_utente(db, nome, mail, password, ruolo):
+    """Inserisce un utente con la password già con hash; restituisce l'ID (None se la mail esiste già)"""
+    return db.execute_query(
+        "INSERT INTO Utente (Nome, Mail, Password, PasswordInChiaro, Ruolo) VALUES (%s, %s, %s, FALSE, %s)",
+        (nome, mail, hash_password(password), ruolo)
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Utenti e benchmark del login")
+    parser.add_argument('--crea-utente', metavar='MAIL', help="crea un utente chiedendo la password")
+    parser.add_argument('--nome')
+    parser.add_argument('--ruolo', default=RUOLO_ADMIN)
+    parser.add_argument('--benchmark', action='store_true')
+    parser.add_argument('--client', type=int, default=16)
+    parser.add_argument('--login', type=int, default=200)
+    parser.add_argument('--workers', type=int)
+    args = parser.parse_args(argv)
+
+    if args.crea_utente:
+        password = getpass.getpass("Password: ")
+        if not password or password != getpass.getpass("Ripeti la password: "):
+            print("Le password non coincidono")
+            return 1
+        from backend.db import Database
+        db = Database()
+        db.connect()
+        try:
+            id_utente = crea_utente(db, args.nome or args.crea_utente, args.crea_utente, password, args.ruolo)
+        finally:
+            db.disconnect()
+        if id_utente is None:
+            print("Utente non creato (mail già registrata?)")
+            return 1
+        print(f"Utente {id_utente} creato con ruolo {args.ruolo}")
+        return 0
+
+    if not args.benchmark:
+        parser.print_help()
+        return 0
+    for chiave, valore in benchmark(args.client, args.login, args.workers).items():
+        print(f"{chiave:<20}{valore}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
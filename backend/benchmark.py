@@ -0,0 +1,323 @@
+"""
+Benchmark di carico delle API su un MySQL/MariaDB locale.
+
+`genera` popola il database configurato nel .env con dati sintetici sulla
+falsariga di memory-bank/data.sql, alla scala richiesta, usando l'import a
+blocchi di backend.bulk (memoria costante anche con milioni di tracce).
+`esegui` avvia l'applicazione in un server locale (oppure usa `--url`), la
+interroga con client concorrenti e stampa throughput e percentili di latenza
+per scenario in JSON; con `--baseline` confronta il p95 con un'esecuzione
+precedente e termina con codice 1 se peggiora oltre la tolleranza.
+
+Uso (su un database dedicato, dopo structure.sql e le migrazioni):
+    python -m backend.benchmark genera --droni 100 --missioni 100000 --tracce 1000000
+    python -m backend.benchmark esegui --client 16 --durata 30 --output base.json
+    python -m backend.benchmark esegui --baseline base.json --tolleranza 0.2
+"""
+import argparse
+import http.client
+import json
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+import numpy as np
+from backend import bulk
+from backend.db import Database
+
+# Password degli utenti sintetici (utenteN@bench.local)
+PASSWORD = 'pass123'
+
+CENTRO = (45.4642, 9.19)
+MODELLI = ('DJI Phantom 4', 'Parrot Anafi', 'DJI Mavic Air 2', 'Autel Evo II', 'Skydio 2', 'DJI Air 2S')
+CATEGORIE = ('Elettronica', 'Casa', 'Ufficio', 'Accessori', 'Giardino', 'Abbigliamento',
+             'Igiene', 'Illuminazione', 'Libri', 'Sport', 'Calzature')
+COMMENTI = ('Consegna puntuale', 'Ottima gestione', 'Leggero ritardo', 'Eccellente', 'Pacco integro')
+STATI = ('completata',) * 17 + ('annullata', 'in corso', 'programmata')
+
+# Intervallo tra due tracce della stessa missione
+PASSO_TRACCE = timedelta(seconds=30)
+
+def _prossimo_id(db, tabella):
+    riga = db.fetch_one(f"SELECT COALESCE(MAX(ID), 0) + 1 as ID FROM {tabella}")
+    return riga['ID']
+
+def genera(db, droni=100, piloti=20, utenti=1000, prodotti=500, missioni=100000, tracce=1000000,
+           chunk_size=5000, seed=42):
+    """Inserisce dati sintetici coerenti tra loro; restituisce il numero di righe per dataset"""
+    rng = random.Random(seed)
+    inizio = {t: _prossimo_id(db, t) for t in ('Drone', 'Pilota', 'Utente', 'Prodotto', 'Missioni', 'Ordine')}
+    conteggi = {}
+
+    def importa(dataset, righe):
+        conteggi[dataset] = bulk.importa(db, dataset, righe, chunk_size)['righe']
+
+    importa('piloti', (
+        {'ID': inizio['Pilota'] + i, 'Nome': f'Pilota{i}', 'Cognome': 'Bench',
+         'Turno': rng.choice(('Mattina', 'Pomeriggio', 'Sera')), 'Brevetto': f'BN{i:06d}'}
+        for i in range(piloti)
+    ))
+    importa('prodotti', (
+        {'ID': inizio['Prodotto'] + i, 'nome': f'Prodotto {i}', 'peso': round(rng.uniform(0.02, 2.5), 3),
+         'categoria': rng.choice(CATEGORIE)}
+        for i in range(prodotti)
+    ))
+    importa('droni', (
+        {'ID': inizio['Drone'] + i, 'Modello': rng.choice(MODELLI),
+         'Capacita': round(rng.uniform(1.5, 3.0), 2), 'Batteria': rng.randint(20, 100)}
+        for i in range(droni)
+    ))
+
+    for i in range(0, utenti, chunk_size):
+        db.execute_many(
+            "INSERT INTO Utente (ID, Nome, Mail, Password, Ruolo) VALUES (%s, %s, %s, %s, 'cliente')",
+            [(id_utente, f'Utente {id_utente}', f'utente{id_utente}@bench.local', PASSWORD)
+             for id_utente in range(inizio['Utente'] + i, inizio['Utente'] + min(i + chunk_size, utenti))]
+        )
+    conteggi['utenti'] = utenti
+
+    # Missioni: date nell'ultimo anno, coordinate attorno a Milano
+    oggi = datetime.now().replace(second=0, microsecond=0)
+    elenco = []
+    for i in range(missioni):
+        partenza = oggi - timedelta(minutes=rng.randint(0, 365 * 24 * 60))
+        prelievo = (CENTRO[0] + rng.gauss(0, 0.03), CENTRO[1] + rng.gauss(0, 0.04))
+        consegna = (prelievo[0] + rng.gauss(0, 0.01), prelievo[1] + rng.gauss(0, 0.01))
+        stato = rng.choice(STATI)
+        elenco.append((inizio['Missioni'] + i, inizio['Drone'] + rng.randrange(droni),
+                       partenza, prelievo, consegna, stato))
+
+    def righe_missioni():
+        for id_missione, id_drone, partenza, prelievo, consegna, stato in elenco:
+            valutata = stato == 'completata' and rng.random() < 0.7
+            yield {
+                'ID': id_missione, 'DataMissione': partenza.date(), 'Ora': partenza.time(),
+                'LatPrelievo': round(prelievo[0], 7), 'LongPrelievo': round(prelievo[1], 7),
+                'LatConsegna': round(consegna[0], 7), 'LongConsegna': round(consegna[1], 7),
+                'Valutazione': rng.randint(1, 10) if valutata else None,
+                'Commento': rng.choice(COMMENTI) if valutata else None,
+                'IdDrone': id_drone, 'IdPilota': inizio['Pilota'] + rng.randrange(piloti), 'Stato': stato
+            }
+    importa('missioni', righe_missioni())
+
+    # Un ordine per missione, con 1-3 prodotti
+    importa('ordini', (
+        {'ID': inizio['Ordine'] + n, 'Tipo': rng.choice(('Standard', 'Standard', 'Espresso')),
+         'PesoTotale': round(rng.uniform(0.1, 3.0), 2), 'Orario': partenza + timedelta(minutes=5),
+         'IndirizzoDestinazione': f'Via Benchmark {n}, Milano', 'ID_Missione': id_missione,
+         'ID_Utente': inizio['Utente'] + rng.randrange(utenti)}
+        for n, (id_missione, _, partenza, _, _, _) in enumerate(elenco)
+    ))
+    importa('contiene', (
+        {'ID_Prodotto': inizio['Prodotto'] + p, 'ID_Ordine': inizio['Ordine'] + n, 'Quantita': rng.randint(1, 3)}
+        for n in range(len(elenco))
+        for p in rng.sample(range(prodotti), min(prodotti, rng.randint(1, 3)))
+    ))
+
+    # Tracce: interpolate tra prelievo e consegna delle missioni volate
+    volate = [m for m in elenco if m[5] in ('completata', 'in corso')]
+
+    def righe_tracce():
+        if not volate:
+            return
+        per_missione, resto = divmod(tracce, len(volate))
+        for n, (id_missione, id_drone, partenza, prelievo, consegna, _) in enumerate(volate):
+            punti = per_missione + (1 if n < resto else 0)
+            for k in range(punti):
+                f = k / max(punti - 1, 1)
+                yield {
+                    'ID_Drone': id_drone, 'ID_Missione': id_missione,
+                    'Latitudine': round(prelievo[0] + (consegna[0] - prelievo[0]) * f + rng.gauss(0, 0.0001), 7),
+                    'Longitudine': round(prelievo[1] + (consegna[1] - prelievo[1]) * f + rng.gauss(0, 0.0001), 7),
+                    'TIMESTAMP': partenza + PASSO_TRACCE * k
+                }
+    importa('tracce', righe_tracce())
+    return conteggi
+
+
+def scenari(db):
+    """Scenari di richiesta: (nome, metodo, funzione che restituisce (percorso, corpo))"""
+    missioni = [r['ID_Missione'] for r in db.fetch_query(
+        "SELECT DISTINCT ID_Missione FROM Traccia ORDER BY ID_Missione DESC LIMIT 1000"
+    ) or []]
+    utenti = [r['Mail'] for r in db.fetch_query(
+        "SELECT Mail FROM Utente WHERE Mail LIKE %s LIMIT 1000", ('%@bench.local',)
+    ) or []]
+    elenco = [
+        ('missioni', 'GET', lambda rng: ('/api/missioni?limit=100', None)),
+        ('statistiche_missioni', 'GET', lambda rng: ('/api/statistiche/missioni', None)),
+        ('statistiche_droni', 'GET', lambda rng: ('/api/statistiche/droni', None)),
+        ('statistiche_piloti', 'GET', lambda rng: ('/api/statistiche/piloti', None)),
+    ]
+    if missioni:
+        elenco.append(('tracce_missione', 'GET',
+                       lambda rng: (f'/api/tracce/missione/{rng.choice(missioni)}', None)))
+    if utenti:
+        elenco.append(('login', 'POST',
+                       lambda rng: ('/api/login', {'Mail': rng.choice(utenti), 'Password': PASSWORD})))
+    return elenco
+
+def _client(url, elenco, fine, risultati, seed):
+    """Esegue richieste in sequenza su una connessione keep-alive fino a `fine`"""
+    rng = random.Random(seed)
+    parti = urlsplit(url)
+    conn = http.client.HTTPConnection(parti.hostname, parti.port or 80, timeout=60)
+    n = 0
+    while time.monotonic() < fine:
+        nome, metodo, richiesta = elenco[n % len(elenco)]
+        n += 1
+        percorso, corpo = richiesta(rng)
+        headers = {'Content-Type': 'application/json'} if corpo is not None else {}
+        start = time.perf_counter()
+        try:
+            conn.request(metodo, percorso, body=json.dumps(corpo) if corpo is not None else None,
+                         headers=headers)
+            risposta = conn.getresponse()
+            risposta.read()
+            ok = risposta.status < 400
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            conn = http.client.HTTPConnection(parti.hostname, parti.port or 80, timeout=60)
+            ok = False
+        risultati[nome].append((time.perf_counter() - start, ok))
+    conn.close()
+
+def _riepilogo(campioni, durata):
+    latenze = np.array([t for t, _ in campioni]) * 1000
+    errori = sum(1 for _, ok in campioni if not ok)
+    if not len(latenze):
+        return {'richieste': 0, 'errori': 0, 'rps': 0.0}
+    p50, p95, p99 = np.percentile(latenze, [50, 95, 99])
+    return {
+        'richieste': len(latenze),
+        'errori': errori,
+        'rps': round(len(latenze) / durata, 1),
+        'p50_ms': round(float(p50), 2),
+        'p95_ms': round(float(p95), 2),
+        'p99_ms': round(float(p99), 2),
+        'max_ms': round(float(latenze.max()), 2)
+    }
+
+def esegui(db, url=None, client=8, durata=30, riscaldamento=3):
+    """Interroga gli endpoint con `client` connessioni concorrenti per `durata` secondi"""
+    elenco = scenari(db)
+    server = None
+    if url is None:
+        from werkzeug.serving import WSGIRequestHandler, make_server
+        from backend.app import app
+
+        class Handler(WSGIRequestHandler):
+            # Keep-alive come in produzione, senza log per richiesta
+            protocol_version = 'HTTP/1.1'
+
+            def log_request(self, *args, **kwargs):
+                pass
+
+        server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f'http://127.0.0.1:{server.server_port}'
+
+    try:
+        # Riscaldamento: cache, pool di connessioni e indici in memoria
+        if riscaldamento:
+            scarto = {nome: [] for nome, _, _ in elenco}
+            _client(url, elenco, time.monotonic() + riscaldamento, scarto, seed=0)
+
+        risultati = {nome: [] for nome, _, _ in elenco}
+        fine = time.monotonic() + durata
+        start = time.monotonic()
+        threads = [
+            threading.Thread(target=_client, args=(url, elenco, fine, risultati, i + 1))
+            for i in range(client)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        trascorso = time.monotonic() - start
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    tutti = [c for campioni in risultati.values() for c in campioni]
+    return {
+        'data': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'url': url,
+        'client': client,
+        'durata_s': round(trascorso, 2),
+        'totale': _riepilogo(tutti, trascorso),
+        'scenari': {nome: _riepilogo(campioni, trascorso) for nome, campioni in risultati.items()}
+    }
+
+def confronta(risultato, baseline, tolleranza):
+    """Restituisce gli scenari il cui p95 è peggiorato oltre la tolleranza rispetto alla baseline"""
+    regressioni = []
+    for nome, attuale in risultato['scenari'].items():
+        precedente = baseline.get('scenari', {}).get(nome)
+        if not precedente or not precedente.get('p95_ms') or 'p95_ms' not in attuale:
+            continue
+        if attuale['p95_ms'] > precedente['p95_ms'] * (1 + tolleranza):
+            regressioni.append(f"{nome}: p95 {precedente['p95_ms']} -> {attuale['p95_ms']} ms")
+    return regressioni
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark di carico delle API")
+    sub = parser.add_subparsers(dest='comando', required=True)
+
+    p = sub.add_parser('genera', help="popola il database con dati sintetici")
+    p.add_argument('--droni', type=int, default=100)
+    p.add_argument('--piloti', type=int, default=20)
+    p.add_argument('--utenti', type=int, default=1000)
+    p.add_argument('--prodotti', type=int, default=500)
+    p.add_argument('--missioni', type=int, default=100000, help="una missione e un ordine ciascuna")
+    p.add_argument('--tracce', type=int, default=1000000)
+    p.add_argument('--chunk-size', type=int, default=5000)
+    p.add_argument('--seed', type=int, default=42)
+
+    p = sub.add_parser('esegui', help="misura throughput e latenza degli endpoint")
+    p.add_argument('--url', help="server già avviato (default: server locale in-process)")
+    p.add_argument('--client', type=int, default=8, help="connessioni concorrenti")
+    p.add_argument('--durata', type=float, default=30, help="secondi di misura")
+    p.add_argument('--riscaldamento', type=float, default=3, help="secondi di riscaldamento")
+    p.add_argument('--output', help="file JSON dei risultati (default: stdout)")
+    p.add_argument('--baseline', help="risultati JSON precedenti da confrontare")
+    p.add_argument('--tolleranza', type=float, default=0.2, help="peggioramento massimo del p95 (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    db = Database()
+    db.connect()
+    try:
+        if args.comando == 'genera':
+            start = time.monotonic()
+            conteggi = genera(db, args.droni, args.piloti, args.utenti, args.prodotti,
+                              args.missioni, args.tracce, args.chunk_size, args.seed)
+            print(json.dumps(dict(conteggi, secondi=round(time.monotonic() - start, 1)), indent=2))
+            return 0
+        risultato = esegui(db, args.url, args.client, args.durata, args.riscaldamento)
+    except bulk.ImportInterrotto as e:
+        print(e, file=sys.stderr)
+        return 1
+    finally:
+        db.disconnect()
+
+    testo = json.dumps(risultato, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(testo + '\n')
+    else:
+        print(testo)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressioni = confronta(risultato, json.load(f), args.tolleranza)
+        for r in regressioni:
+            print(f"REGRESSIONE {r}", file=sys.stderr)
+        return 1 if regressioni else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,232 @@
+"""
+Import ed export massivi delle tabelle principali in CSV o NDJSON.
+
+L'export legge le righe con un cursore non bufferizzato e le serializza una
+alla volta; l'import scrive blocchi di `chunk_size` righe con INSERT multi-riga,
+una transazione per blocco. Le righe già presenti (stessa chiave primaria)
+vengono ignorate: un import interrotto si riprende rieseguendolo, oppure
+saltando con `--skip` le righe già confermate. I riepiloghi derivati sono
+aggiornati solo per le righe importate, senza ricostruzioni complete.
+
+Ordine di import consigliato: piloti, prodotti, droni, missioni, ordini, contiene,
+tracce (gli utenti, con le password, non sono esportabili).
+
+Uso:
+    python -m backend.bulk export tracce --format ndjson > tracce.ndjson
+    python -m backend.bulk import tracce tracce.ndjson --chunk-size 5000
+    python -m backend.bulk import missioni missioni.csv --skip 20000
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+from itertools import islice
+from mysql.connector import Error
+from backend.db import Database
+from backend.serializzazione import dumps
+from backend import domanda, manutenzione, rollup, sentiment
+
+# dataset -> (tabella, colonne, chiave primaria)
+DATASET = {
+    'piloti': ('Pilota', ('ID', 'Nome', 'Cognome', 'Turno', 'Brevetto'), ('ID',)),
+    'prodotti': ('Prodotto', ('ID', 'nome', 'peso', 'categoria'), ('ID',)),
+    'droni': ('Drone', ('ID', 'Modello', 'Capacita', 'Batteria'), ('ID',)),
+    'missioni': ('Missioni', (
+        'ID', 'DataMissione', 'Ora', 'LatPrelievo', 'LongPrelievo', 'LatConsegna', 'LongConsegna',
+        'Valutazione', 'Commento', 'IdDrone', 'IdPilota', 'Stato'
+    ), ('ID',)),
+    'ordini': ('Ordine', (
+        'ID', 'Tipo', 'PesoTotale', 'Orario', 'IndirizzoDestinazione', 'ID_Missione', 'ID_Utente'
+    ), ('ID',)),
+    'contiene': ('Contiene', ('ID_Prodotto', 'ID_Ordine', 'Quantita'), ('ID_Prodotto', 'ID_Ordine')),
+    'tracce': ('Traccia', (
+        'ID_Drone', 'ID_Missione', 'Latitudine', 'Longitudine', 'TIMESTAMP'
+    ), ('ID_Drone', 'ID_Missione', 'TIMESTAMP')),
+}
+
+# Aggiornamenti incrementali eseguiti con gli ID delle righe nuove, nella transazione di ogni blocco
+AGGIORNAMENTI = {
+    'missioni': (rollup.registra_missioni, sentiment.analizza),
+    'ordini': (domanda.registra_ordini,),
+}
+
+FORMATI = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+CHUNK_SIZE = int(os.getenv('BULK_CHUNK_SIZE', 1000))
+
+# Righe serializzate per ogni blocco di output dell'export
+RIGHE_PER_BLOCCO = 500
+
+class ImportInterrotto(RuntimeError):
+    """Import fallito: `righe` indica quante righe dell'input sono già state confermate"""
+
+    def __init__(self, dataset, righe, causa):
+        super().__init__(f"Import di {dataset} interrotto dopo {righe} righe: {causa}")
+        self.righe = righe
+
+
+def esporta(db, dataset, fmt='ndjson'):
+    """Generatore che produce il contenuto del dataset in CSV o NDJSON, a blocchi di testo"""
+    tabella, colonne, chiave = DATASET[dataset]
+    righe = db.stream_query(
+        f"SELECT {', '.join(colonne)} FROM {tabella} ORDER BY {', '.join(chiave)}"
+    )
+
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator='\n')
+        writer.writerow(colonne)
+        for n, riga in enumerate(righe, 1):
+            writer.writerow([riga[c] for c in colonne])
+            if n % RIGHE_PER_BLOCCO == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+        return
+
+    blocco = []
+    for riga in righe:
+        blocco.append(dumps(riga) + '\n')
+        if len(blocco) >= RIGHE_PER_BLOCCO:
+            yield ''.join(blocco)
+            blocco = []
+    if blocco:
+        yield ''.join(blocco)
+
+def leggi_righe(stream, fmt='ndjson'):
+    """Legge le righe da uno stream di testo CSV (con intestazione) o NDJSON, una alla volta"""
+    if fmt == 'csv':
+        for riga in csv.DictReader(stream):
+            # Nel CSV i valori NULL sono esportati come campi vuoti
+            yield {k: (v if v != '' else None) for k, v in riga.items()}
+        return
+
+    for numero, linea in enumerate(stream, 1):
+        if not linea.strip():
+            continue
+        try:
+            riga = json.loads(linea)
+        except ValueError:
+            raise ValueError(f"Riga {numero}: JSON non valido")
+        if not isinstance(riga, dict):
+            raise ValueError(f"Riga {numero}: atteso un oggetto JSON")
+        yield riga
+
+def _nuovi(db, tabella, blocco):
+    """ID delle righe del blocco non ancora presenti (bloccati fino al commit, per non contarli due volte)"""
+    try:
+        # Nel CSV gli ID arrivano come testo
+        ids = {int(riga[0]) for riga in blocco}
+    except (TypeError, ValueError):
+        raise ValueError(f"ID mancante o non valido in {tabella}: serve per aggiornare i riepiloghi")
+    presenti = db.fetch_query(f"""
+        SELECT ID FROM {tabella}
+        WHERE ID IN ({', '.join(['%s'] * len(ids))})
+        FOR UPDATE
+    """, list(ids))
+    if presenti is None:
+        raise Error(f"Lettura delle righe già presenti in {tabella} fallita")
+    return sorted(ids - {r['ID'] for r in presenti})
+
+def importa(db, dataset, righe, chunk_size=None, skip=0):
+    """
+    Importa le righe a blocchi di `chunk_size`, una transazione per blocco, saltando le prime `skip`.
+    Le colonne mancanti valgono NULL. Per missioni e ordini i riepiloghi (e il sentiment dei commenti)
+    sono aggiornati con le sole righe nuove, nella transazione del blocco; per le tracce l'usura è
+    ricalcolata alla fine per i soli droni coinvolti.
+    Solleva ImportInterrotto con il numero di righe già confermate in caso di errore; un errore nel
+    ricalcolo dell'usura non annulla l'import ed è riportato nella chiave `errore_ricalcolo`.
+    """
+    tabella, colonne, chiave = DATASET[dataset]
+    chunk_size = chunk_size or CHUNK_SIZE
+    query = f"""
+        INSERT INTO {tabella} ({', '.join(colonne)})
+        VALUES ({', '.join(['%s'] * len(colonne))})
+        ON DUPLICATE KEY UPDATE {chiave[0]} = {chiave[0]}
+    """
+    aggiornamenti = AGGIORNAMENTI.get(dataset, ())
+
+    confermate = skip
+    blocchi = 0
+    droni = set()
+    try:
+        righe = islice(righe, skip, None)
+        while True:
+            blocco = [tuple(riga.get(c) for c in colonne) for riga in islice(righe, chunk_size)]
+            if not blocco:
+                break
+            with db.transaction():
+                nuovi = _nuovi(db, tabella, blocco) if aggiornamenti else None
+                db.execute_many(query, blocco)
+                if nuovi:
+                    for aggiorna in aggiornamenti:
+                        aggiorna(db, nuovi)
+            confermate += len(blocco)
+            blocchi += 1
+            if dataset == 'tracce':
+                droni.update(riga[0] for riga in blocco)
+    except (Error, ValueError) as e:
+        raise ImportInterrotto(dataset, confermate, e) from e
+
+    risultato = {'dataset': dataset, 'righe': confermate, 'blocchi': blocchi}
+    if droni:
+        try:
+            manutenzione.ricostruisci(db, droni)
+        except (Error, ConnectionError) as e:
+            print(f"Ricalcolo dell'usura dopo l'import fallito: {e}", file=sys.stderr)
+            risultato['errore_ricalcolo'] = (
+                f"Usura dei droni non ricalcolata ({e}): eseguire python -m backend.manutenzione --rebuild"
+            )
+    return risultato
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import ed export massivi in CSV o NDJSON")
+    parser.add_argument('azione', choices=('import', 'export'))
+    parser.add_argument('dataset', choices=sorted(DATASET))
+    parser.add_argument('file', nargs='?', help="file di input/output (default: stdin/stdout)")
+    parser.add_argument('--format', choices=sorted(FORMATI),
+                        help="formato dei dati (default: dedotto dall'estensione, altrimenti ndjson)")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="righe per transazione")
+    parser.add_argument('--skip', type=int, default=0, help="righe iniziali da saltare (ripresa)")
+    args = parser.parse_args(argv)
+
+    fmt = args.format or ('csv' if args.file and args.file.endswith('.csv') else 'ndjson')
+
+    db = Database()
+    db.connect()
+    try:
+        if args.azione == 'export':
+            out = open(args.file, 'w', encoding='utf-8', newline='') if args.file else sys.stdout
+            try:
+                for blocco in esporta(db, args.dataset, fmt):
+                    out.write(blocco)
+            finally:
+                if args.file:
+                    out.close()
+            return 0
+
+        stream = open(args.file, encoding='utf-8', newline='') if args.file else sys.stdin
+        try:
+            risultato = importa(db, args.dataset, leggi_righe(stream, fmt), args.chunk_size, args.skip)
+        except ImportInterrotto as e:
+            print(e, file=sys.stderr)
+            print(f"Per riprendere: --skip {e.righe}", file=sys.stderr)
+            return 1
+        finally:
+            if args.file:
+                stream.close()
+        print(f"Importate {risultato['righe']} righe in {risultato['blocchi']} blocchi", file=sys.stderr)
+        if 'errore_ricalcolo' in risultato:
+            print(risultato['errore_ricalcolo'], file=sys.stderr)
+            return 1
+        return 0
+    finally:
+        db.disconnect()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,164 @@
+"""
+Cache in memoria delle risposte delle API aggregate (statistiche e report).
+
+Le voci scadono dopo `ttl` secondi, la dimensione è limitata con politica LRU
+e ogni voce porta dei tag (es. 'missioni', 'droni') usati per invalidarla
+quando le tabelle sottostanti vengono modificate.
+
+Le scritture invalidano subito le voci del worker che le ha servite; gli altri
+worker se ne accorgono da un thread che legge le versioni delle tabelle
+(VersioneTabella, migrazioni 002 e 007) ogni `CACHE_VERSIONI_INTERVALLO`
+secondi: è il ritardo massimo con cui una statistica può restare superata.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import Response, request
+from backend.condizionale import QUERY_VERSIONE
+
+class ResponseCache:
+    """Cache TTL + LRU con invalidazione per tag"""
+
+    def __init__(self, ttl=None, max_entries=None, db_factory=None, tabelle=None, intervallo=None):
+        self.ttl = ttl if ttl is not None else float(os.getenv('CACHE_TTL', 60))
+        self.max_entries = max_entries or int(os.getenv('CACHE_MAX_ENTRIES', 256))
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Versioni condivise tra i worker: {tabella: tag da invalidare quando cambia}
+        self.db_factory = db_factory
+        self.tabelle = tabelle or {}
+        self.intervallo = intervallo or float(os.getenv('CACHE_VERSIONI_INTERVALLO', 1.0))
+        self._versioni = None
+        self._generazioni = {}
+        self._thread = None
+
+        # Metriche
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        self._ensure_thread()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def generazione(self, tags):
+        """Contatore delle invalidazioni dei tag, da leggere prima di calcolare una voce"""
+        with self._lock:
+            return sum(self._generazioni.get(tag, 0) for tag in tags)
+
+    def set(self, key, value, tags, generazione=None):
+        """Memorizza la voce, salvo che i suoi tag siano stati invalidati dopo `generazione`"""
+        with self._lock:
+            if generazione is not None and generazione != sum(self._generazioni.get(tag, 0) for tag in tags):
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, frozenset(tags), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, *tags):
+        """Rimuove tutte le voci che portano almeno uno dei tag indicati"""
+        tags = set(tags)
+        with self._lock:
+            for tag in tags:
+                self._generazioni[tag] = self._generazioni.get(tag, 0) + 1
+            stale = [key for key, entry in self._entries.items() if entry[1] & tags]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    # --------------------------------------------
+    # Versioni delle tabelle (scritture degli altri worker)
+    # --------------------------------------------
+    def _ensure_thread(self):
+        # Avviato al primo utilizzo, quindi nel worker dopo il fork
+        if self.db_factory is None or not self.tabelle:
+            return
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name='cache-versioni', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.allinea()
+            except Exception as e:
+                print(f"Errore durante la lettura delle versioni delle tabelle: {e}")
+            time.sleep(self.intervallo)
+
+    def allinea(self):
+        """Invalida i tag delle tabelle la cui versione è cambiata dall'ultima lettura"""
+        db = self.db_factory()
+        db.connect()
+        try:
+            tabelle = list(self.tabelle)
+            righe = db.fetch_query(QUERY_VERSIONE.format(', '.join(['%s'] * len(tabelle))), tabelle)
+        finally:
+            db.disconnect()
+        if righe is None:
+            return
+
+        versioni = {r['Tabella']: r['Versione'] for r in righe}
+        if self._versioni is not None:
+            # Una tabella senza versione (migrazione 007 non applicata) resta affidata al TTL
+            cambiate = [t for t, v in versioni.items() if self._versioni.get(t) != v]
+            tags = {tag for t in cambiate for tag in self.tabelle[t]}
+            if tags:
+                self.invalidate(*tags)
+        self._versioni = versioni
+
+    def cached(self, *tags):
+        """Decoratore per le route: memorizza le risposte 200 con i tag indicati"""
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                key = request.full_path
+                hit = self.get(key)
+                if hit is not None:
+                    body, mimetype = hit
+                    return Response(body, mimetype=mimetype, headers={'X-Cache': 'HIT'})
+
+                generazione = self.generazione(tags)
+                response = view(*args, **kwargs)
+                if isinstance(response, Response) and response.status_code == 200:
+                    self.set(key, (response.get_data(), response.mimetype), tags, generazione)
+                    response.headers['X-Cache'] = 'MISS'
+                return response
+            return wrapper
+        return decorator
+
+    def metrics(self):
+        with self._lock:
+            size = len(self._entries)
+        total = self.hits + self.misses
+        return {
+            'size': size,
+            'max_entries': self.max_entries,
+            'ttl': self.ttl,
+            'versioni_intervallo': self.intervallo if self.tabelle else None,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / total, 3) if total else 0,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations
+        }
@@ -0,0 +1,435 @@
+"""
+Indice in memoria del catalogo prodotti per la ricerca testuale con facet.
+
+Nomi e categorie sono normalizzati (minuscole, senza accenti: "Caffè" trova
+"caffe") e divisi in token. Per ogni token l'indice invertito conserva le
+posizioni dei prodotti in ordine di ID; l'ultimo token della ricerca è un
+prefisso (autocompletamento), risolto con una ricerca binaria sul vocabolario
+ordinato. Peso e categoria sono array NumPy per posizione: filtri e conteggi
+per categoria sono operazioni vettoriali sui soli candidati.
+
+Come l'indice delle posizioni, viene caricato al primo utilizzo (o all'avvio
+del worker, vedi gunicorn.conf.py) e riallineato al più ogni
+CATALOGO_REFRESH_INTERVAL secondi confrontando la versione della tabella
+(trigger della migrazione 002): se sono stati solo aggiunti prodotti vengono
+letti i nuovi ID, altrimenti l'indice è ricostruito.
+
+Benchmark su un catalogo sintetico:
+    python -m backend.catalogo --benchmark --prodotti 1000000
+"""
+import argparse
+import os
+import re
+import sys
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+import numpy as np
+from mysql.connector import Error
+from backend.condizionale import versione_tabelle
+
+QUERY_PRODOTTI = "SELECT ID, nome, peso, categoria FROM Prodotto ORDER BY ID"
+
+QUERY_NUOVI_PRODOTTI = """
+    SELECT ID, nome, peso, categoria FROM Prodotto
+    WHERE ID > %s
+    ORDER BY ID
+"""
+
+# Risultati per pagina se `limit` non è indicato
+LIMITE_PAGINA = 20
+# Completamenti del prefisso restituiti come suggerimenti
+MAX_SUGGERIMENTI = 10
+# Prefissi già risolti tenuti in memoria (l'autocompletamento ripete gli stessi)
+MAX_PREFISSI = 512
+# Sopra n / UNIONE_MASCHERA posizioni l'unione dei termini di un prefisso usa una maschera
+UNIONE_MASCHERA = 1024
+
+TOKEN = re.compile(r'[^\W_]+')
+
+def piega(testo):
+    """Minuscole e senza accenti, per confronti indipendenti da maiuscole e accentate"""
+    scomposto = unicodedata.normalize('NFKD', testo)
+    return ''.join(c for c in scomposto if not unicodedata.combining(c)).casefold()
+
+def tokenizza(testo):
+    return TOKEN.findall(piega(testo))
+
+def _aggiungi(lista, posizione):
+    # Le posizioni nuove sono quasi sempre le più alte: append senza ricerca
+    if not lista or lista[-1] < posizione:
+        lista.append(posizione)
+    else:
+        insort(lista, posizione)
+
+def _rimuovi(lista, posizione):
+    del lista[bisect_left(lista, posizione)]
+
+def _unione(liste, n):
+    """Unione ordinata di array di posizioni in [0, n): con molte posizioni una maschera
+    di n elementi costa meno dell'ordinamento della concatenazione"""
+    totale = sum(len(lista) for lista in liste)
+    if totale * UNIONE_MASCHERA < n:
+        return np.unique(np.concatenate(liste))
+    maschera = np.zeros(n, dtype=bool)
+    for lista in liste:
+        maschera[lista] = True
+    return np.flatnonzero(maschera)
+
+def _interseca(piccolo, grande):
+    """Intersezione di due array ordinati di posizioni, in O(piccolo · log grande)"""
+    indici = np.searchsorted(grande, piccolo)
+    indici[indici == len(grande)] = 0
+    return piccolo[grande[indici] == piccolo]
+
+
+class _Indice:
+    """
+    Dati dell'indice. Le posizioni crescono con l'ID (caricamento ORDER BY ID, poi solo ID
+    maggiori), quindi ogni lista di posizioni è anche ordinata per ID.
+    """
+
+    def __init__(self):
+        self.n = 0
+        self.ids = np.zeros(1024, dtype=np.int64)
+        self.peso = np.zeros(1024)
+        # Codice della categoria per posizione, -1 se il prodotto è stato rimosso
+        self.cat = np.full(1024, -1, dtype=np.int32)
+        self.nomi = []
+        self.token = []
+        self.posizioni = {}
+        self.postings = {}
+        self.categorie = []
+        self.codici = {}
+        self.per_categoria = []
+        self.vocabolario = []
+        self._array = {}
+        self._array_categoria = {}
+        self._prefissi = {}
+        self._tutti = None
+        self._vocabolario_sporco = False
+
+    @property
+    def max_id(self):
+        return int(self.ids[self.n - 1]) if self.n else 0
+
+    def _cresci(self):
+        capacita = len(self.ids) * 2
+        self.ids = np.resize(self.ids, capacita)
+        self.peso = np.resize(self.peso, capacita)
+        cat = np.full(capacita, -1, dtype=np.int32)
+        cat[:self.n] = self.cat[:self.n]
+        self.cat = cat
+
+    def applica(self, righe):
+        """Inserisce o aggiorna i prodotti (righe con ID, nome, peso, categoria)"""
+        for riga in righe:
+            posizione = self.posizioni.get(riga['ID'])
+            if posizione is None:
+                if self.n == len(self.ids):
+                    self._cresci()
+                posizione = self.n
+                self.n += 1
+                self.posizioni[riga['ID']] = posizione
+                self.ids[posizione] = riga['ID']
+                self.nomi.append(None)
+                self.token.append(())
+            else:
+                self._scollega(posizione)
+            self._collega(posizione, riga)
+        self._prefissi.clear()
+        self._tutti = None
+
+    def _collega(self, posizione, riga):
+        token = tuple(set(tokenizza(riga['nome'])))
+        for t in token:
+            lista = self.postings.get(t)
+            if lista is None:
+                lista = self.postings[t] = []
+                self._vocabolario_sporco = True
+            _aggiungi(lista, posizione)
+            self._array.pop(t, None)
+
+        chiave = piega(riga['categoria']).strip()
+        codice = self.codici.get(chiave)
+        if codice is None:
+            codice = self.codici[chiave] = len(self.categorie)
+            self.categorie.append(riga['categoria'])
+            self.per_categoria.append([])
+        _aggiungi(self.per_categoria[codice], posizione)
+        self._array_categoria.pop(codice, None)
+
+        self.nomi[posizione] = riga['nome']
+        self.token[posizione] = token
+        self.peso[posizione] = float(riga['peso'])
+        self.cat[posizione] = codice
+
+    def _scollega(self, posizione):
+        for t in self.token[posizione]:
+            lista = self.postings[t]
+            _rimuovi(lista, posizione)
+            if not lista:
+                del self.postings[t]
+                self._vocabolario_sporco = True
+            self._array.pop(t, None)
+        codice = int(self.cat[posizione])
+        _rimuovi(self.per_categoria[codice], posizione)
+        self._array_categoria.pop(codice, None)
+        self.cat[posizione] = -1
+
+    def _posting(self, token):
+        array = self._array.get(token)
+        if array is None:
+            lista = self.postings.get(token)
+            if lista is None:
+                return None
+            array = self._array[token] = np.array(lista, dtype=np.int64)
+        return array
+
+    def _categoria(self, codice):
+        array = self._array_categoria.get(codice)
+        if array is None:
+            array = self._array_categoria[codice] = np.array(self.per_categoria[codice], dtype=np.int64)
+        return array
+
+    def _prefisso(self, prefisso):
+        """Posizioni dei prodotti con un token che inizia per `prefisso` e completamenti più frequenti"""
+        trovato = self._prefissi.get(prefisso)
+        if trovato is not None:
+            return trovato
+        if self._vocabolario_sporco:
+            self.vocabolario = sorted(self.postings)
+            self._vocabolario_sporco = False
+        inizio = bisect_left(self.vocabolario, prefisso)
+        fine = bisect_left(self.vocabolario, prefisso + '\U0010ffff', inizio)
+        termini = self.vocabolario[inizio:fine]
+        if len(termini) == 1:
+            posizioni = self._posting(termini[0])
+        elif termini:
+            posizioni = _unione([self._posting(t) for t in termini], self.n)
+        else:
+            posizioni = np.zeros(0, dtype=np.int64)
+        suggerimenti = sorted(termini, key=lambda t: -len(self.postings[t]))[:MAX_SUGGERIMENTI]
+        if len(self._prefissi) >= MAX_PREFISSI:
+            self._prefissi.clear()
+        trovato = self._prefissi[prefisso] = (posizioni, suggerimenti)
+        return trovato
+
+    def _attivi(self):
+        if self._tutti is None:
+            self._tutti = np.flatnonzero(self.cat[:self.n] >= 0)
+        return self._tutti
+
+    def cerca(self, q='', categoria=None, max_peso=None, limit=LIMITE_PAGINA, after=None):
+        termini = tokenizza(q or '')
+        suggerimenti = []
+        # None = nessun filtro testuale (tutto il catalogo)
+        candidati = None
+        if termini:
+            # Con uno spazio finale anche l'ultima parola è completa
+            esatti, prefisso = (termini, None) if q[-1].isspace() else (termini[:-1], termini[-1])
+            liste = [self._posting(t) for t in esatti]
+            if prefisso is not None:
+                posizioni, suggerimenti = self._prefisso(prefisso)
+                liste.append(posizioni)
+            if any(lista is None or len(lista) == 0 for lista in liste):
+                candidati = np.zeros(0, dtype=np.int64)
+            else:
+                liste.sort(key=len)
+                candidati = liste[0]
+                for lista in liste[1:]:
+                    candidati = _interseca(candidati, lista)
+
+        if max_peso is not None:
+            if candidati is None:
+                candidati = self._attivi()
+            candidati = candidati[self.peso[candidati] <= max_peso]
+
+        # Facet sui candidati prima del filtro per categoria, come di consueto
+        if candidati is None:
+            conteggi = [len(p) for p in self.per_categoria]
+        else:
+            conteggi = np.bincount(self.cat[candidati], minlength=len(self.categorie)).tolist()
+        facet = {self.categorie[c]: n for c, n in sorted(enumerate(conteggi), key=lambda x: -x[1]) if n}
+
+        if categoria is not None:
+            codice = self.codici.get(piega(categoria).strip())
+            if codice is None:
+                risultati = np.zeros(0, dtype=np.int64)
+            elif candidati is None:
+                risultati = self._categoria(codice)
+            else:
+                risultati = candidati[self.cat[candidati] == codice]
+        else:
+            risultati = self._attivi() if candidati is None else candidati
+
+        inizio = 0
+        if after is not None:
+            inizio = np.searchsorted(risultati, np.searchsorted(self.ids[:self.n], after, side='right'))
+        righe = [{
+            'ID': int(self.ids[p]),
+            'nome': self.nomi[p],
+            'peso': round(float(self.peso[p]), 3),
+            'categoria': self.categorie[self.cat[p]]
+        } for p in risultati[inizio:inizio + limit + 1].tolist()]
+        return righe, len(risultati), facet, suggerimenti
+
+
+class CatalogIndex:
+    """Ricerca nel catalogo prodotti con facet per categoria"""
+
+    def __init__(self, db_factory, refresh_interval=None):
+        self.db_factory = db_factory
+        self.refresh_interval = refresh_interval or float(os.getenv('CATALOGO_REFRESH_INTERVAL', 10))
+        self._indice = None
+        self._versione = None
+        self._synced_at = None
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+
+    def sync(self):
+        """Carica l'indice o lo riallinea: nuovi ID se ci sono stati solo inserimenti, altrimenti da zero"""
+        with self._sync_lock:
+            db = self.db_factory()
+            db.connect()
+            try:
+                versione = versione_tabelle(db, 'Prodotto')
+                versione = int(versione) if versione is not None else None
+                if self._indice is not None and versione is not None and versione == self._versione:
+                    self._synced_at = time.monotonic()
+                    return
+
+                nuovi = None
+                if self._indice is not None:
+                    nuovi = db.fetch_query(QUERY_NUOVI_PRODOTTI, (self._indice.max_id,))
+                    if nuovi is None:
+                        return
+                    # Ogni riga inserita incrementa la versione di 1: una differenza maggiore indica
+                    # modifiche o cancellazioni. Senza versioni si seguono solo gli inserimenti.
+                    if versione is not None and self._versione is not None \
+                            and versione - self._versione != len(nuovi):
+                        nuovi = None
+
+                if nuovi is None:
+                    indice = _Indice()
+                    try:
+                        indice.applica(db.stream_query(QUERY_PRODOTTI))
+                    except Error as e:
+                        # Un indice parziale perderebbe prodotti: resta quello precedente
+                        print(f"Impossibile ricostruire l'indice del catalogo: {e}")
+                        return
+                    with self._lock:
+                        self._indice = indice
+                else:
+                    with self._lock:
+                        self._indice.applica(nuovi)
+            finally:
+                db.disconnect()
+            self._versione = versione
+            self._synced_at = time.monotonic()
+
+    def invalida(self):
+        """Forza il controllo della versione alla prossima ricerca (dopo un import di prodotti)"""
+        self._synced_at = None
+
+    def _ensure_fresh(self):
+        if self._synced_at is None or time.monotonic() - self._synced_at > self.refresh_interval:
+            try:
+                self.sync()
+            except ConnectionError as e:
+                print(f"Impossibile aggiornare l'indice del catalogo: {e}")
+
+    def versione(self):
+        """Versione della tabella Prodotto a cui è allineato l'indice (segnale per gli ETag), se nota"""
+        self._ensure_fresh()
+        return str(self._versione) if self._versione is not None else None
+
+    def cerca(self, q='', categoria=None, max_peso=None, limit=LIMITE_PAGINA, after=None):
+        """
+        Prodotti il cui nome contiene tutte le parole di `q` (l'ultima anche come prefisso),
+        filtrati per categoria e peso massimo, in ordine di ID a partire da `after`.
+        Restituisce le righe (`limit + 1`, per la paginazione), il totale, i conteggi per
+        categoria e i completamenti dell'ultima parola.
+        """
+        self._ensure_fresh()
+        with self._lock:
+            if self._indice is None:
+                return [], 0, {}, []
+            return self._indice.cerca(q, categoria, max_peso, limit, after)
+
+# ============================================
+# BENCHMARK
+# ============================================
+
+def _catalogo_sintetico(prodotti, seed=42):
+    rng = np.random.default_rng(seed)
+    sillabe = ['ca', 'ffè', 'to', 'ma', 'pa', 'ne', 'lu', 'ce', 'ri', 'so', 'ba', 'gno', 'fru', 'tà',
+               'pe', 'sca', 'vi', 'no', 'ol', 'io', 'for', 'mag', 'gio', 'dol', 'sa', 'le', 'zu', 'cchè']
+    parole = sorted({''.join(rng.choice(sillabe, rng.integers(2, 4))) for _ in range(3000)})
+    marche = [f"Marca{chr(65 + i // 26)}{chr(65 + i % 26)}" for i in range(200)]
+    categorie = ['Alimentari', 'Farmacia', 'Elettronica', 'Casa', 'Giardino', 'Libri', 'Sport', 'Giocattoli',
+                 'Abbigliamento', 'Bellezza', 'Animali', 'Ufficio', 'Auto', 'Musica', 'Salute', 'Bevande']
+    p, m, c = rng.integers(0, len(parole), (prodotti, 2)), rng.integers(0, len(marche), prodotti), \
+        rng.integers(0, len(categorie), prodotti)
+    peso = np.round(rng.uniform(0.02, 5.0, prodotti), 3)
+    for i in range(prodotti):
+        yield {'ID': i + 1, 'nome': f"{parole[p[i, 0]].capitalize()} {parole[p[i, 1]]} {marche[m[i]]}",
+               'peso': peso[i], 'categoria': categorie[c[i]]}
+
+def _percentili(durate):
+    durate = sorted(durate)
+    return {'p50_ms': round(durate[len(durate) // 2] * 1000, 3),
+            'p95_ms': round(durate[int(len(durate) * 0.95)] * 1000, 3)}
+
+def benchmark(prodotti=1000000, ricerche=2000, seed=42):
+    """Costruzione dell'indice, aggiornamento incrementale e latenza delle ricerche tipiche"""
+    start = time.perf_counter()
+    indice = _Indice()
+    indice.applica(_catalogo_sintetico(prodotti, seed))
+    risultati = {'prodotti': prodotti, 'costruzione_s': round(time.perf_counter() - start, 2),
+                 'token': len(indice.postings)}
+
+    rng = np.random.default_rng(seed + 1)
+    nomi = [indice.nomi[i] for i in rng.integers(0, indice.n, ricerche)]
+    parole = [n.split() for n in nomi]
+    scenari = {
+        'parola': lambda i: indice.cerca(parole[i][1] + ' '),
+        'prefisso_3': lambda i: indice.cerca(parole[i][0][:3]),
+        'due_parole': lambda i: indice.cerca(f"{parole[i][0]} {parole[i][2][:7]}"),
+        'parola_filtri': lambda i: indice.cerca(parole[i][1], categoria='alimentari', max_peso=2.5),
+        'categoria': lambda i: indice.cerca(categoria='Farmacia', after=i * 10),
+    }
+    for nome, ricerca in scenari.items():
+        indice._prefissi.clear()
+        durate = []
+        for i in range(ricerche):
+            t = time.perf_counter()
+            ricerca(i)
+            durate.append(time.perf_counter() - t)
+        risultati[nome] = _percentili(durate)
+
+    nuovi = [dict(r, ID=r['ID'] + prodotti) for r in _catalogo_sintetico(500, seed + 2)]
+    start = time.perf_counter()
+    indice.applica(nuovi)
+    risultati['aggiornamento_500_ms'] = round((time.perf_counter() - start) * 1000, 2)
+    return risultati
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Indice di ricerca del catalogo prodotti")
+    parser.add_argument('--benchmark', action='store_true')
+    parser.add_argument('--prodotti', type=int, default=1000000)
+    parser.add_argument('--ricerche', type=int, default=2000)
+    args = parser.parse_args(argv)
+
+    if not args.benchmark:
+        parser.print_help()
+        return 0
+    for chiave, valore in benchmark(args.prodotti, args.ricerche).items():
+        print(f"{chiave:<24}{valore}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,78 @@
+"""
+Compressione gzip/brotli delle risposte testuali sopra una soglia di dimensione.
+
+Brotli è usato se il modulo `brotli` è installato e il client lo accetta,
+altrimenti gzip. Le risposte in streaming (NDJSON, SSE, export) non vengono
+toccate: sono inviate a blocchi man mano che vengono prodotte.
+"""
+import gzip
+import os
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', 1024))
+COMPRESS_LEVEL = int(os.getenv('COMPRESS_LEVEL', 6))
+
+TIPI_COMPRIMIBILI = (
+    'application/json', 'text/html', 'text/css', 'text/plain',
+    'text/javascript', 'application/javascript', 'text/csv'
+)
+
+def scegli_codifica(accept_encoding):
+    """'br', 'gzip' o None in base all'header Accept-Encoding del client"""
+    accettate = {}
+    for parte in (accept_encoding or '').split(','):
+        nome, _, parametri = parte.strip().partition(';')
+        q = 1.0
+        if parametri.strip().startswith('q='):
+            try:
+                q = float(parametri.strip()[2:])
+            except ValueError:
+                q = 0.0
+        accettate[nome.strip().lower()] = q
+    if brotli is not None and accettate.get('br', 0) > 0:
+        return 'br'
+    if accettate.get('gzip', 0) > 0:
+        return 'gzip'
+    return None
+
+def comprimi(body, codifica):
+    if codifica == 'br':
+        # Qualità 4: rapporto migliore di gzip -6 con tempi simili
+        return brotli.compress(body, quality=4)
+    return gzip.compress(body, compresslevel=COMPRESS_LEVEL, mtime=0)
+
+def comprimibile(status, mimetype, size, headers):
+    return (
+        status == 200
+        and size >= COMPRESS_MIN_SIZE
+        and mimetype in TIPI_COMPRIMIBILI
+        and 'Content-Encoding' not in headers
+    )
+
+def init_app(app):
+    """Registra la compressione delle risposte come hook after_request"""
+    from flask import request
+
+    @app.after_request
+    def _comprimi(response):
+        if response.direct_passthrough or response.is_streamed:
+            return response
+        response.vary.add('Accept-Encoding')
+        codifica = scegli_codifica(request.headers.get('Accept-Encoding'))
+        if codifica is None:
+            return response
+        body = response.get_data()
+        if not comprimibile(response.status_code, response.mimetype, len(body), response.headers):
+            return response
+
+        response.set_data(comprimi(body, codifica))
+        response.headers['Content-Encoding'] = codifica
+        # Un ETag forte identifica i byte inviati: dopo la compressione resta valido solo come debole
+        etag, debole = response.get_etag()
+        if etag and not debole:
+            response.set_etag(etag, weak=True)
+        return response
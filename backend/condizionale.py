@@ -0,0 +1,75 @@
+"""
+GET condizionali per le liste lette spesso (droni, catalogo prodotti, tracce).
+
+Prima di eseguire la query la route legge un segnale economico che cambia a
+ogni modifica dei dati (la versione della tabella mantenuta dai trigger della
+migrazione 002, oppure conteggio e ultimo TIMESTAMP delle tracce di una
+missione). L'ETag è calcolato da segnale e URL: se coincide con If-None-Match
+la risposta è un 304 senza query né serializzazione.
+"""
+import hashlib
+import os
+from functools import wraps
+from flask import Response, request
+
+# Politiche Cache-Control configurabili da .env
+CACHE_CONTROL = {
+    'catalogo': os.getenv('CACHE_CONTROL_CATALOGO', 'public, max-age=300'),
+    'droni': os.getenv('CACHE_CONTROL_DRONI', 'no-cache'),
+    'tracce': os.getenv('CACHE_CONTROL_TRACCE', 'no-cache'),
+}
+
+QUERY_VERSIONE = "SELECT Tabella, Versione FROM VersioneTabella WHERE Tabella IN ({})"
+
+QUERY_SEGNALE_TRACCE = """
+    SELECT COUNT(*) as Punti, MAX(TIMESTAMP) as Ultimo
+    FROM Traccia
+    WHERE ID_Missione = %s
+"""
+
+def versione_tabelle(db, *tabelle):
+    """Versioni delle tabelle indicate, None se la tabella delle versioni non è disponibile"""
+    righe = db.fetch_query(QUERY_VERSIONE.format(', '.join(['%s'] * len(tabelle))), tabelle)
+    if not righe or len(righe) != len(tabelle):
+        return None
+    versioni = {r['Tabella']: r['Versione'] for r in righe}
+    return '.'.join(str(versioni[t]) for t in tabelle)
+
+def segnale_tracce(db, id_missione):
+    """Numero di punti e ultimo TIMESTAMP delle tracce di una missione (dall'indice, senza leggere le righe)"""
+    riga = db.fetch_one(QUERY_SEGNALE_TRACCE, (id_missione,))
+    if riga is None:
+        return None
+    return f"{riga['Punti']}.{riga['Ultimo'].isoformat() if riga['Ultimo'] else ''}"
+
+def calcola_etag(segnale, chiave):
+    """ETag debole: lo stesso contenuto può essere inviato compresso o meno"""
+    return hashlib.sha1(f"{chiave}|{segnale}".encode('utf-8')).hexdigest()[:20]
+
+def condizionale(politica, segnale):
+    """
+    Decoratore per le route GET: `segnale(**kwargs)` restituisce il token di versione dei dati
+    (None se non disponibile: la route risponde normalmente, senza ETag).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            token = segnale(**kwargs)
+            if token is None:
+                response = view(*args, **kwargs)
+                if isinstance(response, Response) and response.status_code == 200:
+                    response.headers['Cache-Control'] = CACHE_CONTROL[politica]
+                return response
+
+            etag = calcola_etag(token, request.full_path)
+            if request.if_none_match.contains_weak(etag):
+                response = Response(status=304)
+            else:
+                response = view(*args, **kwargs)
+                if not isinstance(response, Response) or response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            response.headers['Cache-Control'] = CACHE_CONTROL[politica]
+            return response
+        return wrapper
+    return decorator
@@ -1,13 +1,132 @@
 import mysql.connector
 from mysql.connector import Error
+from mysql.connector.constants import ClientFlag
 import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
 from dotenv import load_dotenv
 
 # Carica le variabili d'ambiente dal file .env
 load_dotenv()
 
+# Funzioni chiamate dopo ogni istruzione SQL: hook(query, secondi, righe, errore)
+query_hooks = []
+
+def notify_query(query, start, rows, error):
+    if not query_hooks:
+        return
+    elapsed = time.perf_counter() - start
+    for hook in query_hooks:
+        try:
+            hook(query, elapsed, rows, error)
+        except Exception as e:
+            print(f"Errore in un hook delle query: {e}")
+
+class ConnectionPool:
+    """
+    Pool di connessioni MySQL a dimensione fissa.
+
+    Le connessioni vengono aperte in modo pigro (al primo utilizzo) e riutilizzate
+    tra le richieste, evitando l'handshake TLS a ogni chiamata. Se tutte le
+    connessioni sono occupate si attende al massimo `timeout` secondi.
+    """
+
+    def __init__(self, size=None, timeout=None):
+        self.size = size if size is not None else int(os.getenv('DB_POOL_SIZE', 5))
+        self.timeout = timeout if timeout is not None else float(os.getenv('DB_POOL_TIMEOUT', 10))
+        self._params = None
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._lock = threading.Lock()
+
+        # Metriche
+        self.in_use = 0
+        self.created = 0
+        self.reconnects = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.timeouts = 0
+
+    def _open(self, params):
+        connection = mysql.connector.connect(**params)
+        with self._lock:
+            self.created += 1
+        return connection
+
+    def acquire(self, params):
+        """Preleva una connessione sana dal pool, attendendo se necessario"""
+        self._params = params
+        if not self._slots.acquire(blocking=False):
+            start = time.monotonic()
+            ok = self._slots.acquire(timeout=self.timeout)
+            with self._lock:
+                self.waits += 1
+                self.wait_time += time.monotonic() - start
+                if not ok:
+                    self.timeouts += 1
+            if not ok:
+                raise ConnectionError(f"Nessuna connessione disponibile nel pool entro {self.timeout}s")
+
+        try:
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                connection = self._open(params)
+            else:
+                # Health check: riconnette se il server ha chiuso la connessione
+                try:
+                    connection.ping(reconnect=False)
+                except Error:
+                    try:
+                        connection.close()
+                    except Error:
+                        pass
+                    connection = self._open(params)
+                    with self._lock:
+                        self.reconnects += 1
+        except Error as e:
+            self._slots.release()
+            raise ConnectionError(f"Connessione al database fallita: {e}") from e
+
+        with self._lock:
+            self.in_use += 1
+        return connection
+
+    def release(self, connection):
+        """Restituisce una connessione al pool (o la scarta se non è più valida)"""
+        try:
+            if connection.in_transaction:
+                connection.rollback()
+            self._idle.put(connection)
+        except Error:
+            try:
+                connection.close()
+            except Error:
+                pass
+        finally:
+            with self._lock:
+                self.in_use -= 1
+            self._slots.release()
+
+    def metrics(self):
+        """Restituisce lo stato corrente del pool"""
+        with self._lock:
+            return {
+                'size': self.size,
+                'in_use': self.in_use,
+                'idle': self._idle.qsize(),
+                'created': self.created,
+                'reconnects': self.reconnects,
+                'waits': self.waits,
+                'wait_time_ms': round(self.wait_time * 1000, 2),
+                'timeouts': self.timeouts
+            }
+
+
 class Database:
-    def __init__(self):
+    def __init__(self, pool=None):
         self.host = os.getenv('DB_HOST')
         db_port_str = os.getenv('DB_PORT')
         if not db_port_str:
@@ -19,19 +138,35 @@ class Database:
         self.database = os.getenv('DB_NAME')
         self.user = os.getenv('DB_USER')
         self.password = os.getenv('DB_PASSWORD')
+        self.pool = pool
         self.connection = None
+        self._in_transaction = False
+
+    def _params(self):
+        params = {
+            'host': self.host,
+            'port': self.port,
+            'database': self.database,
+            'user': self.user,
+            'password': self.password,
+            'ssl_disabled': False,
+            # rowcount conta le righe trovate, non solo quelle modificate
+            'client_flags': [ClientFlag.FOUND_ROWS]
+        }
+        # Con la CA del server (es. ca.pem di Aiven) verifica certificato e nome host
+        ca = os.getenv('DB_SSL_CA')
+        if ca:
+            params.update(ssl_ca=ca, ssl_verify_cert=True, ssl_verify_identity=True)
+        return params
     
     def connect(self):
-        """Crea una connessione al database"""
+        """Crea una connessione al database (o la preleva dal pool, se configurato)"""
+        if self.pool is not None:
+            self.connection = self.pool.acquire(self._params())
+            return
+
         try:
-            self.connection = mysql.connector.connect(
-                host=self.host,
-                port=self.port,
-                database=self.database,
-                user=self.user,
-                password=self.password,
-                ssl_disabled=False
-            )
+            self.connection = mysql.connector.connect(**self._params())
             if self.connection.is_connected():
                 print("Connessione al database MySQL riuscita")
         except Error as e:
@@ -40,7 +175,13 @@ class Database:
             raise ConnectionError(f"Connessione al database fallita: {e}") from e
     
     def disconnect(self):
-        """Chiude la connessione al database"""
+        """Chiude la connessione al database (o la restituisce al pool)"""
+        if self.pool is not None:
+            if self.connection is not None:
+                self.pool.release(self.connection)
+                self.connection = None
+            return
+
         if self.connection and self.connection.is_connected():
             self.connection.close()
             print("Connessione al database MySQL chiusa")
@@ -51,37 +192,74 @@ class Database:
             raise ConnectionError("Connessione al database non disponibile. Controllare le credenziali e la raggiungibilità del server.")
 
         cursor = self.connection.cursor()
+        start, rows, error = time.perf_counter(), None, False
         try:
             if params:
                 cursor.execute(query, params)
             else:
                 cursor.execute(query)
-            self.connection.commit()
+            if not self._in_transaction:
+                self.connection.commit()
+            rows = cursor.rowcount
             return cursor.lastrowid
         except Error as e:
+            error = True
             print(f"Errore durante l'esecuzione della query: {e}")
+            if self._in_transaction:
+                raise
             return None
         finally:
             cursor.close()
+            notify_query(query, start, rows, error)
     
+    def execute_rowcount(self, query, params=None):
+        """Esegue una query di modifica e restituisce il numero di righe coinvolte"""
+        if not self.connection:
+            raise ConnectionError("Connessione al database non disponibile. Controllare le credenziali e la raggiungibilità del server.")
+
+        cursor = self.connection.cursor()
+        start, rows, error = time.perf_counter(), None, False
+        try:
+            if params:
+                cursor.execute(query, params)
+            else:
+                cursor.execute(query)
+            if not self._in_transaction:
+                self.connection.commit()
+            rows = cursor.rowcount
+            return rows
+        except Error as e:
+            error = True
+            print(f"Errore durante l'esecuzione della query: {e}")
+            if self._in_transaction:
+                raise
+            return None
+        finally:
+            cursor.close()
+            notify_query(query, start, rows, error)
+
     def fetch_query(self, query, params=None):
         """Esegue una query di lettura (SELECT) e restituisce i risultati"""
         if not self.connection:
             raise ConnectionError("Connessione al database non disponibile. Controllare le credenziali e la raggiungibilità del server.")
 
         cursor = self.connection.cursor(dictionary=True)
+        start, rows, error = time.perf_counter(), None, False
         try:
             if params:
                 cursor.execute(query, params)
             else:
                 cursor.execute(query)
             result = cursor.fetchall()
+            rows = len(result)
             return result
         except Error as e:
+            error = True
             print(f"Errore durante l'esecuzione della query: {e}")
             return None
         finally:
             cursor.close()
+            notify_query(query, start, rows, error)
     
     def fetch_one(self, query, params=None):
         """Esegue una query di lettura (SELECT) e restituisce un singolo risultato"""
@@ -89,15 +267,100 @@ class Database:
             raise ConnectionError("Connessione al database non disponibile. Controllare le credenziali e la raggiungibilità del server.")
 
         cursor = self.connection.cursor(dictionary=True)
+        start, rows, error = time.perf_counter(), None, False
         try:
             if params:
                 cursor.execute(query, params)
             else:
                 cursor.execute(query)
             result = cursor.fetchone()
+            rows = 1 if result else 0
             return result
         except Error as e:
+            error = True
+            print(f"Errore durante l'esecuzione della query: {e}")
+            return None
+        finally:
+            cursor.close()
+            notify_query(query, start, rows, error)
+
+    @contextmanager
+    def transaction(self):
+        """
+        Esegue più query di modifica in un'unica transazione:
+        commit alla fine del blocco, rollback se si verifica un errore.
+        """
+        if not self.connection:
+            raise ConnectionError("Connessione al database non disponibile. Controllare le credenziali e la raggiungibilità del server.")
+
+        self.connection.start_transaction()
+        self._in_transaction = True
+        try:
+            yield self
+            self.connection.commit()
+        except Exception:
+            self.connection.rollback()
+            raise
+        finally:
+            self._in_transaction = False
+
+    def stream_query(self, query, params=None, batch_size=500):
+        """
+        Esegue una query di lettura (SELECT) con cursore non bufferizzato e
+        restituisce le righe una alla volta, leggendole a blocchi di `batch_size`.
+        Un errore durante la lettura viene rilanciato: chi trasmette le righe deve
+        interrompere la risposta invece di chiuderla come se fosse completa.
+        """
+        if not self.connection:
+            raise ConnectionError("Connessione al database non disponibile. Controllare le credenziali e la raggiungibilità del server.")
+
+        cursor = self.connection.cursor(dictionary=True, buffered=False)
+        start, count, error = time.perf_counter(), 0, False
+        try:
+            if params:
+                cursor.execute(query, params)
+            else:
+                cursor.execute(query)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                count += len(rows)
+                yield from rows
+        except Error as e:
+            error = True
+            print(f"Errore durante l'esecuzione della query: {e}")
+            raise
+        finally:
+            # Un cursore non bufferizzato deve essere svuotato prima di riusare la connessione
+            try:
+                while cursor.fetchmany(batch_size):
+                    pass
+            except Error:
+                pass
+            cursor.close()
+            notify_query(query, start, count, error)
+
+    def execute_many(self, query, rows):
+        """Esegue una query di modifica su più righe (INSERT multi-riga) in un'unica transazione (o in quella in corso)"""
+        if not self.connection:
+            raise ConnectionError("Connessione al database non disponibile. Controllare le credenziali e la raggiungibilità del server.")
+
+        cursor = self.connection.cursor()
+        start, count, error = time.perf_counter(), None, False
+        try:
+            cursor.executemany(query, rows)
+            if not self._in_transaction:
+                self.connection.commit()
+            count = cursor.rowcount
+            return count
+        except Error as e:
+            error = True
             print(f"Errore durante l'esecuzione della query: {e}")
+            if self._in_transaction:
+                raise
+            self.connection.rollback()
             return None
         finally:
             cursor.close()
+            notify_query(query, start, count, error)
@@ -0,0 +1,111 @@
+"""
+Accesso asincrono al database (aiomysql) per le route ASGI.
+
+Il pool viene creato al primo utilizzo nell'event loop del processo; query
+indipendenti possono essere eseguite in parallelo con asyncio.gather, ognuna
+su una propria connessione del pool.
+"""
+import asyncio
+import contextvars
+import os
+import ssl
+import time
+import aiomysql
+from pymysql.constants import CLIENT
+from pymysql.err import MySQLError
+from dotenv import load_dotenv
+from backend.db import notify_query
+
+load_dotenv()
+
+# Tempo speso nel database dalla richiesta asincrona corrente ([secondi], impostato dalla route)
+tempo_db = contextvars.ContextVar('tempo_db', default=None)
+
+class AsyncDatabase:
+    """Pool di connessioni aiomysql con le stesse convenzioni di Database (errori stampati, None)"""
+
+    def __init__(self, size=None):
+        self.size = size or int(os.getenv('DB_ASYNC_POOL_SIZE', 10))
+        self._pool = None
+        self._lock = None
+
+    def _params(self):
+        # Con DB_SSL_CA il certificato del server e il nome host vengono verificati, come nel
+        # connettore sincrono; senza, TLS cifra la connessione ma non autentica il server
+        ca = os.getenv('DB_SSL_CA')
+        if ca:
+            contesto = ssl.create_default_context(cafile=ca)
+        else:
+            contesto = ssl.create_default_context()
+            contesto.check_hostname = False
+            contesto.verify_mode = ssl.CERT_NONE
+        return {
+            'host': os.getenv('DB_HOST'),
+            'port': int(os.getenv('DB_PORT') or 3306),
+            'db': os.getenv('DB_NAME'),
+            'user': os.getenv('DB_USER'),
+            'password': os.getenv('DB_PASSWORD') or '',
+            'ssl': contesto,
+            'autocommit': True,
+            # rowcount conta le righe trovate, non solo quelle modificate
+            'client_flag': CLIENT.FOUND_ROWS,
+            'minsize': 1,
+            'maxsize': self.size,
+            'pool_recycle': 3600
+        }
+
+    async def pool(self):
+        if self._pool is None:
+            if self._lock is None:
+                self._lock = asyncio.Lock()
+            async with self._lock:
+                if self._pool is None:
+                    try:
+                        self._pool = await aiomysql.create_pool(**self._params())
+                    except (MySQLError, OSError) as e:
+                        raise ConnectionError(f"Connessione al database fallita: {e}") from e
+        return self._pool
+
+    async def _execute(self, query, params, fetch):
+        pool = await self.pool()
+        start, rows, error = time.perf_counter(), None, False
+        try:
+            async with pool.acquire() as connection:
+                async with connection.cursor(aiomysql.DictCursor) as cursor:
+                    await cursor.execute(query, params)
+                    if fetch == 'one':
+                        result = await cursor.fetchone()
+                        rows = 1 if result else 0
+                    elif fetch == 'rowcount':
+                        result = rows = cursor.rowcount
+                    else:
+                        result = list(await cursor.fetchall())
+                        rows = len(result)
+                    return result
+        except MySQLError as e:
+            error = True
+            print(f"Errore durante l'esecuzione della query: {e}")
+            return None
+        finally:
+            totale = tempo_db.get()
+            if totale is not None:
+                totale[0] += time.perf_counter() - start
+            notify_query(query, start, rows, error)
+
+    async def fetch_query(self, query, params=None):
+        """Esegue una query di lettura (SELECT) e restituisce i risultati"""
+        return await self._execute(query, params, 'all')
+
+    async def fetch_one(self, query, params=None):
+        """Esegue una query di lettura (SELECT) e restituisce un singolo risultato"""
+        return await self._execute(query, params, 'one')
+
+    async def execute_rowcount(self, query, params=None):
+        """Esegue una query di scrittura (autocommit) e restituisce il numero di righe trovate"""
+        return await self._execute(query, params, 'rowcount')
+
+    async def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            await self._pool.wait_closed()
+            self._pool = None
@@ -0,0 +1,249 @@
+"""
+Previsione della domanda oraria per il dimensionamento dei turni.
+
+Gli ordini sono aggregati nella tabella DomandaOraria per giorno, ora, Tipo e
+zona di consegna (cella di ZONA_GRADI gradi attorno al punto di consegna della
+missione). La tabella è aggiornata in modo incrementale a ogni nuovo ordine;
+la previsione legge solo le ultime `settimane` di bucket, mai tutto lo storico.
+
+Il modello è stagionale (giorno della settimana × ora del giorno) con trend
+lineare, stimato ai minimi quadrati con NumPy sulla serie oraria.
+
+Ricostruzione completa e previsione da riga di comando:
+    python -m backend.domanda --rebuild
+    python -m backend.domanda --settimane 8 --tipo express
+"""
+import argparse
+import math
+import os
+import sys
+from datetime import datetime, timedelta
+from decimal import Decimal
+import numpy as np
+from backend.db import Database
+
+# Lato della cella di zona in gradi (circa 2 km); usato anche dalla migrazione 003
+ZONA_GRADI = Decimal('0.02')
+
+SETTIMANE_STORICO = int(os.getenv('DOMANDA_SETTIMANE', 12))
+ORE_SETTIMANA = 7 * 24
+ORIZZONTE_ORE = ORE_SETTIMANA
+
+# Zone restituite nella ripartizione della previsione
+MAX_ZONE = 10
+
+QUERY_REBUILD = f"""
+    INSERT INTO DomandaOraria (Giorno, Ora, Tipo, CellaLat, CellaLon, NumOrdini, PesoTotale)
+    SELECT DATE(o.Orario), HOUR(o.Orario), o.Tipo,
+           FLOOR(m.LatConsegna / {ZONA_GRADI}), FLOOR(m.LongConsegna / {ZONA_GRADI}),
+           COUNT(*), SUM(o.PesoTotale)
+    FROM Ordine o
+    JOIN Missioni m ON o.ID_Missione = m.ID
+    GROUP BY DATE(o.Orario), HOUR(o.Orario), o.Tipo,
+             FLOOR(m.LatConsegna / {ZONA_GRADI}), FLOOR(m.LongConsegna / {ZONA_GRADI})
+"""
+
+def zona(lat, lon):
+    """Cella di zona (indici interi) di un punto di consegna, con la stessa aritmetica decimale di MySQL"""
+    return math.floor(Decimal(str(lat)) / ZONA_GRADI), math.floor(Decimal(str(lon)) / ZONA_GRADI)
+
+def parse_zona(valore):
+    """Interpreta una zona nel formato 'CellaLat:CellaLon' (ValueError se non valida)"""
+    cella_lat, _, cella_lon = valore.partition(':')
+    return int(cella_lat), int(cella_lon)
+
+def registra_ordine(db, orario, tipo, lat_consegna, lon_consegna, peso):
+    """Da chiamare dopo l'inserimento di un nuovo ordine, nella stessa transazione"""
+    cella_lat, cella_lon = zona(lat_consegna, lon_consegna)
+    db.execute_query("""
+        INSERT INTO DomandaOraria (Giorno, Ora, Tipo, CellaLat, CellaLon, NumOrdini, PesoTotale)
+        VALUES (%s, %s, %s, %s, %s, 1, %s)
+        ON DUPLICATE KEY UPDATE
+            NumOrdini = NumOrdini + 1,
+            PesoTotale = PesoTotale + VALUES(PesoTotale)
+    """, (orario.date(), orario.hour, tipo, cella_lat, cella_lon, peso))
+
+def registra_ordini(db, ids):
+    """Da chiamare dopo l'inserimento di un blocco di ordini (import), nella stessa transazione"""
+    db.execute_query(f"""
+        INSERT INTO DomandaOraria (Giorno, Ora, Tipo, CellaLat, CellaLon, NumOrdini, PesoTotale)
+        SELECT * FROM (
+            SELECT DATE(o.Orario) as G, HOUR(o.Orario) as H, o.Tipo as T,
+                   FLOOR(m.LatConsegna / {ZONA_GRADI}) as CLat, FLOOR(m.LongConsegna / {ZONA_GRADI}) as CLon,
+                   COUNT(*) as N, SUM(o.PesoTotale) as P
+            FROM Ordine o
+            JOIN Missioni m ON o.ID_Missione = m.ID
+            WHERE o.ID IN ({', '.join(['%s'] * len(ids))})
+            GROUP BY G, H, T, CLat, CLon
+        ) nuovi
+        ON DUPLICATE KEY UPDATE
+            NumOrdini = NumOrdini + VALUES(NumOrdini),
+            PesoTotale = PesoTotale + VALUES(PesoTotale)
+    """, list(ids))
+
+def rebuild(db):
+    """Ricalcola da zero DomandaOraria a partire da Ordine e Missioni, con una sola query aggregata"""
+    with db.transaction():
+        db.execute_query("DELETE FROM DomandaOraria")
+        db.execute_query(QUERY_REBUILD)
+
+# ============================================
+# MODELLO
+# ============================================
+
+def _filtri(tipo, zona_filtro):
+    where, params = "", []
+    if tipo:
+        where += " AND Tipo = %s"
+        params.append(tipo)
+    if zona_filtro:
+        where += " AND CellaLat = %s AND CellaLon = %s"
+        params.extend(zona_filtro)
+    return where, params
+
+def serie_oraria(db, inizio, ore, tipo=None, zona_filtro=None):
+    """Ordini per ora a partire da `inizio` (datetime all'ora esatta), ore senza ordini a zero"""
+    fine = inizio + timedelta(hours=ore)
+    where, params = _filtri(tipo, zona_filtro)
+    righe = db.fetch_query(f"""
+        SELECT Giorno, Ora, SUM(NumOrdini) as Ordini
+        FROM DomandaOraria
+        WHERE Giorno >= %s AND Giorno <= %s{where}
+        GROUP BY Giorno, Ora
+    """, [inizio.date(), fine.date()] + params) or []
+
+    serie = np.zeros(ore)
+    for r in righe:
+        indice = int((datetime.combine(r['Giorno'], datetime.min.time()) - inizio).total_seconds() // 3600) + r['Ora']
+        if 0 <= indice < ore:
+            serie[indice] = float(r['Ordini'])
+    return serie
+
+def adatta(serie, inizio):
+    """
+    Stima y[t] = stagione[giorno_settimana, ora] + trend * t ai minimi quadrati.
+    Restituisce (stagione, trend, rmse) con stagione indicizzata da weekday * 24 + ora.
+    """
+    n = len(serie)
+    slot = (inizio.weekday() * 24 + inizio.hour + np.arange(n)) % ORE_SETTIMANA
+    # Trend centrato sulla finestra, in ore: la stagione resta la media del periodo
+    t = np.arange(n) - (n - 1) / 2
+
+    X = np.zeros((n, ORE_SETTIMANA + 1))
+    X[np.arange(n), slot] = 1.0
+    X[:, -1] = t
+    # Con meno di due settimane il trend non è identificabile: solo stagione
+    if n < 2 * ORE_SETTIMANA:
+        X = X[:, :-1]
+
+    coeff, *_ = np.linalg.lstsq(X, serie, rcond=None)
+    stagione = coeff[:ORE_SETTIMANA]
+    trend = coeff[ORE_SETTIMANA] if X.shape[1] > ORE_SETTIMANA else 0.0
+    rmse = float(np.sqrt(np.mean((X @ coeff - serie) ** 2))) if n else 0.0
+    return stagione, float(trend), rmse
+
+def prevedi(db, adesso=None, settimane=None, tipo=None, zona_filtro=None):
+    """Previsione oraria dei prossimi 7 giorni, con totali giornalieri e ripartizione per zona e Tipo"""
+    settimane = settimane or SETTIMANE_STORICO
+    adesso = (adesso or datetime.now()).replace(minute=0, second=0, microsecond=0)
+    ore_storico = settimane * ORE_SETTIMANA
+    inizio_storico = adesso - timedelta(hours=ore_storico)
+
+    serie = serie_oraria(db, inizio_storico, ore_storico, tipo, zona_filtro)
+    # La finestra parte dal primo ordine: le ore precedenti all'avvio del servizio non sono domanda nulla
+    attive = np.flatnonzero(serie)
+    primo = int(attive[0]) if len(attive) else ore_storico
+    serie = serie[primo:]
+    stagione, trend, rmse = adatta(serie, inizio_storico + timedelta(hours=primo))
+
+    # Ore future a partire dall'ora corrente, proseguendo l'asse del trend della finestra
+    n = len(serie)
+    futuro = np.arange(ORIZZONTE_ORE)
+    slot = (adesso.weekday() * 24 + adesso.hour + futuro) % ORE_SETTIMANA
+    t = n + futuro - (n - 1) / 2
+    previsione = np.clip(stagione[slot] + trend * t, 0, None)
+
+    ore = [
+        {'ora': adesso + timedelta(hours=int(h)), 'ordini': round(float(v), 2)}
+        for h, v in zip(futuro, previsione)
+    ]
+    giorni = {}
+    for h, v in zip(futuro, previsione):
+        giorno = (adesso + timedelta(hours=int(h))).date()
+        giorni[giorno] = giorni.get(giorno, 0.0) + float(v)
+
+    totale = float(previsione.sum())
+    storico = float(serie.sum())
+    where, params = _filtri(tipo, zona_filtro)
+    return {
+        'previsione_settimanale': round(totale),
+        'media_giornaliera': round(totale / 7, 1),
+        'totale_storico': int(storico),
+        'settimane_storico': settimane,
+        # Variazione del totale settimanale da una settimana alla successiva
+        'trend_settimanale': round(trend * ORE_SETTIMANA ** 2, 1),
+        'rmse_orario': round(rmse, 3),
+        'ore': ore,
+        'giorni': [{'giorno': g, 'ordini': round(v, 1)} for g, v in giorni.items()],
+        'zone': _ripartizione(db, """
+            SELECT CellaLat, CellaLon, SUM(NumOrdini) as Ordini
+            FROM DomandaOraria
+            WHERE Giorno >= %s{where}
+            GROUP BY CellaLat, CellaLon
+            ORDER BY Ordini DESC
+            LIMIT {limite}
+        """.format(where=where, limite=MAX_ZONE), [inizio_storico.date()] + params, storico, totale, _zona_dict),
+        'tipi': _ripartizione(db, """
+            SELECT Tipo, SUM(NumOrdini) as Ordini
+            FROM DomandaOraria
+            WHERE Giorno >= %s{where}
+            GROUP BY Tipo
+            ORDER BY Ordini DESC
+        """.format(where=where), [inizio_storico.date()] + params, storico, totale, lambda r: {'tipo': r['Tipo']})
+    }
+
+def _zona_dict(r):
+    return {
+        'zona': f"{r['CellaLat']}:{r['CellaLon']}",
+        'lat': round((r['CellaLat'] + 0.5) * float(ZONA_GRADI), 4),
+        'lon': round((r['CellaLon'] + 0.5) * float(ZONA_GRADI), 4)
+    }
+
+def _ripartizione(db, query, params, storico, totale, chiave):
+    """Quota storica di ogni gruppo, applicata al totale previsto"""
+    if not storico:
+        return []
+    risultati = []
+    for r in db.fetch_query(query, params) or []:
+        quota = float(r['Ordini']) / storico
+        risultati.append(dict(chiave(r), quota=round(quota, 3), previsione_settimanale=round(quota * totale, 1)))
+    return risultati
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Previsione della domanda oraria")
+    parser.add_argument('--rebuild', action='store_true', help="ricostruisce DomandaOraria da Ordine")
+    parser.add_argument('--settimane', type=int, default=SETTIMANE_STORICO)
+    parser.add_argument('--tipo')
+    parser.add_argument('--zona', type=parse_zona, help="cella 'CellaLat:CellaLon'")
+    args = parser.parse_args(argv)
+
+    db = Database()
+    db.connect()
+    try:
+        if args.rebuild:
+            rebuild(db)
+            print("DomandaOraria ricostruita")
+            return 0
+        risultato = prevedi(db, settimane=args.settimane, tipo=args.tipo, zona_filtro=args.zona)
+        for giorno in risultato['giorni']:
+            print(f"{giorno['giorno']}  {giorno['ordini']:>8.1f}")
+        print(f"Totale settimana: {risultato['previsione_settimanale']} "
+              f"(trend {risultato['trend_settimanale']:+} ordini/settimana)")
+        return 0
+    finally:
+        db.disconnect()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
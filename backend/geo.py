@@ -0,0 +1,101 @@
+"""
+Funzioni geometriche sulle tracce GPS: distanze, semplificazione dei percorsi
+(Douglas-Peucker) ed encoded polyline, vettorizzate con NumPy.
+"""
+import numpy as np
+
+# Metri per grado di latitudine (approssimazione sferica locale)
+METRI_PER_GRADO = 111320.0
+
+# Raggio medio terrestre in metri
+RAGGIO_TERRA = 6371008.8
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Distanza in metri tra coppie di punti (array NumPy o scalari)"""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=float)) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * RAGGIO_TERRA * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def to_local_xy(lat, lon):
+    """Proietta lat/long in metri su un piano equirettangolare centrato sulla traccia"""
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    cos_lat = np.cos(np.radians(lat.mean())) if lat.size else 1.0
+    return lon * METRI_PER_GRADO * cos_lat, lat * METRI_PER_GRADO
+
+def dp_importance(x, y):
+    """
+    Importanza di ogni punto secondo Douglas-Peucker: la massima tolleranza
+    (in metri) per cui il punto verrebbe mantenuto. Gli estremi valgono infinito.
+    Selezionare i punti con importanza > t equivale a Douglas-Peucker con tolleranza t.
+    """
+    n = len(x)
+    importance = np.zeros(n)
+    if n == 0:
+        return importance
+    importance[0] = importance[-1] = np.inf
+
+    stack = [(0, n - 1, np.inf)]
+    while stack:
+        start, end, parent = stack.pop()
+        if end - start < 2:
+            continue
+
+        # Distanze perpendicolari dal segmento start-end, calcolate in blocco
+        dx, dy = x[end] - x[start], y[end] - y[start]
+        px, py = x[start + 1:end] - x[start], y[start + 1:end] - y[start]
+        length = np.hypot(dx, dy)
+        if length == 0:
+            dist = np.hypot(px, py)
+        else:
+            dist = np.abs(dx * py - dy * px) / length
+
+        i = int(np.argmax(dist))
+        split = start + 1 + i
+        # Un punto non può essere più importante del punto che ha generato il suo segmento
+        value = min(float(dist[i]), parent)
+        importance[split] = value
+        stack.append((start, split, value))
+        stack.append((split, end, value))
+    return importance
+
+def simplify_mask(lat, lon, tolerance=None, max_points=None):
+    """
+    Maschera booleana dei punti da mantenere.
+    `tolerance` è in metri; `max_points` mantiene i punti più significativi.
+    """
+    x, y = to_local_xy(lat, lon)
+    importance = dp_importance(x, y)
+    keep = np.ones(len(x), dtype=bool)
+
+    if tolerance is not None:
+        keep &= importance > tolerance
+    if max_points is not None and keep.sum() > max_points:
+        candidates = np.where(keep, importance, -1.0)
+        top = np.argsort(candidates, kind='stable')[-max(max_points, 2):]
+        limited = np.zeros(len(x), dtype=bool)
+        limited[top] = True
+        keep &= limited
+    return keep
+
+def encode_polyline(lat, lon, precision=5):
+    """Codifica le coordinate nel formato Encoded Polyline di Google"""
+    factor = 10 ** precision
+    coords = np.column_stack((
+        np.round(np.asarray(lat, dtype=float) * factor),
+        np.round(np.asarray(lon, dtype=float) * factor)
+    )).astype(np.int64)
+    if coords.size == 0:
+        return ''
+
+    deltas = np.diff(coords, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel()
+    # Zig-zag: i valori negativi diventano dispari
+    values = np.where(deltas < 0, ~(deltas << 1), deltas << 1)
+
+    chunks = []
+    for value in values.tolist():
+        while value >= 0x20:
+            chunks.append(chr((0x20 | (value & 0x1f)) + 63))
+            value >>= 5
+        chunks.append(chr(value + 63))
+    return ''.join(chunks)
@@ -0,0 +1,256 @@
+"""
+Tracciamento live via Server-Sent Events.
+
+Un unico broker per processo riceve le nuove posizioni (dall'ingest della
+telemetria e da un polling condiviso sul database) e le inoltra a tutti i
+client collegati alla stessa missione: una sola lettura viene servita a
+molti spettatori.
+
+Le tracce possono arrivare fuori ordine (la coda write-behind di un altro
+worker le scrive con qualche secondo di ritardo): il polling rilegge gli
+ultimi `LIVE_FINESTRA` secondi e ogni missione ricorda le tracce già inoltrate,
+così una traccia in ritardo viene inviata una sola volta invece di essere persa.
+"""
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+from backend.serializzazione import dumps
+
+def format_timestamp(value):
+    """Identificativo dell'evento SSE: il TIMESTAMP della traccia"""
+    return value.strftime('%Y-%m-%d %H:%M:%S')
+
+def parse_timestamp(value):
+    """Interpreta il TIMESTAMP ricevuto da Last-Event-ID o `since` (None se non valido)"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.strip())
+    except ValueError:
+        return None
+
+def format_event(traccia, ultimo=None):
+    """
+    Evento SSE di una traccia. L'identificativo è il TIMESTAMP più recente inviato
+    (`ultimo`): una traccia in ritardo non fa ripartire la riconnessione da più indietro.
+    """
+    return (
+        f"id: {format_timestamp(ultimo or traccia['TIMESTAMP'])}\n"
+        f"data: {dumps(traccia)}\n\n"
+    )
+
+# Evento inviato quando il database non è raggiungibile: lo stream si chiude e il
+# client si riconnette dopo `retry` millisecondi, riprendendo da Last-Event-ID
+EVENTO_ERRORE = f"event: error\ndata: {dumps({'error': 'Database non disponibile'})}\n\n"
+
+QUERY_BACKLOG = """
+    SELECT * FROM Traccia
+    WHERE ID_Missione = %s AND TIMESTAMP > %s
+    ORDER BY TIMESTAMP ASC
+"""
+
+QUERY_ULTIMA = """
+    SELECT * FROM Traccia
+    WHERE ID_Missione = %s
+    ORDER BY TIMESTAMP DESC
+    LIMIT 1
+"""
+
+def traccia_to_dict(row):
+    """Converte una riga di Traccia (tupla dell'ingest o dict del database) in dict"""
+    if isinstance(row, dict):
+        return row
+    id_drone, id_missione, lat, lon, timestamp = row
+    return {
+        'ID_Drone': id_drone,
+        'ID_Missione': id_missione,
+        'Latitudine': lat,
+        'Longitudine': lon,
+        'TIMESTAMP': timestamp
+    }
+
+
+class TracceViste:
+    """
+    Tracce di una missione già inoltrate: quelle fino a `soglia` più le chiavi
+    (TIMESTAMP, ID_Drone) degli ultimi `finestra` secondi, per riconoscere quelle in ritardo.
+    """
+
+    def __init__(self, since, finestra):
+        self.soglia = since
+        self.ultimo = since
+        self.finestra = finestra
+        self._chiavi = set()
+
+    def filtra(self, tracce):
+        """Restituisce, in ordine di TIMESTAMP, le sole tracce non ancora viste"""
+        nuove = []
+        for traccia in sorted(tracce, key=lambda t: t['TIMESTAMP']):
+            chiave = (traccia['TIMESTAMP'], traccia['ID_Drone'])
+            if (self.soglia is not None and chiave[0] <= self.soglia) or chiave in self._chiavi:
+                continue
+            self._chiavi.add(chiave)
+            nuove.append(traccia)
+        if nuove:
+            self.ultimo = max(self.ultimo or nuove[-1]['TIMESTAMP'], nuove[-1]['TIMESTAMP'])
+            soglia = self.ultimo - self.finestra
+            if self.soglia is None or soglia > self.soglia:
+                self.soglia = soglia
+                self._chiavi = {c for c in self._chiavi if c[0] > soglia}
+        return nuove
+
+
+class _Channel:
+    """Stato condiviso dagli spettatori di una missione"""
+
+    def __init__(self, since, finestra):
+        self.viste = TracceViste(since, finestra)
+        self.subscribers = set()
+        # Soglia del polling finché la missione non ha tracce: l'iscrizione, meno la finestra
+        self.inizio = datetime.now() - finestra
+
+    def soglia_polling(self):
+        return self.viste.soglia if self.viste.soglia is not None else self.inizio
+
+
+class TrackBroker:
+    """Smista le nuove tracce GPS agli spettatori di ciascuna missione"""
+
+    def __init__(self, db_factory, poll_interval=None, keepalive=None):
+        self.db_factory = db_factory
+        self.poll_interval = poll_interval or float(os.getenv('LIVE_POLL_INTERVAL', 2.0))
+        self.keepalive = keepalive or float(os.getenv('LIVE_KEEPALIVE', 15.0))
+        self.finestra = timedelta(seconds=float(os.getenv('LIVE_FINESTRA', 30)))
+        self._channels = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    # --------------------------------------------
+    # Iscrizioni
+    # --------------------------------------------
+    def subscribe(self, id_missione, since, subscriber=None):
+        """Iscrive uno spettatore: qualsiasi oggetto con `put(tracce)`, di default una queue.Queue"""
+        if subscriber is None:
+            subscriber = queue.Queue()
+        with self._lock:
+            channel = self._channels.get(id_missione)
+            if channel is None:
+                channel = self._channels[id_missione] = _Channel(since, self.finestra)
+            channel.subscribers.add(subscriber)
+            self._ensure_thread()
+        return subscriber
+
+    def unsubscribe(self, id_missione, subscriber):
+        with self._lock:
+            channel = self._channels.get(id_missione)
+            if channel is None:
+                return
+            channel.subscribers.discard(subscriber)
+            if not channel.subscribers:
+                del self._channels[id_missione]
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(c.subscribers) for c in self._channels.values())
+
+    # --------------------------------------------
+    # Pubblicazione
+    # --------------------------------------------
+    def publish(self, rows):
+        """Inoltra le tracce agli spettatori (usato come listener dell'ingest)"""
+        per_missione = {}
+        for row in rows:
+            traccia = traccia_to_dict(row)
+            per_missione.setdefault(traccia['ID_Missione'], []).append(traccia)
+
+        with self._lock:
+            for id_missione, tracce in per_missione.items():
+                channel = self._channels.get(id_missione)
+                if channel is None:
+                    continue
+                nuove = channel.viste.filtra(tracce)
+                if not nuove:
+                    continue
+                for subscriber in channel.subscribers:
+                    subscriber.put(nuove)
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='live-poller', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        # Polling condiviso: una query per tutte le missioni osservate, non una per spettatore
+        while True:
+            time.sleep(self.poll_interval)
+            with self._lock:
+                osservate = {k: c.soglia_polling() for k, c in self._channels.items()}
+            if not osservate:
+                continue
+            try:
+                self.publish(self._fetch_new(osservate))
+            except Exception as e:
+                print(f"Errore durante il polling delle tracce: {e}")
+
+    def _fetch_new(self, osservate):
+        # Una soglia per missione (range sull'indice ID_Missione, TIMESTAMP): una missione
+        # in ritardo non allarga la finestra delle altre
+        condizioni = ' OR '.join(['(ID_Missione = %s AND TIMESTAMP > %s)'] * len(osservate))
+        query = f"""
+            SELECT * FROM Traccia
+            WHERE {condizioni}
+            ORDER BY TIMESTAMP ASC
+        """
+        params = [valore for coppia in osservate.items() for valore in coppia]
+
+        db = self.db_factory()
+        db.connect()
+        try:
+            return db.fetch_query(query, params) or []
+        finally:
+            db.disconnect()
+
+    def _backlog(self, id_missione, since):
+        """Tracce successive a `since`, oppure solo l'ultima posizione nota"""
+        db = self.db_factory()
+        db.connect()
+        try:
+            if since:
+                return db.fetch_query(QUERY_BACKLOG, (id_missione, since)) or []
+            ultima = db.fetch_one(QUERY_ULTIMA, (id_missione,))
+            return [ultima] if ultima else []
+        finally:
+            db.disconnect()
+
+    # --------------------------------------------
+    # Stream SSE
+    # --------------------------------------------
+    def stream(self, id_missione, since):
+        """Generatore di eventi SSE con le sole tracce successive a `since`"""
+        subscriber = self.subscribe(id_missione, since)
+        try:
+            inviate = TracceViste(since, self.finestra)
+            ultimo = since
+            yield f"retry: {int(self.poll_interval * 1000)}\n\n"
+
+            # Le tracce trovate qui sono inoltrate anche agli altri spettatori della missione
+            try:
+                batch = self._backlog(id_missione, since)
+            except ConnectionError as e:
+                print(f"Impossibile leggere le tracce della missione {id_missione}: {e}")
+                yield EVENTO_ERRORE
+                return
+            self.publish(batch)
+            while True:
+                for traccia in inviate.filtra(batch):
+                    ultimo = max(ultimo, traccia['TIMESTAMP']) if ultimo else traccia['TIMESTAMP']
+                    yield format_event(traccia, ultimo)
+                try:
+                    batch = subscriber.get(timeout=self.keepalive)
+                except queue.Empty:
+                    batch = []
+                    yield ": keepalive\n\n"
+        finally:
+            self.unsubscribe(id_missione, subscriber)
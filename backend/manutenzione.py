@@ -0,0 +1,650 @@
+"""
+Usura dei droni e manutenzione predittiva a partire dalla telemetria di volo.
+
+Per ogni drone la tabella UsuraDrone accumula tempo di volo, distanza percorsa
+(haversine tra punti consecutivi della stessa missione) e missioni volate: in
+totale, dall'ultimo intervento e dall'ultima sostituzione della batteria.
+Gli accumulatori sono aggiornati dopo ogni flush dell'ingest con le sole nuove
+tracce, proseguendo dall'ultimo punto già contato del drone; la ricostruzione
+completa legge Traccia a blocchi di BLOCCO_DRONI droni.
+
+L'indice di usura è il massimo tra ore di volo, km e missioni dall'ultimo
+intervento e cicli equivalenti della batteria, ciascuno rapportato al proprio
+limite: 1 (100%) significa intervento dovuto.
+
+Ricostruzione e benchmark da riga di comando:
+    python -m backend.manutenzione --rebuild
+    python -m backend.manutenzione --benchmark --droni 5000
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+import numpy as np
+from mysql.connector import Error
+from backend.db import Database
+from backend.geo import haversine
+from backend.rotte import metriche_percorsi
+
+# Limiti tra due interventi ordinari
+LIMITE_ORE_VOLO = float(os.getenv('MANUTENZIONE_ORE_VOLO', 50))
+LIMITE_KM = float(os.getenv('MANUTENZIONE_KM', 1500))
+LIMITE_MISSIONI = int(os.getenv('MANUTENZIONE_MISSIONI', 200))
+
+# Vita della batteria in cicli equivalenti: un ciclo corrisponde a AUTONOMIA_MIN minuti di volo
+CICLI_BATTERIA = int(os.getenv('BATTERIA_CICLI', 300))
+AUTONOMIA_MIN = float(os.getenv('BATTERIA_AUTONOMIA_MIN', 30))
+
+# Quota del limite oltre la quale il drone è segnalato
+SOGLIA_ATTENZIONE = 0.8
+
+FATTORI = ('ore_volo', 'km', 'missioni', 'batteria')
+STATI = ('ok', 'attenzione', 'critico')
+TIPI_INTERVENTO = ('ordinaria', 'batteria')
+
+# Droni per query su Traccia durante la ricostruzione
+BLOCCO_DRONI = int(os.getenv('MANUTENZIONE_BLOCCO_DRONI', 50))
+
+UPSERT_INCREMENTALE = """
+    INSERT INTO UsuraDrone
+        (ID_Drone, TempoVolo, Distanza, Missioni, TempoVoloServizio, DistanzaServizio, MissioniServizio,
+         TempoVoloBatteria, UltimaMissione, UltimaLat, UltimaLon, UltimoTimestamp)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+        TempoVolo = TempoVolo + VALUES(TempoVolo),
+        Distanza = Distanza + VALUES(Distanza),
+        Missioni = Missioni + VALUES(Missioni),
+        TempoVoloServizio = TempoVoloServizio + VALUES(TempoVoloServizio),
+        DistanzaServizio = DistanzaServizio + VALUES(DistanzaServizio),
+        MissioniServizio = MissioniServizio + VALUES(MissioniServizio),
+        TempoVoloBatteria = TempoVoloBatteria + VALUES(TempoVoloBatteria),
+        UltimaMissione = VALUES(UltimaMissione),
+        UltimaLat = VALUES(UltimaLat),
+        UltimaLon = VALUES(UltimaLon),
+        UltimoTimestamp = VALUES(UltimoTimestamp)
+"""
+
+# La ricostruzione sostituisce i valori ma conserva le date degli interventi
+UPSERT_REBUILD = """
+    INSERT INTO UsuraDrone
+        (ID_Drone, TempoVolo, Distanza, Missioni, TempoVoloServizio, DistanzaServizio, MissioniServizio,
+         TempoVoloBatteria, UltimaMissione, UltimaLat, UltimaLon, UltimoTimestamp)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+        TempoVolo = VALUES(TempoVolo),
+        Distanza = VALUES(Distanza),
+        Missioni = VALUES(Missioni),
+        TempoVoloServizio = VALUES(TempoVoloServizio),
+        DistanzaServizio = VALUES(DistanzaServizio),
+        MissioniServizio = VALUES(MissioniServizio),
+        TempoVoloBatteria = VALUES(TempoVoloBatteria),
+        UltimaMissione = VALUES(UltimaMissione),
+        UltimaLat = VALUES(UltimaLat),
+        UltimaLon = VALUES(UltimaLon),
+        UltimoTimestamp = VALUES(UltimoTimestamp)
+"""
+
+QUERY_USURA = """
+    SELECT d.ID, d.Modello, d.Batteria,
+           COALESCE(u.TempoVolo, 0) as TempoVolo,
+           COALESCE(u.Distanza, 0) as Distanza,
+           COALESCE(u.Missioni, 0) as Missioni,
+           COALESCE(u.TempoVoloServizio, 0) as TempoVoloServizio,
+           COALESCE(u.DistanzaServizio, 0) as DistanzaServizio,
+           COALESCE(u.MissioniServizio, 0) as MissioniServizio,
+           COALESCE(u.TempoVoloBatteria, 0) as TempoVoloBatteria,
+           u.UltimoServizio, u.UltimaBatteria, u.UltimoTimestamp
+    FROM Drone d
+    LEFT JOIN UsuraDrone u ON u.ID_Drone = d.ID
+"""
+
+# Azzeramenti e data registrata per tipo di intervento
+AZZERAMENTI = {
+    'ordinaria': ('UltimoServizio', 'TempoVoloServizio = 0, DistanzaServizio = 0, MissioniServizio = 0'),
+    'batteria': ('UltimaBatteria', 'TempoVoloBatteria = 0'),
+}
+
+def secondi(timestamps):
+    """DATETIME (sequenza) in secondi interi, come in rotte"""
+    return np.array(timestamps, dtype='datetime64[s]').astype(np.int64)
+
+def _datetime(s):
+    return np.datetime64(int(s), 's').astype(datetime)
+
+def _vuoto(n=0):
+    return {
+        'droni': np.zeros(n, dtype=np.int64), 'tempo': np.zeros(n), 'distanza': np.zeros(n),
+        'missioni': np.zeros(n, dtype=np.int64), 'ultima_missione': np.zeros(n, dtype=np.int64),
+        'ultima_lat': np.zeros(n), 'ultima_lon': np.zeros(n), 'ultimo_ts': np.zeros(n, dtype=np.int64)
+    }
+
+# ============================================
+# CALCOLO VETTORIZZATO
+# ============================================
+
+def accumula(stato, drone, missione, lat, lon, ts):
+    """
+    Variazioni degli accumulatori per un blocco di nuove tracce, in qualsiasi ordine.
+    `stato` associa a un ID_Drone l'ultimo punto già contato (missione, lat, lon, ts);
+    i punti non successivi a quello (duplicati o arrivati in ritardo) sono ignorati.
+    Restituisce un dizionario di array, uno per drone con almeno un punto nuovo.
+    """
+    drone = np.asarray(drone, dtype=np.int64)
+    missione = np.asarray(missione, dtype=np.int64)
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    ts = np.asarray(ts, dtype=np.int64)
+    if len(drone) == 0:
+        return _vuoto()
+
+    # Ultimo punto noto dei droni del blocco, in testa come punto di partenza dei segmenti
+    unici, inverso = np.unique(drone, return_inverse=True)
+    noti = [d for d in unici.tolist() if d in stato]
+    soglia = np.array([stato[d][3] if d in stato else np.iinfo(np.int64).min for d in unici.tolist()],
+                      dtype=np.int64)
+    validi = ts > soglia[inverso]
+
+    d = np.concatenate([np.array(noti, dtype=np.int64), drone[validi]])
+    m = np.concatenate([np.array([stato[k][0] for k in noti], dtype=np.int64), missione[validi]])
+    la = np.concatenate([np.array([stato[k][1] for k in noti], dtype=float), lat[validi]])
+    lo = np.concatenate([np.array([stato[k][2] for k in noti], dtype=float), lon[validi]])
+    t = np.concatenate([np.array([stato[k][3] for k in noti], dtype=np.int64), ts[validi]])
+    nuovo = np.r_[np.zeros(len(noti), dtype=bool), np.ones(int(validi.sum()), dtype=bool)]
+
+    ordine = np.lexsort((t, d))
+    d, m, la, lo, t, nuovo = d[ordine], m[ordine], la[ordine], lo[ordine], t[ordine], nuovo[ordine]
+    # Due punti dello stesso drone con lo stesso TIMESTAMP: vale il primo
+    tieni = np.r_[True, (d[1:] != d[:-1]) | (t[1:] != t[:-1])]
+    d, m, la, lo, t, nuovo = d[tieni], m[tieni], la[tieni], lo[tieni], t[tieni], nuovo[tieni]
+
+    gruppi_droni, gruppi = np.unique(d, return_inverse=True)
+    n = len(gruppi_droni)
+    # I segmenti uniscono punti consecutivi della stessa missione
+    segmento = (d[1:] == d[:-1]) & (m[1:] == m[:-1])
+    inizio_missione = np.r_[True, ~segmento]
+
+    seg_gruppi = gruppi[1:][segmento]
+    dt = (t[1:] - t[:-1])[segmento]
+    distanza = haversine(la[:-1], lo[:-1], la[1:], lo[1:])[segmento]
+
+    ultimi = np.r_[np.flatnonzero(d[1:] != d[:-1]), len(d) - 1]
+    aggiornati = nuovo[ultimi]
+    return {
+        'droni': gruppi_droni[aggiornati],
+        'tempo': np.bincount(seg_gruppi, weights=dt, minlength=n)[aggiornati],
+        'distanza': np.bincount(seg_gruppi, weights=distanza, minlength=n)[aggiornati],
+        'missioni': np.bincount(gruppi[inizio_missione & nuovo], minlength=n)[aggiornati],
+        'ultima_missione': m[ultimi][aggiornati],
+        'ultima_lat': la[ultimi][aggiornati],
+        'ultima_lon': lo[ultimi][aggiornati],
+        'ultimo_ts': t[ultimi][aggiornati]
+    }
+
+def usura_droni(ids, servizio, batteria, drone, missione, lat, lon, ts):
+    """
+    Accumulatori completi di un blocco di droni (`ids` ordinati) dalle loro tracce,
+    ordinate per drone, missione e TIMESTAMP come la chiave primaria di Traccia.
+    `servizio` e `batteria` sono le date (in secondi, -inf se mai) dell'ultimo intervento
+    e dell'ultima sostituzione: contano le missioni iniziate dopo.
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    n = len(ids)
+    risultato = _vuoto(n)
+    risultato['droni'] = ids
+    for campo in ('tempo_servizio', 'distanza_servizio', 'tempo_batteria'):
+        risultato[campo] = np.zeros(n)
+    risultato['missioni_servizio'] = np.zeros(n, dtype=np.int64)
+    risultato['volato'] = np.zeros(n, dtype=bool)
+
+    drone = np.asarray(drone, dtype=np.int64)
+    missione = np.asarray(missione, dtype=np.int64)
+    ts = np.asarray(ts, dtype=np.int64)
+    if len(drone) == 0:
+        return risultato
+
+    nuova = np.r_[True, (drone[1:] != drone[:-1]) | (missione[1:] != missione[:-1])]
+    primi = np.flatnonzero(nuova)
+    ultimi = np.r_[primi[1:] - 1, len(drone) - 1]
+    _, durata, distanza, _ = metriche_percorsi(np.cumsum(nuova) - 1, lat, lon, ts, len(primi))
+
+    pos = np.searchsorted(ids, drone[primi])
+    inizio = ts[primi]
+    dopo_servizio = inizio > np.asarray(servizio, dtype=float)[pos]
+    dopo_batteria = inizio > np.asarray(batteria, dtype=float)[pos]
+
+    risultato['tempo'] = np.bincount(pos, weights=durata, minlength=n)
+    risultato['distanza'] = np.bincount(pos, weights=distanza, minlength=n)
+    risultato['missioni'] = np.bincount(pos, minlength=n)
+    risultato['tempo_servizio'] = np.bincount(pos[dopo_servizio], weights=durata[dopo_servizio], minlength=n)
+    risultato['distanza_servizio'] = np.bincount(pos[dopo_servizio], weights=distanza[dopo_servizio], minlength=n)
+    risultato['missioni_servizio'] = np.bincount(pos[dopo_servizio], minlength=n)
+    risultato['tempo_batteria'] = np.bincount(pos[dopo_batteria], weights=durata[dopo_batteria], minlength=n)
+
+    # Ultimo punto di ogni drone: fine della missione terminata più tardi
+    ordine = np.lexsort((ts[ultimi], pos))
+    finali = ordine[np.r_[pos[ordine][1:] != pos[ordine][:-1], True]]
+    punto = ultimi[finali]
+    volati = pos[finali]
+    risultato['volato'][volati] = True
+    risultato['ultima_missione'][volati] = missione[punto]
+    risultato['ultima_lat'][volati] = np.asarray(lat, dtype=float)[punto]
+    risultato['ultima_lon'][volati] = np.asarray(lon, dtype=float)[punto]
+    risultato['ultimo_ts'][volati] = ts[punto]
+    return risultato
+
+def indici_usura(tempo_servizio, distanza_servizio, missioni_servizio, tempo_batteria):
+    """
+    Quota consumata di ciascun limite (colonne nell'ordine di FATTORI), a partire da
+    secondi, metri e missioni. Restituisce (quote, indice di usura, fattore dominante).
+    """
+    quote = np.column_stack([
+        np.asarray(tempo_servizio, dtype=float) / 3600 / LIMITE_ORE_VOLO,
+        np.asarray(distanza_servizio, dtype=float) / 1000 / LIMITE_KM,
+        np.asarray(missioni_servizio, dtype=float) / LIMITE_MISSIONI,
+        np.asarray(tempo_batteria, dtype=float) / 60 / AUTONOMIA_MIN / CICLI_BATTERIA,
+    ])
+    if len(quote) == 0:
+        return quote, np.zeros(0), np.zeros(0, dtype=np.int64)
+    return quote, quote.max(axis=1), quote.argmax(axis=1)
+
+def stato_usura(indice):
+    if indice >= 1:
+        return 'critico'
+    if indice >= SOGLIA_ATTENZIONE:
+        return 'attenzione'
+    return 'ok'
+
+# ============================================
+# AGGIORNAMENTO INCREMENTALE E RICOSTRUZIONE
+# ============================================
+
+def aggiorna(db, tracce):
+    """
+    Aggiunge agli accumulatori le tracce appena scritte (tuple nell'ordine di CAMPI_TRACCIA).
+    Va eseguita in una transazione: le righe dei droni coinvolti restano bloccate fino al commit,
+    così worker diversi non contano due volte lo stesso segmento.
+    """
+    ids = sorted({t[0] for t in tracce})
+    # FOR UPDATE blocca solo righe esistenti: per un drone nuovo la riga viene creata prima,
+    # e un secondo worker attende sulla chiave duplicata fino al commit del primo
+    db.execute_many("INSERT IGNORE INTO UsuraDrone (ID_Drone) VALUES (%s)", [(i,) for i in ids])
+    righe_stato = db.fetch_query(f"""
+        SELECT ID_Drone, UltimaMissione, UltimaLat, UltimaLon, UltimoTimestamp
+        FROM UsuraDrone
+        WHERE ID_Drone IN ({', '.join(['%s'] * len(ids))})
+        FOR UPDATE
+    """, ids)
+    if righe_stato is None:
+        return 0
+    stato = {
+        r['ID_Drone']: (r['UltimaMissione'], float(r['UltimaLat']), float(r['UltimaLon']),
+                        int(secondi(r['UltimoTimestamp'])))
+        for r in righe_stato if r['UltimoTimestamp'] is not None
+    }
+
+    n = len(tracce)
+    variazioni = accumula(
+        stato,
+        np.fromiter((t[0] for t in tracce), dtype=np.int64, count=n),
+        np.fromiter((t[1] for t in tracce), dtype=np.int64, count=n),
+        np.fromiter((t[2] for t in tracce), dtype=float, count=n),
+        np.fromiter((t[3] for t in tracce), dtype=float, count=n),
+        secondi([t[4] for t in tracce])
+    )
+    righe = []
+    for i, id_drone in enumerate(variazioni['droni'].tolist()):
+        tempo = int(round(variazioni['tempo'][i]))
+        distanza = round(float(variazioni['distanza'][i]), 1)
+        missioni = int(variazioni['missioni'][i])
+        righe.append((
+            id_drone, tempo, distanza, missioni, tempo, distanza, missioni, tempo,
+            int(variazioni['ultima_missione'][i]), float(variazioni['ultima_lat'][i]),
+            float(variazioni['ultima_lon'][i]), _datetime(variazioni['ultimo_ts'][i])
+        ))
+    if righe:
+        db.execute_many(UPSERT_INCREMENTALE, righe)
+    return len(righe)
+
+QUERY_DRONI = """
+    SELECT d.ID, u.UltimoServizio, u.UltimaBatteria
+    FROM Drone d
+    LEFT JOIN UsuraDrone u ON u.ID_Drone = d.ID
+"""
+
+def rebuild(db):
+    """Ricalcola da Traccia gli accumulatori di tutti i droni, a blocchi di BLOCCO_DRONI"""
+    droni = db.fetch_query(QUERY_DRONI + " ORDER BY d.ID") or []
+    for i in range(0, len(droni), BLOCCO_DRONI):
+        _ricostruisci(db, droni[i:i + BLOCCO_DRONI])
+    return len(droni)
+
+def ricostruisci(db, ids):
+    """
+    Ricalcola da Traccia gli accumulatori dei soli droni indicati (ad esempio dopo un import
+    di tracce storiche, che l'aggiornamento incrementale ignorerebbe). Solleva Error se
+    una lettura fallisce; restituisce il numero di droni ricalcolati.
+    """
+    ids = sorted(set(ids))
+    for i in range(0, len(ids), BLOCCO_DRONI):
+        blocco = ids[i:i + BLOCCO_DRONI]
+        droni = db.fetch_query(
+            QUERY_DRONI + f" WHERE d.ID IN ({', '.join(['%s'] * len(blocco))}) ORDER BY d.ID", blocco
+        )
+        if droni is None or (droni and not _ricostruisci(db, droni)):
+            raise Error("Lettura dei droni o delle tracce fallita")
+    return len(ids)
+
+def _ricostruisci(db, droni):
+    ids = [d['ID'] for d in droni]
+    tracce = db.fetch_query(f"""
+        SELECT ID_Drone, ID_Missione, Latitudine, Longitudine, TIMESTAMP
+        FROM Traccia
+        WHERE ID_Drone IN ({', '.join(['%s'] * len(ids))})
+        ORDER BY ID_Drone, ID_Missione, TIMESTAMP
+    """, ids)
+    if tracce is None:
+        # Lettura fallita: meglio lasciare i valori attuali che azzerarli
+        return False
+
+    def data(campo):
+        return np.array([secondi(d[campo]) if d[campo] else -np.inf for d in droni], dtype=float)
+
+    n = len(tracce)
+    usura = usura_droni(
+        ids, data('UltimoServizio'), data('UltimaBatteria'),
+        np.fromiter((t['ID_Drone'] for t in tracce), dtype=np.int64, count=n),
+        np.fromiter((t['ID_Missione'] for t in tracce), dtype=np.int64, count=n),
+        np.fromiter((t['Latitudine'] for t in tracce), dtype=float, count=n),
+        np.fromiter((t['Longitudine'] for t in tracce), dtype=float, count=n),
+        secondi([t['TIMESTAMP'] for t in tracce])
+    )
+    righe = []
+    for i, id_drone in enumerate(ids):
+        volato = usura['volato'][i]
+        righe.append((
+            id_drone, int(round(usura['tempo'][i])), round(float(usura['distanza'][i]), 1),
+            int(usura['missioni'][i]), int(round(usura['tempo_servizio'][i])),
+            round(float(usura['distanza_servizio'][i]), 1), int(usura['missioni_servizio'][i]),
+            int(round(usura['tempo_batteria'][i])),
+            int(usura['ultima_missione'][i]) if volato else None,
+            float(usura['ultima_lat'][i]) if volato else None,
+            float(usura['ultima_lon'][i]) if volato else None,
+            _datetime(usura['ultimo_ts'][i]) if volato else None
+        ))
+    with db.transaction():
+        db.execute_many(UPSERT_REBUILD, righe)
+    return True
+
+
+class UsuraFlotta:
+    """Listener dell'ingest della telemetria: aggiorna UsuraDrone dopo ogni flush"""
+
+    def __init__(self, db_factory):
+        self.db_factory = db_factory
+
+    def update(self, rows):
+        if not rows:
+            return
+        tracce = [row if isinstance(row, (list, tuple)) else (
+            row['ID_Drone'], row['ID_Missione'], row['Latitudine'], row['Longitudine'], row['TIMESTAMP']
+        ) for row in rows]
+        db = self.db_factory()
+        db.connect()
+        try:
+            with db.transaction():
+                aggiorna(db, tracce)
+        finally:
+            db.disconnect()
+
+# ============================================
+# CLASSIFICA, STORICO E INTERVENTI
+# ============================================
+
+def classifica(db, id_drone=None, stato=None, limite=None):
+    """Droni ordinati per indice di usura decrescente (prima quelli da revisionare)"""
+    if id_drone is None:
+        droni = db.fetch_query(QUERY_USURA + " ORDER BY d.ID") or []
+    else:
+        droni = db.fetch_query(QUERY_USURA + " WHERE d.ID = %s", (id_drone,)) or []
+
+    quote, indici, fattori = indici_usura(
+        [d['TempoVoloServizio'] for d in droni], [d['DistanzaServizio'] for d in droni],
+        [d['MissioniServizio'] for d in droni], [d['TempoVoloBatteria'] for d in droni]
+    )
+    risultati = []
+    for i in np.argsort(-indici, kind='stable').tolist():
+        d = droni[i]
+        stato_drone = stato_usura(indici[i])
+        if stato and stato_drone != stato:
+            continue
+        cicli = float(d['TempoVoloBatteria']) / 60 / AUTONOMIA_MIN
+        risultati.append({
+            'id': d['ID'],
+            'modello': d['Modello'],
+            'batteria': d['Batteria'],
+            # La capacità residua scende linearmente fino all'80% a fine vita
+            'salute_batteria': round(max(0.0, 100 - 20 * cicli / CICLI_BATTERIA), 1),
+            'cicli_batteria': round(cicli, 1),
+            'ore_volo': round(float(d['TempoVoloServizio']) / 3600, 2),
+            'km': round(float(d['DistanzaServizio']) / 1000, 2),
+            'missioni': int(d['MissioniServizio']),
+            'totali': {
+                'ore_volo': round(float(d['TempoVolo']) / 3600, 2),
+                'km': round(float(d['Distanza']) / 1000, 2),
+                'missioni': int(d['Missioni'])
+            },
+            'quote': {f: round(float(q) * 100, 1) for f, q in zip(FATTORI, quote[i])},
+            'usura': round(float(indici[i]) * 100, 1),
+            'fattore': FATTORI[fattori[i]],
+            'stato': stato_drone,
+            'ultimo_servizio': d['UltimoServizio'],
+            'ultima_batteria': d['UltimaBatteria'],
+            'ultimo_volo': d['UltimoTimestamp']
+        })
+        if limite and len(risultati) >= limite:
+            break
+    return risultati
+
+def storico(db, id_drone, missioni=20):
+    """Usura attuale, interventi e metriche di volo delle ultime `missioni` missioni di un drone"""
+    usura = classifica(db, id_drone=id_drone)
+    if not usura:
+        return None
+
+    interventi = db.fetch_query("""
+        SELECT ID, Data, Tipo, TempoVolo, Distanza, Missioni, TempoVoloBatteria, Note
+        FROM Manutenzione
+        WHERE ID_Drone = %s
+        ORDER BY Data DESC, ID DESC
+    """, (id_drone,)) or []
+
+    recenti = db.fetch_query("""
+        SELECT ID, DataMissione, Stato
+        FROM Missioni
+        WHERE IdDrone = %s
+        ORDER BY DataMissione DESC, ID DESC
+        LIMIT %s
+    """, (id_drone, missioni)) or []
+    metriche = {}
+    if recenti:
+        ids = [m['ID'] for m in recenti]
+        tracce = db.fetch_query(f"""
+            SELECT ID_Missione, Latitudine, Longitudine, TIMESTAMP
+            FROM Traccia
+            WHERE ID_Drone = %s AND ID_Missione IN ({', '.join(['%s'] * len(ids))})
+            ORDER BY ID_Missione, TIMESTAMP
+        """, [id_drone] + ids) or []
+        n = len(tracce)
+        missione = np.fromiter((t['ID_Missione'] for t in tracce), dtype=np.int64, count=n)
+        nuova = np.r_[True, missione[1:] != missione[:-1]] if n else np.zeros(0, dtype=bool)
+        primi = np.flatnonzero(nuova)
+        punti, durata, distanza, picco = metriche_percorsi(
+            np.cumsum(nuova) - 1,
+            np.fromiter((t['Latitudine'] for t in tracce), dtype=float, count=n),
+            np.fromiter((t['Longitudine'] for t in tracce), dtype=float, count=n),
+            secondi([t['TIMESTAMP'] for t in tracce]),
+            len(primi)
+        )
+        for j, i in enumerate(primi.tolist()):
+            metriche[int(missione[i])] = (int(punti[j]), float(durata[j]), float(distanza[j]), float(picco[j]))
+
+    return {
+        'drone': usura[0],
+        'interventi': [{
+            'id': r['ID'],
+            'data': r['Data'],
+            'tipo': r['Tipo'],
+            'ore_volo': round(float(r['TempoVolo']) / 3600, 2),
+            'km': round(float(r['Distanza']) / 1000, 2),
+            'missioni': r['Missioni'],
+            'cicli_batteria': round(float(r['TempoVoloBatteria']) / 60 / AUTONOMIA_MIN, 1),
+            'note': r['Note']
+        } for r in interventi],
+        'missioni': [_missione_dict(m, metriche.get(m['ID'])) for m in recenti]
+    }
+
+def _missione_dict(m, metriche):
+    punti, durata, distanza, picco = metriche or (0, 0.0, 0.0, 0.0)
+    return {
+        'id': m['ID'],
+        'data': m['DataMissione'],
+        'stato': m['Stato'],
+        'tracce': punti,
+        'durata_min': round(durata / 60, 2),
+        'distanza_km': round(distanza / 1000, 3),
+        'velocita_picco_kmh': round(picco * 3.6, 2)
+    }
+
+def registra_intervento(db, id_drone, tipo, note=None, data=None):
+    """
+    Registra un intervento ('ordinaria' o 'batteria') con i valori accumulati fino a quel
+    momento e azzera i contatori corrispondenti. Restituisce l'ID dell'intervento.
+    """
+    data = data or datetime.now().replace(microsecond=0)
+    colonna_data, azzeramento = AZZERAMENTI[tipo]
+    with db.transaction():
+        usura = db.fetch_one("""
+            SELECT TempoVoloServizio, DistanzaServizio, MissioniServizio, TempoVoloBatteria
+            FROM UsuraDrone
+            WHERE ID_Drone = %s
+            FOR UPDATE
+        """, (id_drone,)) or {}
+        id_intervento = db.execute_query("""
+            INSERT INTO Manutenzione (ID_Drone, Data, Tipo, TempoVolo, Distanza, Missioni, TempoVoloBatteria, Note)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        """, (
+            id_drone, data, tipo,
+            usura.get('TempoVoloServizio', 0), usura.get('DistanzaServizio', 0),
+            usura.get('MissioniServizio', 0), usura.get('TempoVoloBatteria', 0), note
+        ))
+        db.execute_query(f"""
+            INSERT INTO UsuraDrone (ID_Drone, {colonna_data}) VALUES (%s, %s)
+            ON DUPLICATE KEY UPDATE {azzeramento}, {colonna_data} = VALUES({colonna_data})
+        """, (id_drone, data))
+    return id_intervento
+
+# ============================================
+# BENCHMARK
+# ============================================
+
+def _flotta(droni, punti, missioni, seed=42):
+    """Tracce sintetiche ordinate per drone, missione e TIMESTAMP (un punto ogni 30 s)"""
+    rng = np.random.default_rng(seed)
+    drone = np.repeat(np.arange(1, droni + 1, dtype=np.int64), punti)
+    passo = np.tile(np.arange(punti, dtype=np.int64), droni)
+    indice_missione = passo * missioni // punti
+    missione = drone * 10000 + indice_missione
+    # Un'ora di pausa tra due missioni dello stesso drone
+    ts = 1704067200 + drone * 60 + passo * 30 + indice_missione * 3600
+    lat = 45.4642 + np.cumsum(rng.normal(0, 0.0005, len(drone)))
+    lon = 9.19 + np.cumsum(rng.normal(0, 0.0005, len(drone)))
+    return drone, missione, lat, lon, ts
+
+def benchmark(droni=5000, punti=200, missioni=10, blocco=500, seed=42):
+    """Tempi di ricostruzione a blocchi, aggiornamento incrementale per flush e classifica"""
+    drone, missione, lat, lon, ts = _flotta(droni, punti, missioni, seed)
+    ids = np.arange(1, droni + 1, dtype=np.int64)
+    mai = np.full(droni, -np.inf)
+    risultati = {'droni': droni, 'punti': len(drone)}
+
+    # Ricostruzione completa, BLOCCO_DRONI droni alla volta come da Traccia
+    start = time.perf_counter()
+    confini = np.searchsorted(drone, ids[::BLOCCO_DRONI])
+    completo = []
+    for i, inizio in enumerate(confini):
+        fine = confini[i + 1] if i + 1 < len(confini) else len(drone)
+        blocco_ids = ids[i * BLOCCO_DRONI:(i + 1) * BLOCCO_DRONI]
+        completo.append(usura_droni(blocco_ids, mai[:len(blocco_ids)], mai[:len(blocco_ids)],
+                                    drone[inizio:fine], missione[inizio:fine], lat[inizio:fine],
+                                    lon[inizio:fine], ts[inizio:fine]))
+    risultati['ricostruzione_s'] = round(time.perf_counter() - start, 3)
+    totale_m = np.concatenate([c['distanza'] for c in completo])
+
+    # Incrementale: stato dopo il 90% dei punti di ogni drone, il resto in flush da `blocco` righe
+    soglia = np.tile(np.arange(punti) < punti * 9 // 10, droni)
+    parziale = usura_droni(ids, mai, mai, drone[soglia], missione[soglia], lat[soglia], lon[soglia], ts[soglia])
+    stato = {
+        int(parziale['droni'][i]): (int(parziale['ultima_missione'][i]), float(parziale['ultima_lat'][i]),
+                                    float(parziale['ultima_lon'][i]), int(parziale['ultimo_ts'][i]))
+        for i in range(droni)
+    }
+    distanza = dict(zip(ids.tolist(), parziale['distanza'].tolist()))
+    resto = np.flatnonzero(~soglia)
+    # I flush arrivano in ordine di tempo, mescolando i droni
+    resto = resto[np.argsort(ts[resto], kind='stable')]
+    start = time.perf_counter()
+    flush = 0
+    for i in range(0, len(resto), blocco):
+        sel = resto[i:i + blocco]
+        variazioni = accumula(stato, drone[sel], missione[sel], lat[sel], lon[sel], ts[sel])
+        for j, d in enumerate(variazioni['droni'].tolist()):
+            distanza[d] += variazioni['distanza'][j]
+            stato[d] = (int(variazioni['ultima_missione'][j]), float(variazioni['ultima_lat'][j]),
+                        float(variazioni['ultima_lon'][j]), int(variazioni['ultimo_ts'][j]))
+        flush += 1
+    durata = time.perf_counter() - start
+    risultati['incrementale_ms_flush'] = round(durata / flush * 1000, 3)
+    risultati['incrementale_righe_s'] = round(len(resto) / durata)
+    risultati['scarto_max_m'] = float(np.max(np.abs(np.array([distanza[d] for d in ids.tolist()]) - totale_m)))
+
+    # Classifica della flotta
+    start = time.perf_counter()
+    _, indici, _ = indici_usura(
+        np.concatenate([c['tempo'] for c in completo]), totale_m,
+        np.concatenate([c['missioni'] for c in completo]), np.concatenate([c['tempo'] for c in completo])
+    )
+    np.argsort(-indici, kind='stable')
+    risultati['classifica_ms'] = round((time.perf_counter() - start) * 1000, 3)
+    return risultati
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Usura dei droni e manutenzione predittiva")
+    parser.add_argument('--rebuild', action='store_true', help="ricostruisce UsuraDrone da Traccia")
+    parser.add_argument('--benchmark', action='store_true', help="benchmark su una flotta sintetica")
+    parser.add_argument('--droni', type=int, default=5000)
+    parser.add_argument('--punti', type=int, default=200, help="tracce per drone nel benchmark")
+    parser.add_argument('--limite', type=int, default=20)
+    args = parser.parse_args(argv)
+
+    if args.benchmark:
+        for chiave, valore in benchmark(args.droni, args.punti).items():
+            print(f"{chiave:<24}{valore}")
+        return 0
+
+    db = Database()
+    db.connect()
+    try:
+        if args.rebuild:
+            print(f"UsuraDrone ricostruita per {rebuild(db)} droni")
+            return 0
+        for d in classifica(db, limite=args.limite):
+            print(f"{d['id']:>6}  {d['modello']:<20}{d['usura']:>7.1f}%  {d['fattore']:<10}{d['stato']}")
+        return 0
+    finally:
+        db.disconnect()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,176 @@
+"""
+Metriche di latenza delle route e delle query SQL, esposte in formato Prometheus.
+
+Le durate sono aggregate in istogrammi in memoria a bucket logaritmici
+(errore relativo sui percentili inferiore al 10%, memoria costante). Le query
+sono raggruppate per fingerprint: il testo SQL normalizzato, senza valori
+letterali. Con METRICS_SLOW_QUERY_MS > 0 le query più lente della soglia
+vengono registrate nel log.
+"""
+import bisect
+import os
+import re
+import threading
+import time
+from flask import g, request
+
+QUANTILI = (0.5, 0.95, 0.99)
+
+# Limiti superiori dei bucket in secondi: da 50 µs a ~100 s, fattore 2^(1/4)
+BUCKET = [0.00005 * 2 ** (i / 4) for i in range(85)]
+
+# Numero massimo di fingerprint distinti (le query oltre il limite finiscono in "altro")
+MAX_FINGERPRINT = 500
+
+_STRINGHE = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"")
+_NUMERI = re.compile(r'\b\d+(?:\.\d+)?\b')
+_LISTE = re.compile(r'\(\s*(?:\?|%s)(?:\s*,\s*(?:\?|%s))*\s*\)')
+_SPAZI = re.compile(r'\s+')
+
+def fingerprint(sql):
+    """Normalizza una query: valori letterali sostituiti da ?, liste IN compresse, spazi uniformati"""
+    sql = _STRINGHE.sub('?', sql)
+    sql = _NUMERI.sub('?', sql)
+    sql = _LISTE.sub('(...)', sql)
+    return _SPAZI.sub(' ', sql).strip()
+
+
+class Histogram:
+    """Istogramma a bucket fissi con stima dei percentili"""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKET, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        cumulative = 0
+        for i, n in enumerate(self.counts):
+            if n and cumulative + n >= target:
+                lower = BUCKET[i - 1] if i > 0 else 0.0
+                upper = BUCKET[i] if i < len(BUCKET) else self.max
+                # Interpolazione lineare all'interno del bucket
+                value = lower + (upper - lower) * (target - cumulative) / n
+                return min(value, self.max)
+            cumulative += n
+        return self.max
+
+
+class Metrics:
+    """Registro delle metriche di route e query, condiviso dal processo"""
+
+    def __init__(self, slow_query_ms=None):
+        if slow_query_ms is None:
+            slow_query_ms = float(os.getenv('METRICS_SLOW_QUERY_MS', 0))
+        self.slow_query = slow_query_ms / 1000
+        self._routes = {}
+        self._queries = {}
+        self._lock = threading.Lock()
+        # Tempo speso nel database dalla richiesta corrente (una per thread)
+        self._local = threading.local()
+
+    def init_app(self, app):
+        """Registra la misura dei tempi di ogni richiesta"""
+        @app.before_request
+        def _inizio_richiesta():
+            g._metrics_start = time.perf_counter()
+            self._local.db_time = 0.0
+
+        @app.after_request
+        def _fine_richiesta(response):
+            start = g.pop('_metrics_start', None)
+            if start is not None:
+                route = request.url_rule.rule if request.url_rule else '<non trovata>'
+                self.record_request(
+                    route, request.method, response.status_code,
+                    time.perf_counter() - start, getattr(self._local, 'db_time', 0.0)
+                )
+            return response
+
+    def record_query(self, query, seconds, rows, error):
+        """Hook per Database: registra durata, righe ed errori di un'istruzione SQL"""
+        self._local.db_time = getattr(self._local, 'db_time', 0.0) + seconds
+        chiave = fingerprint(query)
+        with self._lock:
+            stat = self._queries.get(chiave)
+            if stat is None:
+                if len(self._queries) >= MAX_FINGERPRINT:
+                    chiave = 'altro'
+                    stat = self._queries.get(chiave)
+                if stat is None:
+                    stat = self._queries[chiave] = {'durata': Histogram(), 'righe': 0, 'errori': 0}
+            stat['durata'].observe(seconds)
+            stat['righe'] += rows or 0
+            stat['errori'] += 1 if error else 0
+
+        if self.slow_query and seconds >= self.slow_query:
+            print(f"Query lenta ({seconds * 1000:.1f} ms, {rows or 0} righe): {chiave}")
+
+    def record_request(self, route, method, status, seconds, db_seconds):
+        with self._lock:
+            stat = self._routes.get((route, method))
+            if stat is None:
+                stat = self._routes[(route, method)] = {
+                    'durata': Histogram(), 'db': Histogram(), 'status': {}
+                }
+            stat['durata'].observe(seconds)
+            stat['db'].observe(db_seconds)
+            stat['status'][status] = stat['status'].get(status, 0) + 1
+
+    def render(self):
+        """Testo nel formato di esposizione Prometheus"""
+        righe = []
+
+        def summary(nome, descrizione, serie):
+            righe.append(f"# HELP {nome} {descrizione}")
+            righe.append(f"# TYPE {nome} summary")
+            for etichette, istogramma in serie:
+                for q in QUANTILI:
+                    righe.append(f'{nome}{{{etichette},quantile="{q}"}} {istogramma.quantile(q):.6f}')
+                righe.append(f"{nome}_sum{{{etichette}}} {istogramma.sum:.6f}")
+                righe.append(f"{nome}_count{{{etichette}}} {istogramma.count}")
+
+        def counter(nome, descrizione, serie):
+            righe.append(f"# HELP {nome} {descrizione}")
+            righe.append(f"# TYPE {nome} counter")
+            for etichette, valore in serie:
+                righe.append(f"{nome}{{{etichette}}} {valore}")
+
+        with self._lock:
+            routes = sorted(
+                (f'route="{_escape(r)}",method="{m}"', stat) for (r, m), stat in self._routes.items()
+            )
+            queries = sorted((f'fingerprint="{_escape(q)}"', stat) for q, stat in self._queries.items())
+
+            summary('http_request_duration_seconds', 'Durata delle richieste per route',
+                    [(e, s['durata']) for e, s in routes])
+            summary('http_request_db_seconds', 'Tempo speso nel database per richiesta, per route',
+                    [(e, s['db']) for e, s in routes])
+            counter('http_requests_total', 'Richieste per route e codice di stato',
+                    [(f'{e},status="{code}"', n) for e, s in routes for code, n in sorted(s['status'].items())])
+            summary('db_query_duration_seconds', 'Durata delle query SQL per fingerprint',
+                    [(e, s['durata']) for e, s in queries])
+            counter('db_query_rows_total', 'Righe restituite o modificate per fingerprint',
+                    [(e, s['righe']) for e, s in queries])
+            counter('db_query_errors_total', 'Query fallite per fingerprint',
+                    [(e, s['errori']) for e, s in queries])
+        return '\n'.join(righe) + '\n'
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+            self._queries.clear()
+
+
+def _escape(valore):
+    return valore.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
@@ -0,0 +1,111 @@
+"""
+Migrazioni versionate dello schema.
+
+Ogni file `memory-bank/migrations/NNN_descrizione.sql` viene applicato una sola
+volta, in ordine di versione, sopra a structure.sql; le versioni applicate sono
+registrate nella tabella SchemaMigrazioni.
+
+Uso:
+    python -m backend.migrate            # applica le migrazioni mancanti
+    python -m backend.migrate --status   # mostra lo stato delle migrazioni
+"""
+import argparse
+import os
+import re
+import sys
+from mysql.connector import Error
+from backend.db import Database
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(__file__), '..', 'memory-bank', 'migrations')
+
+# Errori MySQL "Duplicate column name", "Duplicate key name" e "Trigger already exists"
+ER_DUP_FIELDNAME = 1060
+ER_DUP_KEYNAME = 1061
+ER_TRG_ALREADY_EXISTS = 1359
+
+CREATE_TABELLA = """
+    CREATE TABLE IF NOT EXISTS SchemaMigrazioni (
+        Versione VARCHAR(100) PRIMARY KEY,
+        Applicata DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+def elenca_migrazioni(directory=MIGRATIONS_DIR):
+    """Restituisce [(versione, percorso)] ordinati per numero di versione"""
+    migrazioni = []
+    for nome in os.listdir(directory):
+        match = re.match(r'^(\d+)_.+\.sql$', nome)
+        if match:
+            migrazioni.append((int(match.group(1)), nome[:-4], os.path.join(directory, nome)))
+    return [(versione, percorso) for _, versione, percorso in sorted(migrazioni)]
+
+def istruzioni(sql):
+    """Divide uno script SQL in istruzioni, ignorando i commenti di riga"""
+    righe = [r for r in sql.splitlines() if not r.strip().startswith('--')]
+    return [i.strip() for i in '\n'.join(righe).split(';') if i.strip()]
+
+def applicate(db):
+    db.execute_query(CREATE_TABELLA)
+    return {r['Versione'] for r in db.fetch_query("SELECT Versione FROM SchemaMigrazioni")}
+
+def migra(db, directory=MIGRATIONS_DIR):
+    """Applica le migrazioni mancanti; restituisce le versioni applicate"""
+    gia_applicate = applicate(db)
+    nuove = []
+    for versione, percorso in elenca_migrazioni(directory):
+        if versione in gia_applicate:
+            continue
+        with open(percorso, encoding='utf-8') as f:
+            sql = f.read()
+
+        cursor = db.connection.cursor()
+        try:
+            for istruzione in istruzioni(sql):
+                try:
+                    cursor.execute(istruzione)
+                except Error as e:
+                    # Le DDL fanno commit implicito: dopo un'esecuzione interrotta
+                    # colonne, indici e trigger già creati non devono bloccare la ripresa
+                    if e.errno not in (ER_DUP_FIELDNAME, ER_DUP_KEYNAME, ER_TRG_ALREADY_EXISTS):
+                        raise
+            cursor.execute("INSERT INTO SchemaMigrazioni (Versione) VALUES (%s)", (versione,))
+            db.connection.commit()
+        except Error as e:
+            db.connection.rollback()
+            raise RuntimeError(f"Migrazione {versione} fallita: {e}") from e
+        finally:
+            cursor.close()
+
+        print(f"Applicata migrazione {versione}")
+        nuove.append(versione)
+    return nuove
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Applica le migrazioni dello schema")
+    parser.add_argument('--status', action='store_true', help="mostra lo stato senza applicare nulla")
+    args = parser.parse_args(argv)
+
+    db = Database()
+    db.connect()
+    try:
+        if args.status:
+            gia_applicate = applicate(db)
+            for versione, _ in elenca_migrazioni():
+                print(f"[{'x' if versione in gia_applicate else ' '}] {versione}")
+            return 0
+
+        try:
+            nuove = migra(db)
+        except RuntimeError as e:
+            print(e)
+            return 1
+        if not nuove:
+            print("Schema già aggiornato")
+        return 0
+    finally:
+        db.disconnect()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
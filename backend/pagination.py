@@ -0,0 +1,105 @@
+"""
+Paginazione keyset (a cursore) e streaming delle liste di grandi dimensioni
+"""
+import base64
+import binascii
+import json
+from itertools import chain
+from flask import Response, request, stream_with_context
+from mysql.connector import Error
+from backend.serializzazione import dumps_bytes, json_default
+
+# Numero massimo di righe restituibili in una singola pagina
+MAX_LIMIT = 1000
+
+def encode_cursor(values):
+    """Codifica i valori della chiave di ordinamento in un cursore opaco"""
+    raw = json.dumps(values, default=json_default, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor, size):
+    """
+    Decodifica un cursore, verificando che contenga `size` valori scalari (stringhe o numeri):
+    liste, oggetti, booleani o null finirebbero come parametri della query.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (ValueError, binascii.Error):
+        raise ValueError("Cursore non valido")
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("Cursore non valido")
+    if not all(isinstance(v, (str, int, float)) and not isinstance(v, bool) for v in values):
+        raise ValueError("Cursore non valido")
+    return values
+
+def get_page_args(cursor_size):
+    """
+    Legge `limit` e `after` dalla query string.
+    Restituisce (None, None) se la paginazione non è richiesta; solleva ValueError se i parametri non sono validi.
+    """
+    limit = request.args.get('limit')
+    after = request.args.get('after')
+    if limit is None and after is None:
+        return None, None
+
+    limit = int(limit) if limit is not None else 100
+    if limit < 1:
+        raise ValueError("limit deve essere positivo")
+    limit = min(limit, MAX_LIMIT)
+
+    if after:
+        after = decode_cursor(after, cursor_size)
+    return limit, after
+
+def paginate(rows, limit, key):
+    """
+    Costruisce la risposta paginata a partire da `limit + 1` righe:
+    la riga in eccesso indica solo che esiste una pagina successiva.
+    """
+    has_next = len(rows) > limit
+    items = rows[:limit]
+    return {
+        'items': items,
+        'next_cursor': encode_cursor(key(items[-1])) if has_next and items else None
+    }
+
+def get_stream_format():
+    """Restituisce il formato di streaming richiesto (`ndjson` o `json`), oppure None"""
+    fmt = request.args.get('stream')
+    if fmt in ('ndjson', 'json'):
+        return fmt
+    if fmt is not None:
+        raise ValueError("Formato di streaming non supportato")
+    return None
+
+def stream_response(rows, fmt):
+    """
+    Risposta HTTP che serializza le righe una alla volta, senza caricarle in memoria.
+    La prima riga viene letta prima di inviare gli header, così un errore della query
+    diventa un 500; un errore a metà trasmissione interrompe la connessione, e il client
+    vede una risposta troncata invece di un 200 completo.
+    """
+    rows = iter(rows)
+    try:
+        first = next(rows, None)
+    except Error:
+        return Response(dumps_bytes({'error': 'Errore durante la lettura dei dati'}),
+                        status=500, mimetype='application/json')
+    if first is not None:
+        rows = chain((first,), rows)
+    def generate_ndjson():
+        for row in rows:
+            yield dumps_bytes(row) + b'\n'
+
+    def generate_json():
+        yield b'['
+        first = True
+        for row in rows:
+            yield (b'' if first else b',') + dumps_bytes(row)
+            first = False
+        yield b']'
+
+    if fmt == 'ndjson':
+        return Response(stream_with_context(generate_ndjson()), mimetype='application/x-ndjson')
+    return Response(stream_with_context(generate_json()), mimetype='application/json')
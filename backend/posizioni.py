@@ -0,0 +1,144 @@
+"""
+Indice in memoria dell'ultima posizione nota per missione e per drone.
+
+Viene caricato dal database al primo utilizzo (dopo l'eventuale fork dei worker),
+aggiornato dall'ingest della telemetria e riallineato da un thread in background
+con una query incrementale, così le letture non interrogano mai il database.
+
+L'ingest aggiorna solo l'indice del worker che lo riceve: le tracce scritte
+dagli altri worker arrivano con il riallineamento, quindi con un ritardo massimo
+di `POSIZIONI_REFRESH_INTERVAL` secondi. La soglia della query è l'ora del
+database (non il TIMESTAMP più alto ricevuto, che un drone con l'orologio avanti
+porterebbe nel futuro) meno `POSIZIONI_FINESTRA` secondi, per le tracce scritte
+in ritardo dalla coda write-behind di un altro worker.
+"""
+import os
+import threading
+import time
+from datetime import timedelta
+
+QUERY_ULTIME_POSIZIONI = """
+    SELECT t.*
+    FROM Traccia t
+    JOIN (
+        SELECT ID_Missione, MAX(TIMESTAMP) as UltimoTimestamp
+        FROM Traccia
+        GROUP BY ID_Missione
+    ) u ON t.ID_Missione = u.ID_Missione AND t.TIMESTAMP = u.UltimoTimestamp
+"""
+
+QUERY_ADESSO = "SELECT NOW() as Adesso"
+
+QUERY_NUOVE_POSIZIONI = """
+    SELECT * FROM Traccia
+    WHERE TIMESTAMP > %s
+"""
+
+class PositionIndex:
+    """Ultima posizione per ID_Missione e per ID_Drone"""
+
+    def __init__(self, db_factory, refresh_interval=None, finestra=None):
+        self.db_factory = db_factory
+        self.refresh_interval = refresh_interval or float(os.getenv('POSIZIONI_REFRESH_INTERVAL', 1.0))
+        self.finestra = timedelta(seconds=finestra if finestra is not None else float(os.getenv('POSIZIONI_FINESTRA', 5)))
+        self._by_missione = {}
+        self._by_drone = {}
+        # Ora del database all'inizio dell'ultimo riallineamento riuscito
+        self._letto_fino = None
+        self._synced_at = None
+        self._tentato_at = None
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._thread = None
+
+    def update(self, rows):
+        """Aggiorna l'indice con nuove tracce (usato come listener dell'ingest)"""
+        with self._lock:
+            for row in rows:
+                traccia = row if isinstance(row, dict) else {
+                    'ID_Drone': row[0],
+                    'ID_Missione': row[1],
+                    'Latitudine': row[2],
+                    'Longitudine': row[3],
+                    'TIMESTAMP': row[4]
+                }
+                timestamp = traccia['TIMESTAMP']
+                for index, key in ((self._by_missione, traccia['ID_Missione']),
+                                   (self._by_drone, traccia['ID_Drone'])):
+                    current = index.get(key)
+                    if current is None or timestamp > current['TIMESTAMP']:
+                        index[key] = traccia
+
+    def sync(self, max_eta=None):
+        """
+        Carica (o riallinea in modo incrementale) l'indice dal database. Con `max_eta` non fa
+        nulla se mentre si attendeva un altro thread ci ha provato da meno di `max_eta` secondi:
+        le richieste arrivate durante un caricamento lento non ripetono la query una dopo l'altra.
+        """
+        with self._sync_lock:
+            if max_eta is not None and self._tentato_at is not None \
+                    and time.monotonic() - self._tentato_at < max_eta:
+                return
+            self._tentato_at = time.monotonic()
+            db = self.db_factory()
+            db.connect()
+            try:
+                adesso = db.fetch_one(QUERY_ADESSO)
+                if adesso is None:
+                    return
+                if self._letto_fino is None:
+                    rows = db.fetch_query(QUERY_ULTIME_POSIZIONI)
+                else:
+                    rows = db.fetch_query(QUERY_NUOVE_POSIZIONI, (self._letto_fino - self.finestra,))
+            finally:
+                db.disconnect()
+
+            if rows is None:
+                return
+            self.update(rows)
+            # Anche con Traccia vuota: il prossimo riallineamento è incrementale
+            self._letto_fino = adesso['Adesso']
+            self._synced_at = time.monotonic()
+
+    def _ensure_fresh(self):
+        # Solo il primo caricamento avviene sul thread della richiesta; poi riallinea il thread in background
+        if self._synced_at is None:
+            try:
+                self.sync(max_eta=self.refresh_interval)
+            except ConnectionError as e:
+                print(f"Impossibile caricare l'indice delle posizioni: {e}")
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name='posizioni-sync', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.refresh_interval)
+            try:
+                self.sync(max_eta=self.refresh_interval / 2)
+            except Exception as e:
+                print(f"Impossibile aggiornare l'indice delle posizioni: {e}")
+
+    def get_missione(self, id_missione):
+        self._ensure_fresh()
+        with self._lock:
+            return self._by_missione.get(id_missione)
+
+    def get_drone(self, id_drone):
+        self._ensure_fresh()
+        with self._lock:
+            return self._by_drone.get(id_drone)
+
+    def get_missioni(self, ids):
+        """Ultime posizioni per un insieme di missioni (quelle senza tracce vengono omesse)"""
+        self._ensure_fresh()
+        with self._lock:
+            return {i: self._by_missione[i] for i in ids if i in self._by_missione}
+
+    def get_droni(self, ids):
+        """Ultime posizioni per un insieme di droni (quelli senza tracce vengono omessi)"""
+        self._ensure_fresh()
+        with self._lock:
+            return {i: self._by_drone[i] for i in ids if i in self._by_drone}
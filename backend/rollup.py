@@ -0,0 +1,120 @@
+"""
+Tabelle di riepilogo (rollup) per droni e piloti.
+
+StatDrone e StatPilota contengono numero di missioni, missioni completate,
+somma e numero delle valutazioni e data dell'ultima missione. Vengono
+aggiornate in modo incrementale a ogni scrittura su Missioni, così le
+statistiche non devono più aggregare tutto lo storico.
+
+Ricostruzione completa (recovery):
+    python -m backend.rollup
+"""
+from backend.db import Database
+
+TABELLE = (('StatDrone', 'ID_Drone', 'IdDrone'), ('StatPilota', 'ID_Pilota', 'IdPilota'))
+
+# Somma la riga inserita a quella già presente
+SOMMA_DELTA = """
+    ON DUPLICATE KEY UPDATE
+        NumMissioni = NumMissioni + VALUES(NumMissioni),
+        MissioniCompletate = MissioniCompletate + VALUES(MissioniCompletate),
+        SommaValutazioni = SommaValutazioni + VALUES(SommaValutazioni),
+        NumValutazioni = NumValutazioni + VALUES(NumValutazioni),
+        UltimaMissione = GREATEST(COALESCE(UltimaMissione, VALUES(UltimaMissione)),
+                                  COALESCE(VALUES(UltimaMissione), UltimaMissione))
+"""
+
+def _applica_delta(db, id_drone, id_pilota, missioni=0, completate=0, somma=0, valutazioni=0, data=None):
+    """Somma le variazioni indicate alle righe di riepilogo del drone e del pilota"""
+    for tabella, chiave, id_valore in (('StatDrone', 'ID_Drone', id_drone), ('StatPilota', 'ID_Pilota', id_pilota)):
+        query = f"""
+            INSERT INTO {tabella}
+                ({chiave}, NumMissioni, MissioniCompletate, SommaValutazioni, NumValutazioni, UltimaMissione)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            {SOMMA_DELTA}
+        """
+        db.execute_query(query, (id_valore, missioni, completate, somma, valutazioni, data))
+
+def registra_missione(db, id_drone, id_pilota, data_missione, stato, valutazione=None):
+    """Da chiamare dopo l'inserimento di una nuova missione"""
+    _applica_delta(
+        db, id_drone, id_pilota,
+        missioni=1,
+        completate=1 if stato == 'completata' else 0,
+        somma=valutazione or 0,
+        valutazioni=1 if valutazione is not None else 0,
+        data=data_missione
+    )
+
+def registra_missioni(db, ids):
+    """Da chiamare dopo l'inserimento di un blocco di missioni (import), nella stessa transazione"""
+    for tabella, chiave, colonna in TABELLE:
+        # La tabella derivata evita che l'UPDATE si riferisca alle colonne aggregate
+        db.execute_query(f"""
+            INSERT INTO {tabella}
+                ({chiave}, NumMissioni, MissioniCompletate, SommaValutazioni, NumValutazioni, UltimaMissione)
+            SELECT * FROM (
+                SELECT {colonna} as Chiave, COUNT(*) as Missioni, SUM(Stato = 'completata') as Completate,
+                       COALESCE(SUM(Valutazione), 0) as Somma, COUNT(Valutazione) as Valutate,
+                       MAX(DataMissione) as Ultima
+                FROM Missioni
+                WHERE ID IN ({', '.join(['%s'] * len(ids))})
+                GROUP BY {colonna}
+            ) nuove
+            {SOMMA_DELTA}
+        """, list(ids))
+
+# Le due funzioni seguenti calcolano la variazione direttamente dal valore attuale
+# in Missioni: vanno eseguite nella stessa transazione, prima dell'UPDATE su Missioni.
+
+def aggiorna_stato(db, id_missione, nuovo_stato):
+    """Aggiorna i riepiloghi per il cambio di stato di una missione"""
+    db.execute_query("""
+        UPDATE Missioni m
+        JOIN StatDrone sd ON sd.ID_Drone = m.IdDrone
+        JOIN StatPilota sp ON sp.ID_Pilota = m.IdPilota
+        SET sd.MissioniCompletate = sd.MissioniCompletate + (%s = 'completata') - (m.Stato = 'completata'),
+            sp.MissioniCompletate = sp.MissioniCompletate + (%s = 'completata') - (m.Stato = 'completata')
+        WHERE m.ID = %s
+    """, (nuovo_stato, nuovo_stato, id_missione))
+
+def aggiorna_valutazione(db, id_missione, valutazione):
+    """Aggiorna i riepiloghi per la nuova valutazione di una missione completata"""
+    db.execute_query("""
+        UPDATE Missioni m
+        JOIN StatDrone sd ON sd.ID_Drone = m.IdDrone
+        JOIN StatPilota sp ON sp.ID_Pilota = m.IdPilota
+        SET sd.SommaValutazioni = sd.SommaValutazioni + COALESCE(%s, 0) - COALESCE(m.Valutazione, 0),
+            sd.NumValutazioni = sd.NumValutazioni + (%s IS NOT NULL) - (m.Valutazione IS NOT NULL),
+            sp.SommaValutazioni = sp.SommaValutazioni + COALESCE(%s, 0) - COALESCE(m.Valutazione, 0),
+            sp.NumValutazioni = sp.NumValutazioni + (%s IS NOT NULL) - (m.Valutazione IS NOT NULL)
+        WHERE m.ID = %s AND m.Stato = 'completata'
+    """, (valutazione, valutazione, valutazione, valutazione, id_missione))
+
+def rebuild(db):
+    """Ricalcola da zero le tabelle di riepilogo a partire da Missioni"""
+    with db.transaction():
+        for tabella, chiave, colonna in TABELLE:
+            db.execute_query(f"DELETE FROM {tabella}")
+            db.execute_query(f"""
+                INSERT INTO {tabella}
+                    ({chiave}, NumMissioni, MissioniCompletate, SommaValutazioni, NumValutazioni, UltimaMissione)
+                SELECT {colonna},
+                       COUNT(*),
+                       SUM(Stato = 'completata'),
+                       COALESCE(SUM(Valutazione), 0),
+                       COUNT(Valutazione),
+                       MAX(DataMissione)
+                FROM Missioni
+                GROUP BY {colonna}
+            """)
+
+
+if __name__ == '__main__':
+    db = Database()
+    db.connect()
+    try:
+        rebuild(db)
+        print("Tabelle di riepilogo ricostruite")
+    finally:
+        db.disconnect()
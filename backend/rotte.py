@@ -0,0 +1,128 @@
+"""
+Analisi dei percorsi delle missioni completate a partire dalle tracce reali.
+
+Per ogni missione calcola durata del volo, lunghezza del percorso (haversine),
+velocità media e di picco e rapporto di deviazione rispetto alla linea retta
+tra punto di prelievo e di consegna. I calcoli sono vettorizzati su tutte le
+missioni insieme; i risultati sono memorizzati per missione, perché le tracce
+di una missione completata non cambiano più.
+"""
+import threading
+import numpy as np
+from backend.geo import haversine
+
+# Numero massimo di missioni per query IN (...)
+BLOCCO_MISSIONI = 500
+
+def metriche_percorsi(gruppi, lat, lon, ts, n_gruppi):
+    """
+    Calcola le metriche di volo per gruppo (missione o drone), in modo vettorizzato.
+    `gruppi` è l'indice del gruppo di ogni punto; i punti devono essere ordinati
+    per gruppo e poi per timestamp (`ts` in secondi).
+    Restituisce (punti, durata_s, distanza_m, velocita_picco_ms) come array per gruppo.
+    """
+    gruppi = np.asarray(gruppi, dtype=np.int64)
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    ts = np.asarray(ts, dtype=float)
+
+    punti = np.bincount(gruppi, minlength=n_gruppi)
+    durata = np.zeros(n_gruppi)
+    distanza = np.zeros(n_gruppi)
+    picco = np.zeros(n_gruppi)
+    if len(gruppi) == 0:
+        return punti, durata, distanza, picco
+
+    # Primo e ultimo timestamp di ogni gruppo
+    inizio = np.full(n_gruppi, np.inf)
+    fine = np.full(n_gruppi, -np.inf)
+    np.minimum.at(inizio, gruppi, ts)
+    np.maximum.at(fine, gruppi, ts)
+    presenti = punti > 0
+    durata[presenti] = fine[presenti] - inizio[presenti]
+
+    # Segmenti tra punti consecutivi dello stesso gruppo
+    stesso = gruppi[1:] == gruppi[:-1]
+    seg = haversine(lat[:-1], lon[:-1], lat[1:], lon[1:])[stesso]
+    dt = (ts[1:] - ts[:-1])[stesso]
+    seg_gruppi = gruppi[1:][stesso]
+
+    distanza = np.bincount(seg_gruppi, weights=seg, minlength=n_gruppi)
+    validi = dt > 0
+    np.maximum.at(picco, seg_gruppi[validi], seg[validi] / dt[validi])
+    return punti, durata, distanza, picco
+
+
+class RouteAnalytics:
+    """Metriche dei percorsi per missione, con cache per le missioni completate"""
+
+    def __init__(self):
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def invalida(self, id_missione):
+        with self._lock:
+            self._cache.pop(id_missione, None)
+
+    def svuota(self):
+        with self._lock:
+            self._cache.clear()
+
+    def analizza(self, db):
+        """Restituisce le metriche di tutte le missioni completate con almeno una traccia"""
+        missioni = db.fetch_query("""
+            SELECT ID, LatPrelievo, LongPrelievo, LatConsegna, LongConsegna
+            FROM Missioni
+            WHERE Stato = 'completata'
+        """) or []
+
+        with self._lock:
+            mancanti = [m for m in missioni if m['ID'] not in self._cache]
+        for i in range(0, len(mancanti), BLOCCO_MISSIONI):
+            self._calcola(db, mancanti[i:i + BLOCCO_MISSIONI])
+
+        with self._lock:
+            return [self._cache[m['ID']] for m in missioni if self._cache.get(m['ID'])]
+
+    def _calcola(self, db, missioni):
+        ids = [m['ID'] for m in missioni]
+        placeholders = ', '.join(['%s'] * len(ids))
+        tracce = db.fetch_query(f"""
+            SELECT ID_Missione, Latitudine, Longitudine, TIMESTAMP
+            FROM Traccia
+            WHERE ID_Missione IN ({placeholders})
+            ORDER BY ID_Missione, TIMESTAMP
+        """, ids)
+        if tracce is None:
+            return
+
+        posizione = {id_missione: i for i, id_missione in enumerate(ids)}
+        gruppi = np.fromiter((posizione[t['ID_Missione']] for t in tracce), dtype=np.int64, count=len(tracce))
+        lat = np.fromiter((t['Latitudine'] for t in tracce), dtype=float, count=len(tracce))
+        lon = np.fromiter((t['Longitudine'] for t in tracce), dtype=float, count=len(tracce))
+        ts = np.array([t['TIMESTAMP'] for t in tracce], dtype='datetime64[s]').astype(np.int64)
+
+        punti, durata, distanza, picco = metriche_percorsi(gruppi, lat, lon, ts, len(ids))
+        diretta = haversine(
+            [m['LatPrelievo'] for m in missioni], [m['LongPrelievo'] for m in missioni],
+            [m['LatConsegna'] for m in missioni], [m['LongConsegna'] for m in missioni]
+        )
+        with np.errstate(divide='ignore', invalid='ignore'):
+            media = np.where(durata > 0, distanza / durata, 0.0)
+            deviazione = np.where(diretta > 0, distanza / diretta, np.nan)
+
+        with self._lock:
+            for i, id_missione in enumerate(ids):
+                if punti[i] == 0:
+                    # Nessuna traccia: non memorizzata, potrebbe essere caricata in seguito
+                    continue
+                self._cache[id_missione] = {
+                    'id_missione': id_missione,
+                    'tracce': int(punti[i]),
+                    'durata_min': round(float(durata[i]) / 60, 2),
+                    'distanza_km': round(float(distanza[i]) / 1000, 3),
+                    'distanza_diretta_km': round(float(diretta[i]) / 1000, 3),
+                    'velocita_media_kmh': round(float(media[i]) * 3.6, 2),
+                    'velocita_picco_kmh': round(float(picco[i]) * 3.6, 2),
+                    'rapporto_deviazione': None if np.isnan(deviazione[i]) else round(float(deviazione[i]), 3)
+                }
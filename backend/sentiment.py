@@ -0,0 +1,319 @@
+"""
+Sentiment dei commenti delle valutazioni (Missioni.Commento), calcolato in locale.
+
+Il punteggio, tra -1 e 1, nasce da un lessico italiano di parole e radici con
+polarità, corretto per negazioni ("non puntuale"), intensificatori ("molto",
+"-issimo"), attenuatori ("leggero ritardo") e contrasti ("ma", "però").
+Viene salvato in Missioni.Sentiment (migrazione 005) quando la valutazione è
+scritta, così le statistiche si riducono a una query aggregata.
+
+Backfill dei commenti esistenti e benchmark:
+    python -m backend.sentiment --backfill
+    python -m backend.sentiment --benchmark --commenti 100000
+"""
+import argparse
+import math
+import re
+import sys
+import time
+import unicodedata
+from functools import lru_cache
+from mysql.connector import Error
+from backend.db import Database
+
+# Punteggi da SOGLIA in su sono positivi, da -SOGLIA in giù negativi
+SOGLIA = 0.05
+
+CHUNK_BACKFILL = 1000
+
+# Parole cercate solo per intero (brevi o ambigue come radice)
+PAROLE = {
+    'bene': 1.5, 'altezza': 1.5, 'benissimo': 3.0, 'ok': 0.5, 'top': 2.0, 'super': 2.0, 'grazie': 1.0,
+    'male': -1.5, 'malissimo': -3.0, 'rotto': -2.5, 'rotti': -2.5, 'rotte': -2.5,
+    'perso': -2.5, 'persa': -2.5, 'persi': -2.5, 'tardi': -1.5, 'manca': -1.5, 'mancava': -1.5,
+    'mancano': -1.5, 'aperto': -1.0, 'aperta': -1.0, 'sporco': -1.5, 'sporca': -1.5,
+}
+
+# Radici: valgono per tutte le forme che iniziano così (puntuale, puntuali, puntualità...)
+RADICI = {
+    'ottim': 3.0, 'eccellen': 3.0, 'perfett': 3.0, 'impeccabil': 3.0, 'fantastic': 3.0,
+    'magnific': 3.0, 'splendid': 3.0, 'ineccepibil': 3.0, 'eccezional': 3.0,
+    'puntual': 2.0, 'veloc': 2.0, 'rapid': 2.0, 'tempestiv': 2.0, 'efficien': 2.0,
+    'cortes': 2.0, 'gentil': 2.0, 'professional': 2.0, 'precis': 1.5, 'affidabil': 2.0,
+    'soddisfatt': 2.0, 'soddisfacent': 1.5, 'contento': 2.0, 'contenta': 2.0, 'felic': 2.0,
+    'brav': 2.0, 'buon': 1.5, 'miglior': 2.0, 'consigli': 1.5, 'integr': 1.5, 'curat': 1.5,
+    'comod': 1.0, 'facil': 1.0, 'sicur': 1.0, 'adeguat': 1.0, 'corrett': 1.5,
+    'ritard': -2.0, 'lent': -1.5, 'pessim': -3.0, 'terribil': -3.0, 'orribil': -3.0,
+    'disastr': -3.0, 'vergogn': -3.0, 'inaccettabil': -3.0, 'peggior': -2.5, 'scadent': -2.5,
+    'danneggi': -2.5, 'rovinat': -2.5, 'sbagliat': -2.0, 'errat': -2.0, 'error': -2.0,
+    'smarrit': -2.5, 'delus': -2.0, 'delud': -2.0, 'insoddisf': -2.5, 'problem': -1.5,
+    'reclam': -1.5, 'maleducat': -2.5, 'scortes': -2.0, 'graffi': -2.0, 'bagnat': -1.5,
+    'ammaccat': -2.0, 'mancant': -2.0, 'incomplet': -2.0, 'difficil': -1.0, 'scomod': -1.0,
+    'annullat': -1.0, 'attes': -0.5, 'inutil': -2.0, 'schiacciat': -2.0,
+}
+RADICE_MIN = min(len(r) for r in RADICI)
+
+# Invertono (e attenuano) la polarità delle parole che seguono, entro FINESTRA_NEGAZIONE
+# parole e fino alla punteggiatura
+NEGAZIONI = {'non', 'mai', 'nessun', 'nessuna', 'nessuno', 'niente', 'nulla', 'senza', 'ne'}
+FINESTRA_NEGAZIONE = 3
+FATTORE_NEGAZIONE = -0.75
+
+# Moltiplicano la polarità della parola successiva
+MODIFICATORI = {
+    'molto': 1.5, 'davvero': 1.5, 'veramente': 1.5, 'estremamente': 1.75, 'proprio': 1.25,
+    'assolutamente': 1.5, 'tanto': 1.25, 'troppo': 1.5, 'particolarmente': 1.25,
+    'abbastanza': 0.75, 'piuttosto': 0.75, 'leggero': 0.5, 'leggera': 0.5, 'leggermente': 0.5,
+    'lieve': 0.5, 'piccolo': 0.6, 'piccola': 0.6, 'po': 0.6, 'poco': -0.5, 'poca': -0.5,
+}
+# Superlativo assoluto (velocissimo, puntualissima)
+FATTORE_SUPERLATIVO = 1.3
+
+# Dopo "ma"/"però" conta di più la seconda parte della frase
+CONTRASTI = {'ma', 'pero', 'tuttavia', 'comunque'}
+PESO_PRIMA_CONTRASTO = 0.5
+PESO_DOPO_CONTRASTO = 1.5
+
+# Normalizzazione in [-1, 1]: s / sqrt(s^2 + ALFA)
+ALFA = 15
+
+ESCLAMAZIONE = 0.3
+
+_TOKEN = re.compile(r"[a-z]+|[!.,;:?]")
+
+def normalizza(testo):
+    """Minuscolo e senza accenti (però -> pero, qualità -> qualita)"""
+    testo = unicodedata.normalize('NFKD', testo.lower())
+    return ''.join(c for c in testo if not unicodedata.combining(c))
+
+@lru_cache(maxsize=65536)
+def polarita(parola):
+    """Polarità di una parola (0 se non nel lessico); memorizzata, le parole dei commenti si ripetono"""
+    valore = PAROLE.get(parola)
+    if valore is not None:
+        return valore
+    for lunghezza in range(len(parola), RADICE_MIN - 1, -1):
+        valore = RADICI.get(parola[:lunghezza])
+        if valore is not None:
+            return valore * FATTORE_SUPERLATIVO if 'issim' in parola else valore
+    return 0.0
+
+def punteggio(commento):
+    """Sentiment di un commento tra -1 e 1, None se il commento è vuoto"""
+    if not commento or not commento.strip():
+        return None
+    totale = 0.0
+    negazione = 0
+    modificatore = 1.0
+    esclamazioni = 0
+    for token in _TOKEN.findall(normalizza(commento)):
+        if len(token) == 1 and not token.isalpha():
+            esclamazioni += token == '!'
+            negazione = 0
+            continue
+        if token in NEGAZIONI:
+            negazione = FINESTRA_NEGAZIONE
+            continue
+        if token in CONTRASTI:
+            totale *= PESO_PRIMA_CONTRASTO
+            modificatore = PESO_DOPO_CONTRASTO
+            negazione = 0
+            continue
+        fattore = MODIFICATORI.get(token)
+        if fattore is not None:
+            modificatore *= fattore
+            continue
+
+        valore = polarita(token)
+        if valore:
+            if negazione:
+                valore *= FATTORE_NEGAZIONE
+            totale += valore * modificatore
+            # Il contrasto pesa su tutta la parte successiva, gli altri modificatori su una parola
+            modificatore = PESO_DOPO_CONTRASTO if modificatore >= PESO_DOPO_CONTRASTO else 1.0
+        if negazione:
+            negazione -= 1
+
+    if totale:
+        totale += math.copysign(min(esclamazioni, 3) * ESCLAMAZIONE, totale)
+    return round(totale / math.sqrt(totale * totale + ALFA), 3)
+
+def punteggi(commenti):
+    """Sentiment di un blocco di commenti, nello stesso ordine"""
+    return [punteggio(c) for c in commenti]
+
+def classe(valore):
+    """'positivo', 'neutro' o 'negativo' (None se il commento non ha punteggio)"""
+    if valore is None:
+        return None
+    if valore >= SOGLIA:
+        return 'positivo'
+    if valore <= -SOGLIA:
+        return 'negativo'
+    return 'neutro'
+
+# ============================================
+# BACKFILL E STATISTICHE
+# ============================================
+
+def backfill(db, chunk_size=CHUNK_BACKFILL, tutti=False):
+    """
+    Calcola il sentiment dei commenti senza punteggio (tutti i commenti con `tutti=True`,
+    ad esempio dopo una modifica del lessico), a blocchi di `chunk_size` missioni in ordine di ID.
+    Restituisce il numero di missioni aggiornate.
+    """
+    filtro = "" if tutti else " AND Sentiment IS NULL"
+    ultimo, aggiornate = 0, 0
+    while True:
+        righe = db.fetch_query(f"""
+            SELECT ID, Commento
+            FROM Missioni
+            WHERE ID > %s AND Commento IS NOT NULL AND Commento <> ''{filtro}
+            ORDER BY ID
+            LIMIT %s
+        """, (ultimo, chunk_size))
+        if not righe:
+            return aggiornate
+        ultimo = righe[-1]['ID']
+        with db.transaction():
+            _salva(db, righe)
+        aggiornate += len(righe)
+
+def analizza(db, ids):
+    """
+    Calcola il sentiment dei commenti delle missioni indicate (import massivo);
+    da eseguire nella transazione che le inserisce. Restituisce il numero di missioni aggiornate.
+    """
+    righe = db.fetch_query(f"""
+        SELECT ID, Commento
+        FROM Missioni
+        WHERE ID IN ({', '.join(['%s'] * len(ids))}) AND Commento IS NOT NULL AND Commento <> ''
+    """, list(ids))
+    if righe is None:
+        raise Error("Lettura dei commenti fallita")
+    if righe:
+        _salva(db, righe)
+    return len(righe)
+
+def _salva(db, righe):
+    """Scrive il sentiment delle righe (ID, Commento) con un solo UPDATE"""
+    valori = punteggi(r['Commento'] for r in righe)
+    params = []
+    for r, valore in zip(righe, valori):
+        params.extend((r['ID'], valore))
+    ids = [r['ID'] for r in righe]
+    db.execute_query(f"""
+        UPDATE Missioni
+        SET Sentiment = CASE ID {' '.join(['WHEN %s THEN %s'] * len(righe))} END
+        WHERE ID IN ({', '.join(['%s'] * len(ids))})
+    """, params + ids)
+
+QUERY_STATISTICHE = f"""
+    SELECT COUNT(*) as Valutate,
+           COUNT(Sentiment) as Analizzate,
+           COALESCE(SUM(Sentiment >= {SOGLIA}), 0) as Positivi,
+           COALESCE(SUM(Sentiment > -{SOGLIA} AND Sentiment < {SOGLIA}), 0) as Neutri,
+           COALESCE(SUM(Sentiment <= -{SOGLIA}), 0) as Negativi,
+           COALESCE(SUM(Sentiment IS NULL AND Commento <> ''), 0) as InAttesa,
+           AVG(Sentiment) as SentimentMedio,
+           AVG(Valutazione) as ValutazioneMedia,
+           COALESCE(SUM((Sentiment <= -{SOGLIA} AND Valutazione >= 8)
+                        OR (Sentiment >= {SOGLIA} AND Valutazione <= 4)), 0) as Discordanti
+    FROM Missioni
+    WHERE Valutazione IS NOT NULL
+"""
+
+def statistiche(db):
+    """Distribuzione del sentiment dei commenti delle missioni valutate, da una sola query aggregata"""
+    riga = db.fetch_one(QUERY_STATISTICHE)
+    if riga is None:
+        return None
+    return {
+        'positivi': int(riga['Positivi']),
+        'neutri': int(riga['Neutri']),
+        'negativi': int(riga['Negativi']),
+        'totale': int(riga['Analizzate']),
+        'valutate': int(riga['Valutate']),
+        'senza_commento': int(riga['Valutate']) - int(riga['Analizzate']) - int(riga['InAttesa']),
+        'in_attesa': int(riga['InAttesa']),
+        'sentiment_medio': round(float(riga['SentimentMedio']), 3) if riga['SentimentMedio'] is not None else None,
+        'valutazione_media': round(float(riga['ValutazioneMedia']), 2) if riga['ValutazioneMedia'] is not None else None,
+        # Commento negativo con voto alto o viceversa
+        'discordanti': int(riga['Discordanti'])
+    }
+
+# ============================================
+# BENCHMARK
+# ============================================
+
+# Commenti di esempio con la classe attesa, usati anche come controllo del lessico
+ESEMPI = (
+    ('Consegna puntuale', 'positivo'),
+    ('Ottima gestione', 'positivo'),
+    ('Leggero ritardo', 'negativo'),
+    ('Eccellente', 'positivo'),
+    ('Pacco integro', 'positivo'),
+    ('Buono', 'positivo'),
+    ('Soddisfacente', 'positivo'),
+    ('Perfetto!', 'positivo'),
+    ('Non puntuale', 'negativo'),
+    ('Pacco arrivato danneggiato', 'negativo'),
+    ('Molto in ritardo, pessimo servizio', 'negativo'),
+    ('Velocissimo e preciso', 'positivo'),
+    ('Un po\' lento ma il pacco era integro', 'positivo'),
+    ('Consegna rapida però pacco bagnato', 'negativo'),
+    ('Nessun problema', 'positivo'),
+    ('Drone arrivato alle 15', 'neutro'),
+    ('Non male', 'positivo'),
+    ('Pacco aperto e prodotto mancante', 'negativo'),
+    ('Tutto ok, grazie', 'positivo'),
+    ('Poco puntuale', 'negativo'),
+    ('Servizio non all\'altezza, deluso', 'negativo'),
+    ('Consegna nei tempi previsti', 'neutro'),
+)
+
+def benchmark(commenti=100000, chunk_size=CHUNK_BACKFILL, seed=42):
+    """Commenti al secondo valutati a blocchi e classi corrette sugli ESEMPI"""
+    import random
+    rng = random.Random(seed)
+    testi = [rng.choice(ESEMPI)[0] + rng.choice(('', '!', ' grazie', ' come sempre')) for _ in range(commenti)]
+
+    polarita.cache_clear()
+    start = time.perf_counter()
+    for i in range(0, commenti, chunk_size):
+        punteggi(testi[i:i + chunk_size])
+    risultati = {'commenti': commenti, 'commenti_s': round(commenti / (time.perf_counter() - start))}
+
+    corretti = sum(classe(punteggio(testo)) == attesa for testo, attesa in ESEMPI)
+    risultati['esempi_corretti'] = f"{corretti}/{len(ESEMPI)}"
+    return risultati
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sentiment dei commenti delle valutazioni")
+    parser.add_argument('--backfill', action='store_true', help="calcola il punteggio dei commenti esistenti")
+    parser.add_argument('--tutti', action='store_true', help="ricalcola anche i commenti già analizzati")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_BACKFILL)
+    parser.add_argument('--benchmark', action='store_true')
+    parser.add_argument('--commenti', type=int, default=100000)
+    args = parser.parse_args(argv)
+
+    if args.benchmark:
+        for chiave, valore in benchmark(args.commenti, args.chunk_size).items():
+            print(f"{chiave:<28}{valore}")
+        return 0
+
+    db = Database()
+    db.connect()
+    try:
+        if args.backfill:
+            print(f"Sentiment calcolato per {backfill(db, args.chunk_size, args.tutti)} commenti")
+            return 0
+        print(statistiche(db))
+        return 0
+    finally:
+        db.disconnect()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,156 @@
+"""
+Serializzazione JSON dei tipi restituiti da MySQL, per tutte le API.
+
+DATETIME diventa 'YYYY-MM-DD HH:MM:SS', DATE 'YYYY-MM-DD', TIME (timedelta)
+'H:MM:SS' e DECIMAL una stringa, come con il provider predefinito di Flask
+(nessuna perdita di precisione sulle coordinate). Se `orjson` è installato viene usato per
+liste e documenti compatti; altrimenti il modulo json della libreria standard.
+Gli handler restituiscono le righe così come arrivano dal cursore, senza
+convertirle una per una.
+
+Benchmark:
+    python -m backend.serializzazione --righe 100000
+"""
+import argparse
+import json
+import sys
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+COMPATTO = (',', ':')
+
+def _datetime(value):
+    return value.isoformat(' ', 'seconds')
+
+# Conversione per tipo esatto: un lookup al posto di una catena di isinstance
+CONVERSIONI = {
+    Decimal: str,
+    datetime: _datetime,
+    date: date.isoformat,
+    timedelta: str,
+}
+
+def json_default(value):
+    """Serializza i tipi restituiti da MySQL con lo stesso formato usato dalle API"""
+    conversione = CONVERSIONI.get(type(value))
+    if conversione is not None:
+        return conversione(value)
+    # Sottoclassi dei tipi gestiti
+    for tipo, conversione in CONVERSIONI.items():
+        if isinstance(value, tipo):
+            return conversione(value)
+    raise TypeError(f"Tipo non serializzabile: {type(value).__name__}")
+
+if orjson is not None:
+    # Date e orari passano da json_default per mantenere il formato senza 'T'
+    OPZIONI_ORJSON = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_SORT_KEYS
+
+    def dumps_bytes(obj):
+        """JSON compatto in UTF-8"""
+        return orjson.dumps(obj, default=json_default, option=OPZIONI_ORJSON)
+else:
+    def dumps_bytes(obj):
+        """JSON compatto in UTF-8"""
+        return json.dumps(obj, default=json_default, separators=COMPATTO, sort_keys=True).encode('utf-8')
+
+def dumps(obj):
+    """JSON compatto come stringa (stream NDJSON, eventi SSE, export)"""
+    return dumps_bytes(obj).decode('utf-8')
+
+
+class JSONProvider(DefaultJSONProvider):
+    """Provider JSON dell'app Flask: tipi MySQL nativi e percorso veloce con orjson"""
+
+    default = staticmethod(json_default)
+
+    def dumps(self, obj, **kwargs):
+        if not kwargs or kwargs == {'separators': COMPATTO}:
+            return dumps(obj)
+        return super().dumps(obj, **kwargs)
+
+    def response(self, *args, **kwargs):
+        if self.compact is False or (self.compact is None and self._app.debug):
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps_bytes(obj) + b'\n', mimetype=self.mimetype)
+
+
+# ============================================
+# BENCHMARK
+# ============================================
+
+def _righe_missioni(n):
+    return [{
+        'ID': i, 'DataMissione': date(2024, 1, 1) + timedelta(days=i % 365),
+        'Ora': timedelta(hours=8 + i % 10, minutes=i % 60), 'LatPrelievo': Decimal('45.4642035'),
+        'LongPrelievo': Decimal('9.1899820'), 'LatConsegna': Decimal('45.4781234'),
+        'LongConsegna': Decimal('9.2250012'), 'Valutazione': i % 10 or None,
+        'Commento': 'Consegna puntuale', 'IdDrone': i % 50, 'IdPilota': i % 20, 'Stato': 'completata',
+        'DroneModello': 'DJI Matrice 300', 'PilotaNome': 'Mario', 'PilotaCognome': 'Rossi'
+    } for i in range(n)]
+
+def _righe_tracce(n):
+    inizio = datetime(2024, 1, 1, 10, 0)
+    return [{
+        'ID_Drone': 3, 'ID_Missione': 7, 'Latitudine': Decimal('45.4642035'),
+        'Longitudine': Decimal('9.1899820'), 'TIMESTAMP': inizio + timedelta(seconds=i)
+    } for i in range(n)]
+
+def _precedente_missioni(righe):
+    # Conversione negli handler e provider predefinito di Flask (prima di questo modulo)
+    for r in righe:
+        r['DataMissione'] = r['DataMissione'].strftime('%Y-%m-%d')
+        r['Ora'] = str(r['Ora'])
+    return json.dumps(righe, default=lambda v: str(v), separators=COMPATTO, sort_keys=True).encode('utf-8')
+
+def _precedente_tracce(righe):
+    for r in righe:
+        r['TIMESTAMP'] = r['TIMESTAMP'].strftime('%Y-%m-%d %H:%M:%S')
+    return json.dumps(righe, default=lambda v: str(v), separators=COMPATTO, sort_keys=True).encode('utf-8')
+
+def _stdlib(righe):
+    return json.dumps(righe, default=json_default, separators=COMPATTO, sort_keys=True).encode('utf-8')
+
+def benchmark(righe=100000, ripetizioni=3):
+    """Righe al secondo serializzate per le forme di Missioni e Traccia"""
+    risultati = []
+    for forma, genera, precedente in (
+        ('Missioni', _righe_missioni, _precedente_missioni),
+        ('Traccia', _righe_tracce, _precedente_tracce),
+    ):
+        metodi = [('precedente', precedente), ('stdlib', _stdlib)]
+        if orjson is not None:
+            metodi.append(('orjson', dumps_bytes))
+        for nome, funzione in metodi:
+            migliore = None
+            for _ in range(ripetizioni):
+                dati = genera(righe)
+                start = time.perf_counter()
+                funzione(dati)
+                durata = time.perf_counter() - start
+                migliore = durata if migliore is None else min(migliore, durata)
+            risultati.append((forma, nome, righe / migliore))
+    return risultati
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark della serializzazione JSON delle API")
+    parser.add_argument('--righe', type=int, default=100000)
+    parser.add_argument('--ripetizioni', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    print(f"{'forma':<10}{'metodo':<12}{'righe/s':>12}")
+    for forma, metodo, velocita in benchmark(args.righe, args.ripetizioni):
+        print(f"{forma:<10}{metodo:<12}{velocita:>12,.0f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
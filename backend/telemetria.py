@@ -0,0 +1,261 @@
+"""
+Ingest ad alto throughput delle tracce GPS (tabella Traccia).
+
+Le posizioni ricevute vengono accodate in un buffer in memoria (write-behind) e
+scritte nel database con INSERT multi-riga quando il buffer raggiunge
+`batch_size` righe oppure ogni `flush_interval` secondi. Se un blocco viene
+rifiutato per un errore nei dati (ad esempio un ID_Drone o ID_Missione
+inesistente) è diviso a metà fino a isolare le righe non valide: solo quelle
+vengono scartate e restano visibili in `metrics()`. Con qualsiasi altro errore
+(connessione persa, deadlock, timeout dei lock) le righe non ancora scritte
+tornano in coda e il flush viene ritentato con un'attesa crescente.
+"""
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from mysql.connector import Error
+
+CAMPI_TRACCIA = ('ID_Drone', 'ID_Missione', 'Latitudine', 'Longitudine', 'TIMESTAMP')
+
+# Righe scartate conservate per la diagnostica (le più recenti)
+MAX_SCARTATE = 100
+
+# Errori MySQL/MariaDB dovuti ai dati della riga: ripetere l'INSERT non servirebbe.
+# Tutti gli altri (es. 1213 deadlock, 1205 timeout dei lock) rimettono le righe in coda.
+ERRORI_DATI = {
+    1048,  # ER_BAD_NULL_ERROR
+    1264,  # ER_WARN_DATA_OUT_OF_RANGE
+    1292,  # ER_TRUNCATED_WRONG_VALUE
+    1366,  # ER_TRUNCATED_WRONG_VALUE_FOR_FIELD
+    1406,  # ER_DATA_TOO_LONG
+    1452,  # ER_NO_REFERENCED_ROW_2 (drone o missione inesistente)
+    3819,  # ER_CHECK_CONSTRAINT_VIOLATED (MySQL)
+    4025,  # ER_CONSTRAINT_FAILED (MariaDB)
+}
+
+# Attesa massima (secondi) fra due flush falliti
+MAX_ATTESA_ERRORE = 30.0
+
+
+class ScritturaRinviata(ConnectionError):
+    """Flush interrotto da un errore non dovuto ai dati: le righe non scritte sono di nuovo in coda"""
+
+INSERT_TRACCIA = """
+    INSERT INTO Traccia (ID_Drone, ID_Missione, Latitudine, Longitudine, TIMESTAMP)
+    VALUES (%s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE ID_Drone = ID_Drone
+"""
+
+def parse_traccia(item):
+    """
+    Valida una posizione ricevuta dal drone, come oggetto con i campi di Traccia
+    oppure come array [ID_Drone, ID_Missione, Latitudine, Longitudine, TIMESTAMP].
+    Solleva ValueError se i dati non sono validi.
+    """
+    if isinstance(item, dict):
+        try:
+            values = [item[campo] for campo in CAMPI_TRACCIA]
+        except KeyError as e:
+            raise ValueError(f"Campo mancante: {e.args[0]}")
+    elif isinstance(item, (list, tuple)) and len(item) == len(CAMPI_TRACCIA):
+        values = list(item)
+    else:
+        raise ValueError("Formato traccia non valido")
+
+    id_drone, id_missione, lat, lon, timestamp = values
+    try:
+        id_drone = int(id_drone)
+        id_missione = int(id_missione)
+        lat = Decimal(str(lat)).quantize(Decimal('0.0000001'))
+        lon = Decimal(str(lon)).quantize(Decimal('0.0000001'))
+        timestamp = datetime.fromisoformat(str(timestamp)).replace(tzinfo=None, microsecond=0)
+    except (TypeError, ValueError, InvalidOperation):
+        raise ValueError("Valori traccia non validi")
+
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError("Coordinate fuori intervallo")
+    return (id_drone, id_missione, lat, lon, timestamp)
+
+
+class TelemetryBuffer:
+    """
+    Coda write-behind per le tracce GPS.
+
+    Le righe duplicate sulla chiave primaria (ID_Drone, ID_Missione, TIMESTAMP)
+    vengono scartate già nel buffer; quelle già presenti nel database vengono
+    ignorate dall'INSERT. In modalità `sync` ogni `add` esegue subito il flush
+    (utile nei test).
+    """
+
+    def __init__(self, db_factory, batch_size=None, flush_interval=None, max_queue=None, sync=None):
+        self.db_factory = db_factory
+        self.batch_size = batch_size or int(os.getenv('TELEMETRIA_BATCH_SIZE', 500))
+        self.flush_interval = flush_interval or float(os.getenv('TELEMETRIA_FLUSH_INTERVAL', 1.0))
+        self.max_queue = max_queue or int(os.getenv('TELEMETRIA_MAX_QUEUE', 100000))
+        self.sync = sync if sync is not None else os.getenv('TELEMETRIA_SYNC', '0') == '1'
+
+        # Funzioni chiamate con le righe scritte dopo ogni flush riuscito
+        self.listeners = []
+
+        self._pending = {}
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+
+        # Metriche
+        self.accepted = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.flushes = 0
+        self.rows_written = 0
+        self.rows_failed = 0
+        self.scartate = deque(maxlen=MAX_SCARTATE)
+        self.flush_time = 0.0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+
+    def add(self, tracce):
+        """
+        Accoda una lista di tracce già validate.
+        Restituisce il numero di righe accettate; solleva OverflowError se la coda è piena.
+        """
+        with self._cond:
+            if len(self._pending) + len(tracce) > self.max_queue:
+                self.rejected += len(tracce)
+                raise OverflowError("Coda telemetria piena")
+
+            accepted = 0
+            for traccia in tracce:
+                key = (traccia[0], traccia[1], traccia[4])
+                if key in self._pending:
+                    self.duplicates += 1
+                    continue
+                self._pending[key] = traccia
+                accepted += 1
+            self.accepted += accepted
+
+            if not self.sync:
+                self._ensure_thread()
+                if len(self._pending) >= self.batch_size:
+                    self._cond.notify()
+
+        if self.sync:
+            self.flush()
+        return accepted
+
+    def _ensure_thread(self):
+        # Avviato al primo utilizzo, così funziona anche dopo un fork dei worker
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='telemetria-flush', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        attesa = 0
+        while True:
+            with self._cond:
+                if len(self._pending) < self.batch_size:
+                    self._cond.wait(self.flush_interval)
+            try:
+                self.flush()
+                attesa = 0
+            except Exception as e:
+                # Senza attesa, con il database giù e la coda piena il ciclo girerebbe a vuoto
+                attesa = min(MAX_ATTESA_ERRORE, attesa * 2 if attesa else self.flush_interval)
+                print(f"Errore durante il flush della telemetria: {e}, nuovo tentativo fra {attesa:.1f} s")
+                time.sleep(attesa)
+
+    def _requeue(self, rows):
+        with self._cond:
+            for traccia in rows:
+                self._pending.setdefault((traccia[0], traccia[1], traccia[4]), traccia)
+
+    def _scrivi(self, db, rows, written, failed):
+        """
+        INSERT multi-riga di `rows`; se viene rifiutato per un errore nei dati divide il blocco
+        a metà fino a isolare le righe non valide. Restituisce l'errore che ha interrotto la
+        scrittura (le righe vanno rimesse in coda), None se il blocco è stato elaborato.
+        """
+        try:
+            with db.transaction():
+                db.execute_many(INSERT_TRACCIA, rows)
+        except Error as e:
+            if e.errno not in ERRORI_DATI or not db.connection.is_connected():
+                return e
+        else:
+            written.extend(rows)
+            return None
+        if len(rows) == 1:
+            failed.append(rows[0])
+            return None
+        meta = len(rows) // 2
+        return self._scrivi(db, rows[:meta], written, failed) or self._scrivi(db, rows[meta:], written, failed)
+
+    def flush(self):
+        """Scrive nel database tutte le righe in coda, a blocchi di `batch_size`"""
+        with self._flush_lock:
+            with self._cond:
+                if not self._pending:
+                    return 0
+                rows = list(self._pending.values())
+                self._pending = {}
+
+            start = time.perf_counter()
+            written, failed, errore = [], [], None
+            db = self.db_factory()
+            try:
+                db.connect()
+            except ConnectionError:
+                # Database non raggiungibile: le righe tornano in coda per il prossimo flush
+                self._requeue(rows)
+                raise
+            try:
+                for i in range(0, len(rows), self.batch_size):
+                    errore = self._scrivi(db, rows[i:i + self.batch_size], written, failed)
+                    if errore is not None:
+                        # Connessione persa o errore transitorio: le righe non ancora scritte tornano in coda
+                        fatte = {(t[0], t[1], t[4]) for t in written + failed}
+                        self._requeue([t for t in rows if (t[0], t[1], t[4]) not in fatte])
+                        break
+            finally:
+                db.disconnect()
+
+            self.rows_failed += len(failed)
+            self.scartate.extend(dict(zip(CAMPI_TRACCIA, traccia)) for traccia in failed)
+
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            self.flushes += 1
+            self.rows_written += len(written)
+            self.flush_time += elapsed_ms
+            self.last_flush_ms = elapsed_ms
+            self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+
+        for listener in self.listeners:
+            try:
+                listener(written)
+            except Exception as e:
+                print(f"Errore in un listener della telemetria: {e}")
+        if errore is not None:
+            raise ScritturaRinviata(f"Flush della telemetria interrotto, righe rimesse in coda: {errore}")
+        return len(written)
+
+    def metrics(self):
+        """Restituisce profondità della coda e tempi di flush"""
+        with self._cond:
+            depth = len(self._pending)
+        return {
+            'queue_depth': depth,
+            'accepted': self.accepted,
+            'duplicates': self.duplicates,
+            'rejected': self.rejected,
+            'flushes': self.flushes,
+            'rows_written': self.rows_written,
+            'rows_failed': self.rows_failed,
+            'ultime_scartate': list(self.scartate),
+            'last_flush_ms': round(self.last_flush_ms, 2),
+            'avg_flush_ms': round(self.flush_time / self.flushes, 2) if self.flushes else 0,
+            'max_flush_ms': round(self.max_flush_ms, 2),
+            'sync': self.sync
+        }
@@ -0,0 +1,58 @@
+"""
+Configurazione di produzione per Gunicorn (caricata automaticamente da `gunicorn wsgi:app`).
+
+Worker pre-fork con thread (gthread): ogni worker importa l'applicazione dopo
+il fork, quindi pool di connessioni, thread di flush e indici in memoria sono
+creati nel processo figlio. Tutti i parametri sono configurabili da .env.
+"""
+import multiprocessing
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', 5001)}"
+
+# Processi e thread per processo (gli stream SSE occupano un thread ciascuno, fino a
+# LIVE_MAX_STREAM per worker: con molti spettatori usare backend.asgi:app)
+workers = int(os.getenv('WEB_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+worker_class = 'gthread'
+threads = int(os.getenv('WEB_THREADS', 8))
+
+# Nessun preload: il database non viene mai toccato dal processo master
+preload_app = False
+
+# Keep-alive delle connessioni HTTP (secondi), da tenere sotto il timeout del proxy
+keepalive = int(os.getenv('WEB_KEEPALIVE', 5))
+
+# Riciclo dei worker dopo N richieste (0 = mai), con jitter per non riavviarli tutti insieme
+max_requests = int(os.getenv('WEB_MAX_REQUESTS', 10000))
+max_requests_jitter = int(os.getenv('WEB_MAX_REQUESTS_JITTER', 1000))
+
+# Timeout di un worker bloccato e tempo concesso alle richieste in corso allo shutdown (SIGTERM)
+timeout = int(os.getenv('WEB_TIMEOUT', 60))
+graceful_timeout = int(os.getenv('WEB_GRACEFUL_TIMEOUT', 30))
+
+accesslog = os.getenv('WEB_ACCESS_LOG') or None
+errorlog = '-'
+
+
+def post_worker_init(worker):
+    """Carica gli indici delle posizioni e del catalogo nel worker appena avviato, prima delle richieste"""
+    from backend.app import catalogo, posizioni
+    try:
+        posizioni.sync()
+    except ConnectionError as e:
+        worker.log.warning(f"Indice delle posizioni non caricato: {e}")
+    try:
+        catalogo.sync()
+    except ConnectionError as e:
+        worker.log.warning(f"Indice del catalogo non caricato: {e}")
+
+def worker_exit(server, worker):
+    """Scrive le tracce ancora in coda prima che il worker termini (shutdown o riciclo)"""
+    from backend.app import telemetria
+    try:
+        telemetria.flush()
+    except ConnectionError as e:
+        worker.log.error(f"Tracce in coda non scritte: {e}")
@@ -29,6 +29,8 @@ INSERT INTO Drone (Modello, Capacita, Batteria) VALUES
 
 -- ============================================
 -- UTENTI (5 clienti)
+-- Password in chiaro solo per i dati di test: il backend le sostituisce con l'hash al primo login.
+-- Nessun amministratore: si crea con python -m backend.auth --crea-utente (vedi README)
 -- ============================================
 INSERT INTO Utente (Nome, Mail, Password, Ruolo) VALUES
 ('Mario Rossi', 'mario.rossi@mail.com', 'pass123', 'cliente'),
@@ -280,6 +282,20 @@ INSERT INTO Traccia (ID_Drone, ID_Missione, Latitudine, Longitudine, TIMESTAMP)
 (10, 10, 45.4810000, 9.2175000, '2025-11-23 17:09:00'),
 (10, 10, 45.4810000, 9.2180000, '2025-11-23 17:12:00');
 
+-- ============================================
+-- RIEPILOGHI (StatDrone, StatPilota) - DA MISSIONI
+-- Equivalente a: python -m backend.rollup
+-- ============================================
+INSERT INTO StatDrone (ID_Drone, NumMissioni, MissioniCompletate, SommaValutazioni, NumValutazioni, UltimaMissione)
+SELECT IdDrone, COUNT(*), SUM(Stato = 'completata'), COALESCE(SUM(Valutazione), 0), COUNT(Valutazione), MAX(DataMissione)
+FROM Missioni
+GROUP BY IdDrone;
+
+INSERT INTO StatPilota (ID_Pilota, NumMissioni, MissioniCompletate, SommaValutazioni, NumValutazioni, UltimaMissione)
+SELECT IdPilota, COUNT(*), SUM(Stato = 'completata'), COALESCE(SUM(Valutazione), 0), COUNT(Valutazione), MAX(DataMissione)
+FROM Missioni
+GROUP BY IdPilota;
+
 -- ============================================
 -- FINE SCRIPT
 -- ============================================
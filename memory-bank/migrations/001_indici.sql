@@ -0,0 +1,26 @@
+-- ============================================
+-- MIGRAZIONE 001 - INDICI SECONDARI
+-- Indici per i predicati e gli ordinamenti usati dalle API
+-- Applicare con: python -m backend.migrate
+-- ============================================
+
+-- Filtro per stato (/api/missioni/stato/<stato>, statistiche, flotta in corso)
+CREATE INDEX IDX_Missioni_Stato ON Missioni (Stato);
+
+-- Ordinamento e paginazione keyset di /api/missioni
+CREATE INDEX IDX_Missioni_Data_Ora ON Missioni (DataMissione, Ora, ID);
+
+-- Tracce di una missione in ordine temporale (/api/tracce/missione, /api/tracce/ultima, stream live)
+CREATE INDEX IDX_Traccia_Missione_Timestamp ON Traccia (ID_Missione, TIMESTAMP);
+
+-- Riallineamento incrementale dell'indice delle posizioni (TIMESTAMP > ultimo letto)
+CREATE INDEX IDX_Traccia_Timestamp ON Traccia (TIMESTAMP);
+
+-- Ordini di un utente in ordine cronologico (/api/ordini/utente/<id>)
+CREATE INDEX IDX_Ordine_Utente_Orario ON Ordine (ID_Utente, Orario);
+
+-- Ordinamento e paginazione keyset di /api/ordini
+CREATE INDEX IDX_Ordine_Orario ON Ordine (Orario, ID);
+
+-- Filtro per categoria (/api/prodotti/categoria/<categoria>)
+CREATE INDEX IDX_Prodotto_Categoria ON Prodotto (categoria);
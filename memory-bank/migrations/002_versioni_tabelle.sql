@@ -0,0 +1,31 @@
+-- ============================================
+-- MIGRAZIONE 002 - VERSIONI DELLE TABELLE
+-- Versione per tabella incrementata dai trigger a ogni scrittura, usata come
+-- ETag delle liste di droni e prodotti (backend/condizionale.py)
+-- Applicare con: python -m backend.migrate
+-- ============================================
+
+CREATE TABLE IF NOT EXISTS VersioneTabella (
+    Tabella VARCHAR(64) PRIMARY KEY,
+    Versione BIGINT UNSIGNED NOT NULL DEFAULT 0
+);
+
+INSERT IGNORE INTO VersioneTabella (Tabella) VALUES ('Drone'), ('Prodotto');
+
+CREATE TRIGGER TRG_Drone_Versione_Insert AFTER INSERT ON Drone
+FOR EACH ROW UPDATE VersioneTabella SET Versione = Versione + 1 WHERE Tabella = 'Drone';
+
+CREATE TRIGGER TRG_Drone_Versione_Update AFTER UPDATE ON Drone
+FOR EACH ROW UPDATE VersioneTabella SET Versione = Versione + 1 WHERE Tabella = 'Drone';
+
+CREATE TRIGGER TRG_Drone_Versione_Delete AFTER DELETE ON Drone
+FOR EACH ROW UPDATE VersioneTabella SET Versione = Versione + 1 WHERE Tabella = 'Drone';
+
+CREATE TRIGGER TRG_Prodotto_Versione_Insert AFTER INSERT ON Prodotto
+FOR EACH ROW UPDATE VersioneTabella SET Versione = Versione + 1 WHERE Tabella = 'Prodotto';
+
+CREATE TRIGGER TRG_Prodotto_Versione_Update AFTER UPDATE ON Prodotto
+FOR EACH ROW UPDATE VersioneTabella SET Versione = Versione + 1 WHERE Tabella = 'Prodotto';
+
+CREATE TRIGGER TRG_Prodotto_Versione_Delete AFTER DELETE ON Prodotto
+FOR EACH ROW UPDATE VersioneTabella SET Versione = Versione + 1 WHERE Tabella = 'Prodotto';
@@ -0,0 +1,29 @@
+-- ============================================
+-- MIGRAZIONE 003 - DOMANDA ORARIA
+-- Ordini aggregati per giorno, ora, Tipo e zona di consegna (celle di 0.02 gradi,
+-- ZONA_GRADI in backend/domanda.py), aggiornati in modo incrementale dal backend
+-- Applicare con: python -m backend.migrate
+-- Ricostruzione: python -m backend.domanda --rebuild
+-- ============================================
+
+CREATE TABLE IF NOT EXISTS DomandaOraria (
+    Giorno DATE NOT NULL,
+    Ora TINYINT UNSIGNED NOT NULL,
+    Tipo VARCHAR(50) NOT NULL,
+    CellaLat INT NOT NULL,
+    CellaLon INT NOT NULL,
+    NumOrdini INT NOT NULL DEFAULT 0,
+    PesoTotale DECIMAL(14,2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (Giorno, Ora, Tipo, CellaLat, CellaLon)
+);
+
+-- Popolamento iniziale dallo storico, con un'unica query aggregata
+INSERT INTO DomandaOraria (Giorno, Ora, Tipo, CellaLat, CellaLon, NumOrdini, PesoTotale)
+SELECT DATE(o.Orario), HOUR(o.Orario), o.Tipo,
+       FLOOR(m.LatConsegna / 0.02), FLOOR(m.LongConsegna / 0.02),
+       COUNT(*), SUM(o.PesoTotale)
+FROM Ordine o
+JOIN Missioni m ON o.ID_Missione = m.ID
+GROUP BY DATE(o.Orario), HOUR(o.Orario), o.Tipo,
+         FLOOR(m.LatConsegna / 0.02), FLOOR(m.LongConsegna / 0.02)
+ON DUPLICATE KEY UPDATE NumOrdini = VALUES(NumOrdini), PesoTotale = VALUES(PesoTotale);
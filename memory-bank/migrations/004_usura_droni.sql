@@ -0,0 +1,41 @@
+-- ============================================
+-- MIGRAZIONE 004 - USURA E MANUTENZIONE DRONI
+-- Accumulatori di volo per drone (tempo, distanza, missioni: totali, dall'ultimo
+-- intervento e dall'ultima sostituzione della batteria) aggiornati dall'ingest
+-- della telemetria, e storico degli interventi di manutenzione
+-- Applicare con: python -m backend.migrate
+-- Popolamento dallo storico delle tracce: python -m backend.manutenzione --rebuild
+-- ============================================
+
+CREATE TABLE IF NOT EXISTS UsuraDrone (
+    ID_Drone INT PRIMARY KEY,
+    TempoVolo INT NOT NULL DEFAULT 0,
+    Distanza DECIMAL(14,1) NOT NULL DEFAULT 0,
+    Missioni INT NOT NULL DEFAULT 0,
+    TempoVoloServizio INT NOT NULL DEFAULT 0,
+    DistanzaServizio DECIMAL(14,1) NOT NULL DEFAULT 0,
+    MissioniServizio INT NOT NULL DEFAULT 0,
+    TempoVoloBatteria INT NOT NULL DEFAULT 0,
+    UltimoServizio DATETIME,
+    UltimaBatteria DATETIME,
+    -- Ultimo punto già contato: il segmento successivo parte da qui
+    UltimaMissione INT,
+    UltimaLat DECIMAL(10,7),
+    UltimaLon DECIMAL(11,7),
+    UltimoTimestamp DATETIME,
+    CONSTRAINT FK_UsuraDrone_Drone FOREIGN KEY (ID_Drone) REFERENCES Drone(ID) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS Manutenzione (
+    ID INT AUTO_INCREMENT PRIMARY KEY,
+    ID_Drone INT NOT NULL,
+    Data DATETIME NOT NULL,
+    Tipo ENUM('ordinaria', 'batteria') NOT NULL,
+    TempoVolo INT NOT NULL DEFAULT 0,
+    Distanza DECIMAL(14,1) NOT NULL DEFAULT 0,
+    Missioni INT NOT NULL DEFAULT 0,
+    TempoVoloBatteria INT NOT NULL DEFAULT 0,
+    Note VARCHAR(255),
+    INDEX IDX_Manutenzione_Drone (ID_Drone, Data),
+    CONSTRAINT FK_Manutenzione_Drone FOREIGN KEY (ID_Drone) REFERENCES Drone(ID) ON DELETE CASCADE
+);
@@ -0,0 +1,9 @@
+-- ============================================
+-- MIGRAZIONE 005 - SENTIMENT DEI COMMENTI
+-- Punteggio tra -1 e 1 del commento di ogni missione valutata (backend/sentiment.py),
+-- scritto insieme alla valutazione; NULL se il commento è vuoto o non ancora analizzato
+-- Applicare con: python -m backend.migrate
+-- Backfill dei commenti esistenti: python -m backend.sentiment --backfill
+-- ============================================
+
+ALTER TABLE Missioni ADD COLUMN Sentiment DECIMAL(4,3) NULL;
@@ -0,0 +1,10 @@
+-- ============================================
+-- MIGRAZIONE 006 - PASSWORD CON HASH
+-- Segna le password esistenti come ancora in chiaro: al primo login riuscito
+-- il backend le sostituisce con l'hash (scrypt) e azzera il flag.
+-- Le nuove righe inserite senza indicare la colonna (data.sql, benchmark)
+-- restano in chiaro fino al primo login, come quelle esistenti.
+-- Applicare con: python -m backend.migrate
+-- ============================================
+
+ALTER TABLE Utente ADD COLUMN PasswordInChiaro BOOLEAN NOT NULL DEFAULT TRUE;
@@ -0,0 +1,47 @@
+-- ============================================
+-- MIGRAZIONE 007 - VERSIONI DI MISSIONI, PILOTI E ORDINI
+-- Estende VersioneTabella (migrazione 002) alle tabelle lette dalle statistiche:
+-- ogni worker confronta periodicamente le versioni e invalida le voci della
+-- propria cache (backend/cache.py) anche per le scritture servite dagli altri.
+-- Traccia resta esclusa: un trigger per riga renderebbe la versione un punto
+-- di contesa dell'ingest; l'indice delle posizioni usa una query incrementale.
+-- Applicare con: python -m backend.migrate
+-- ============================================
+
+INSERT IGNORE INTO VersioneTabella (Tabella) VALUES ('Missioni'), ('Pilota'), ('Ordine'), ('Contiene');
+
+CREATE TRIGGER TRG_Missioni_Versione_Insert AFTER INSERT ON Missioni
+FOR EACH ROW UPDATE VersioneTabella SET Versione = Versione + 1 WHERE Tabella = 'Missioni';
+
+CREATE TRIGGER TRG_Missioni_Versione_Update AFTER UPDATE ON Missioni
+FOR EACH ROW UPDATE VersioneTabella SET Versione = Versione + 1 WHERE Tabella = 'Missioni';
+
+CREATE TRIGGER TRG_Missioni_Versione_Delete AFTER DELETE ON Missioni
+FOR EACH ROW UPDATE VersioneTabella SET Versione = Versione + 1 WHERE Tabella = 'Missioni';
+
+CREATE TRIGGER TRG_Pilota_Versione_Insert AFTER INSERT ON Pilota
+FOR EACH ROW UPDATE VersioneTabella SET Versione = Versione + 1 WHERE Tabella = 'Pilota';
+
+CREATE TRIGGER TRG_Pilota_Versione_Update AFTER UPDATE ON Pilota
+FOR EACH ROW UPDATE VersioneTabella SET Versione = Versione + 1 WHERE Tabella = 'Pilota';
+
+CREATE TRIGGER TRG_Pilota_Versione_Delete AFTER DELETE ON Pilota
+FOR EACH ROW UPDATE VersioneTabella SET Versione = Versione + 1 WHERE Tabella = 'Pilota';
+
+CREATE TRIGGER TRG_Ordine_Versione_Insert AFTER INSERT ON Ordine
+FOR EACH ROW UPDATE VersioneTabella SET Versione = Versione + 1 WHERE Tabella = 'Ordine';
+
+CREATE TRIGGER TRG_Ordine_Versione_Update AFTER UPDATE ON Ordine
+FOR EACH ROW UPDATE VersioneTabella SET Versione = Versione + 1 WHERE Tabella = 'Ordine';
+
+CREATE TRIGGER TRG_Ordine_Versione_Delete AFTER DELETE ON Ordine
+FOR EACH ROW UPDATE VersioneTabella SET Versione = Versione + 1 WHERE Tabella = 'Ordine';
+
+CREATE TRIGGER TRG_Contiene_Versione_Insert AFTER INSERT ON Contiene
+FOR EACH ROW UPDATE VersioneTabella SET Versione = Versione + 1 WHERE Tabella = 'Contiene';
+
+CREATE TRIGGER TRG_Contiene_Versione_Update AFTER UPDATE ON Contiene
+FOR EACH ROW UPDATE VersioneTabella SET Versione = Versione + 1 WHERE Tabella = 'Contiene';
+
+CREATE TRIGGER TRG_Contiene_Versione_Delete AFTER DELETE ON Contiene
+FOR EACH ROW UPDATE VersioneTabella SET Versione = Versione + 1 WHERE Tabella = 'Contiene';
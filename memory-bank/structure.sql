@@ -108,4 +108,32 @@ CREATE TABLE IF NOT EXISTS Traccia (
     PRIMARY KEY (ID_Drone, ID_Missione, TIMESTAMP),
     CONSTRAINT FK_Traccia_Drone FOREIGN KEY (ID_Drone) REFERENCES Drone(ID),
     CONSTRAINT FK_Traccia_Missioni FOREIGN KEY (ID_Missione) REFERENCES Missioni(ID)
-);
\ No newline at end of file
+);
+
+-- ============================================
+-- CREATE TABLE STATDRONE (Riepilogo per drone)
+-- Aggiornata in modo incrementale dal backend;
+-- ricostruzione: python -m backend.rollup
+-- ============================================
+CREATE TABLE IF NOT EXISTS StatDrone (
+    ID_Drone INT PRIMARY KEY,
+    NumMissioni INT NOT NULL DEFAULT 0,
+    MissioniCompletate INT NOT NULL DEFAULT 0,
+    SommaValutazioni INT NOT NULL DEFAULT 0,
+    NumValutazioni INT NOT NULL DEFAULT 0,
+    UltimaMissione DATE,
+    CONSTRAINT FK_StatDrone_Drone FOREIGN KEY (ID_Drone) REFERENCES Drone(ID) ON DELETE CASCADE
+);
+
+-- ============================================
+-- CREATE TABLE STATPILOTA (Riepilogo per pilota)
+-- ============================================
+CREATE TABLE IF NOT EXISTS StatPilota (
+    ID_Pilota INT PRIMARY KEY,
+    NumMissioni INT NOT NULL DEFAULT 0,
+    MissioniCompletate INT NOT NULL DEFAULT 0,
+    SommaValutazioni INT NOT NULL DEFAULT 0,
+    NumValutazioni INT NOT NULL DEFAULT 0,
+    UltimaMissione DATE,
+    CONSTRAINT FK_StatPilota_Pilota FOREIGN KEY (ID_Pilota) REFERENCES Pilota(ID) ON DELETE CASCADE
+);
@@ -1,5 +1,6 @@
 """
-Script per avviare il server Flask
+Script per avviare il server Flask di sviluppo.
+In produzione usare `gunicorn wsgi:app` (vedi gunicorn.conf.py).
 """
 from backend.app import app
 import os
@@ -10,4 +11,6 @@ load_dotenv()
 if __name__ == '__main__':
     host = os.getenv('HOST', '0.0.0.0')
     port = int(os.getenv('PORT', 5001)) # Ho cambiato la porta predefinita a 5001
-    app.run(host=host, port=port, debug=True)
+    # Debugger e reloader solo se richiesti esplicitamente (FLASK_DEBUG=1)
+    debug = os.getenv('FLASK_DEBUG', '0') == '1'
+    app.run(host=host, port=port, debug=debug, threaded=True)
@@ -2,6 +2,10 @@
 // CONFIGURAZIONE
 // ============================================
 const API_BASE_URL = '/api';
+// Token dell'amministratore per le operazioni di scrittura (solo per questa scheda)
+let adminToken = sessionStorage.getItem('adminToken');
+let adminLoginPending = null;
+let resolveAdminLogin = null;
 
 // ============================================
 // INIZIALIZZAZIONE
@@ -31,10 +35,96 @@ document.addEventListener('DOMContentLoaded', () => {
         addPilotaForm.addEventListener('submit', handleAddPilota);
     }
     
+    // Form login amministratore
+    const adminLoginForm = document.getElementById('admin-login-form');
+    if (adminLoginForm) {
+        adminLoginForm.addEventListener('submit', handleAdminLogin);
+    }
+    
     // Carica dashboard
     loadDashboard();
 });
 
+// ============================================
+// AUTENTICAZIONE AMMINISTRATORE
+// ============================================
+function requireAdminLogin() {
+    if (adminToken) return Promise.resolve(adminToken);
+    if (!adminLoginPending) {
+        adminLoginPending = new Promise(resolve => { resolveAdminLogin = resolve; });
+        document.getElementById('admin-login-modal').style.display = 'flex';
+    }
+    return adminLoginPending;
+}
+
+function finishAdminLogin(token) {
+    document.getElementById('admin-login-modal').style.display = 'none';
+    document.getElementById('admin-login-form').reset();
+    document.getElementById('admin-login-error').style.display = 'none';
+    if (resolveAdminLogin) resolveAdminLogin(token);
+    adminLoginPending = null;
+    resolveAdminLogin = null;
+}
+
+function closeAdminLogin() {
+    finishAdminLogin(null);
+}
+
+async function handleAdminLogin(e) {
+    e.preventDefault();
+    const errorDiv = document.getElementById('admin-login-error');
+    
+    try {
+        const response = await fetch(`${API_BASE_URL}/login`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                Mail: document.getElementById('admin-email').value,
+                Password: document.getElementById('admin-password').value
+            })
+        });
+        const data = await response.json();
+        
+        if (data.success) {
+            adminToken = data.token;
+            sessionStorage.setItem('adminToken', adminToken);
+            finishAdminLogin(adminToken);
+        } else {
+            errorDiv.textContent = data.message || data.error || 'Credenziali non valide';
+            errorDiv.style.display = 'block';
+        }
+    } catch (error) {
+        console.error('Errore login:', error);
+        errorDiv.textContent = 'Errore di connessione al server';
+        errorDiv.style.display = 'block';
+    }
+}
+
+function adminLogout() {
+    adminToken = null;
+    sessionStorage.removeItem('adminToken');
+}
+
+// Richiesta con il token dell'amministratore; null se il login viene annullato
+async function adminFetch(url, options = {}) {
+    if (!adminToken) showLoading(false);
+    const token = await requireAdminLogin();
+    if (!token) return null;
+    showLoading(true);
+    
+    const response = await fetch(url, {
+        ...options,
+        headers: { ...(options.headers || {}), 'Authorization': `Bearer ${token}` }
+    });
+    if (response.status === 401) {
+        adminLogout();
+        alert('Sessione scaduta: effettua di nuovo l\'accesso');
+    } else if (response.status === 403) {
+        alert('Operazione riservata agli amministratori');
+    }
+    return response;
+}
+
 // ============================================
 // NAVIGAZIONE TRA VISTE
 // ============================================
@@ -88,37 +178,32 @@ function switchView(viewName) {
 // ============================================
 // DASHBOARD
 // ============================================
+// Dashboard e report condividono un unico documento (/api/dashboard):
+// il browser lo rivalida con l'ETag e riceve 304 se non è cambiato
+async function fetchDashboard() {
+    const response = await fetch(`${API_BASE_URL}/dashboard`);
+    if (!response.ok) {
+        throw new Error(`HTTP ${response.status}`);
+    }
+    return response.json();
+}
+
 async function loadDashboard() {
     try {
         showLoading(true);
         
-        // Carica statistiche
-        const [droniRes, missioniRes, statsRes] = await Promise.all([
-            fetch(`${API_BASE_URL}/droni`),
-            fetch(`${API_BASE_URL}/missioni`),
-            fetch(`${API_BASE_URL}/statistiche/missioni`)
-        ]);
-        
-        const droni = await droniRes.json();
-        const missioni = await missioniRes.json();
-        const stats = await statsRes.json();
+        const dashboard = await fetchDashboard();
+        const contatori = dashboard.contatori;
         
         // Aggiorna contatori
-        document.getElementById('stat-droni').textContent = droni.length;
-        
-        const missioniInCorso = missioni.filter(m => m.Stato === 'in corso').length;
-        document.getElementById('stat-missioni-corso').textContent = missioniInCorso;
-        
-        const missioniCompletate = stats.find(s => s.Stato === 'completata');
-        document.getElementById('stat-missioni-completate').textContent = 
-            missioniCompletate ? missioniCompletate.Totale : 0;
-        
-        const avgValutazione = missioniCompletate ? missioniCompletate.MediaValutazione : 0;
+        document.getElementById('stat-droni').textContent = contatori.droni;
+        document.getElementById('stat-missioni-corso').textContent = contatori.missioni_in_corso;
+        document.getElementById('stat-missioni-completate').textContent = contatori.missioni_completate;
         document.getElementById('stat-valutazione').textContent = 
-            avgValutazione ? avgValutazione.toFixed(1) : '0.0';
+            contatori.valutazione_media ? Number(contatori.valutazione_media).toFixed(1) : '0.0';
         
         // Mostra missioni recenti
-        displayRecentMissions(missioni.slice(0, 10));
+        displayRecentMissions(dashboard.recenti);
         
     } catch (error) {
         console.error('Errore caricamento dashboard:', error);
@@ -235,7 +320,7 @@ async function handleAddDrone(e) {
     
     try {
         showLoading(true);
-        const response = await fetch(`${API_BASE_URL}/droni`, {
+        const response = await adminFetch(`${API_BASE_URL}/droni`, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
@@ -246,6 +331,7 @@ async function handleAddDrone(e) {
                 Batteria: parseInt(batteria)
             })
         });
+        if (!response) return;
         
         const result = await response.json();
         
@@ -269,9 +355,10 @@ async function deleteDrone(id) {
     
     try {
         showLoading(true);
-        const response = await fetch(`${API_BASE_URL}/droni/${id}`, {
+        const response = await adminFetch(`${API_BASE_URL}/droni/${id}`, {
             method: 'DELETE'
         });
+        if (!response) return;
         
         if (response.ok) {
             alert('Drone eliminato con successo');
@@ -341,7 +428,9 @@ function displayMissioni(missioni) {
 async function loadOrdini() {
     try {
         showLoading(true);
-        const response = await fetch(`${API_BASE_URL}/ordini`);
+        // Gli ordini contengono nome e mail dei clienti: richiedono l'accesso
+        const response = await adminFetch(`${API_BASE_URL}/ordini`);
+        if (!response || !response.ok) return;
         const ordini = await response.json();
         
         displayOrdini(ordini);
@@ -433,11 +522,12 @@ async function handleAddPilota(e) {
     
     try {
         showLoading(true);
-        const response = await fetch(`${API_BASE_URL}/piloti`, {
+        const response = await adminFetch(`${API_BASE_URL}/piloti`, {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify(data)
         });
+        if (!response) return;
         
         if (response.ok) {
             alert('Pilota aggiunto con successo!');
@@ -458,7 +548,8 @@ async function deletePilota(id) {
     
     try {
         showLoading(true);
-        const response = await fetch(`${API_BASE_URL}/piloti/${id}`, { method: 'DELETE' });
+        const response = await adminFetch(`${API_BASE_URL}/piloti/${id}`, { method: 'DELETE' });
+        if (!response) return;
         const result = await response.json();
         
         if (response.ok) {
@@ -481,22 +572,12 @@ async function loadReport() {
     try {
         showLoading(true);
         
-        const [missioniRes, droniRes, pilotiRes, consegneRes] = await Promise.all([
-            fetch(`${API_BASE_URL}/statistiche/missioni`),
-            fetch(`${API_BASE_URL}/statistiche/droni`),
-            fetch(`${API_BASE_URL}/statistiche/piloti`),
-            fetch(`${API_BASE_URL}/report/consegne`)
-        ]);
-        
-        const missioni = await missioniRes.json();
-        const droni = await droniRes.json();
-        const piloti = await pilotiRes.json();
-        const consegne = await consegneRes.json();
+        const dashboard = await fetchDashboard();
         
-        displayMissioniStats(missioni);
-        displayDroniStats(droni);
-        displayTopPiloti(piloti);
-        displayConsegneStats(consegne);
+        displayMissioniStats(dashboard.missioni);
+        displayDroniStats(dashboard.droni);
+        displayTopPiloti(dashboard.piloti);
+        displayConsegneStats(dashboard.consegne);
         
     } catch (error) {
         console.error('Errore caricamento report:', error);
@@ -518,7 +599,7 @@ function displayMissioniStats(stats) {
                         <tr>
                             <td>${getStatoBadge(s.Stato)}</td>
                             <td><strong>${s.Totale}</strong></td>
-                            <td>${s.MediaValutazione ? s.MediaValutazione.toFixed(1) + '⭐' : '-'}</td>
+                            <td>${s.MediaValutazione ? Number(s.MediaValutazione).toFixed(1) + '⭐' : '-'}</td>
                         </tr>
                     `).join('')}
                 </tbody>
@@ -564,7 +645,7 @@ function displayTopPiloti(stats) {
                         <tr>
                             <td>${i === 0 ? '🥇' : i === 1 ? '🥈' : i === 2 ? '🥉' : ''} ${p.Nome} ${p.Cognome}</td>
                             <td>${p.NumeroMissioni}</td>
-                            <td><strong>${p.MediaValutazione.toFixed(1)}</strong>⭐</td>
+                            <td><strong>${Number(p.MediaValutazione).toFixed(1)}</strong>⭐</td>
                         </tr>
                     `).join('')}
                 </tbody>
@@ -586,7 +667,7 @@ function displayConsegneStats(stats) {
                         <tr>
                             <td>${c.Tipo}</td>
                             <td><strong>${c.Totale}</strong></td>
-                            <td>${c.PesoMedio ? c.PesoMedio.toFixed(2) : 0} kg</td>
+                            <td>${c.PesoMedio ? Number(c.PesoMedio).toFixed(2) : 0} kg</td>
                         </tr>
                     `).join('')}
                 </tbody>
@@ -645,8 +726,10 @@ async function runMaintenancePrediction() {
         tbody.innerHTML = data.map(d => `
             <tr>
                 <td>${d.modello}</td>
-                <td>${d.batteria}%</td>
+                <td>${d.salute_batteria}%</td>
+                <td>${d.ore_volo} h</td>
                 <td>${d.missioni}</td>
+                <td>${d.usura}%</td>
                 <td>
                     <span class="badge ${d.stato === 'ok' ? 'badge-green' : d.stato === 'attenzione' ? 'badge-yellow' : 'badge-red'}">
                         ${d.stato === 'ok' ? '✅ OK' : d.stato === 'attenzione' ? '⚠️ Attenzione' : '🔧 Critico'}
@@ -6,7 +6,9 @@ let currentUser = null;
 let map = null;
 let droneMarker = null;
 let routeLine = null;
-let updateInterval = null;
+let liveSource = null;
+let currentTracce = [];
+let ordersById = {};
 
 // ============================================
 // INIZIALIZZAZIONE
@@ -90,8 +92,9 @@ async function handleLogin(e) {
         const data = await response.json();
         
         if (data.success) {
-            currentUser = data.user;
-            localStorage.setItem('user', JSON.stringify(data.user));
+            // Il token firmato accompagna l'utente e autorizza le richieste protette
+            currentUser = { ...data.user, token: data.token };
+            localStorage.setItem('user', JSON.stringify(currentUser));
             showDashboard();
             loadOrders();
         } else {
@@ -109,25 +112,40 @@ async function handleLogin(e) {
 
 function checkSession() {
     const userStr = localStorage.getItem('user');
-    if (userStr) {
-        currentUser = JSON.parse(userStr);
+    const user = userStr ? JSON.parse(userStr) : null;
+    // Utenti salvati prima dei token: serve un nuovo login
+    if (user && user.token) {
+        currentUser = user;
         showDashboard();
         loadOrders();
     } else {
+        localStorage.removeItem('user');
         // Nessuna sessione: mostra selezione ruolo
         showRoleSelection();
     }
 }
 
+function authHeaders(headers = {}) {
+    return { ...headers, 'Authorization': `Bearer ${currentUser.token}` };
+}
+
+// Token scaduto o non valido (401): si torna al login
+function checkAuth(response) {
+    if (response.status === 401) {
+        showAlert('Sessione scaduta, effettua di nuovo il login', 'danger');
+        handleLogout();
+        return false;
+    }
+    return true;
+}
+
 function handleLogout(e) {
-    e.preventDefault();
+    if (e) e.preventDefault();
     localStorage.removeItem('user');
     currentUser = null;
     
     // Ferma aggiornamenti automatici
-    if (updateInterval) {
-        clearInterval(updateInterval);
-    }
+    stopLiveTracking();
     
     // Mostra selezione ruolo
     document.getElementById('role-section').style.display = 'flex';
@@ -155,9 +173,15 @@ async function loadOrders() {
     
     try {
         showLoading(true);
-        const response = await fetch(`${API_BASE_URL}/ordini/utente/${currentUser.ID}`);
+        // Ordini e prodotti in un'unica richiesta: il dettaglio non richiede altre chiamate
+        const response = await fetch(`${API_BASE_URL}/ordini/utente/${currentUser.ID}?include=prodotti`, {
+            headers: authHeaders()
+        });
+        if (!checkAuth(response)) return;
         const orders = await response.json();
         
+        ordersById = {};
+        orders.forEach(order => { ordersById[order.ID] = order; });
         displayOrders(orders);
     } catch (error) {
         console.error('Errore caricamento ordini:', error);
@@ -235,9 +259,15 @@ async function loadOrderDetail(orderId) {
     try {
         showLoading(true);
         
-        // Carica dettagli ordine
-        const orderResponse = await fetch(`${API_BASE_URL}/ordini/${orderId}`);
-        const order = await orderResponse.json();
+        // Dettagli ordine già caricati con la lista, altrimenti richiesti al server
+        let order = ordersById[orderId];
+        if (!order) {
+            const orderResponse = await fetch(`${API_BASE_URL}/ordini/${orderId}`, {
+                headers: authHeaders()
+            });
+            if (!checkAuth(orderResponse)) return;
+            order = await orderResponse.json();
+        }
         
         // Mostra vista dettaglio
         document.getElementById('orders-view').style.display = 'none';
@@ -329,6 +359,7 @@ async function loadMissionTracking(missionId, stato) {
     try {
         const response = await fetch(`${API_BASE_URL}/tracce/missione/${missionId}`);
         const tracce = await response.json();
+        currentTracce = tracce || [];
         
         if (tracce && tracce.length > 0) {
             initMap(tracce);
@@ -402,20 +433,24 @@ function displayTimeline(tracce) {
     const timeline = document.getElementById('tracking-timeline');
     
     timeline.innerHTML = `
-        <div style="max-height: 400px; overflow-y: auto;">
-            ${tracce.map((t, index) => `
-                <div class="timeline-item">
-                    <div class="timeline-content">
-                        <div class="d-flex justify-content-between align-items-start mb-2">
-                            <strong>Punto ${index + 1}</strong>
-                            <span class="timeline-time">${formatDateTime(t.TIMESTAMP)}</span>
-                        </div>
-                        <div class="text-muted">
-                            <small>📍 Lat: ${t.Latitudine.toFixed(6)}, Lon: ${t.Longitudine.toFixed(6)}</small>
-                        </div>
-                    </div>
+        <div id="timeline-list" style="max-height: 400px; overflow-y: auto;">
+            ${tracce.map((t, index) => timelineItem(t, index)).join('')}
+        </div>
+    `;
+}
+
+function timelineItem(t, index) {
+    return `
+        <div class="timeline-item">
+            <div class="timeline-content">
+                <div class="d-flex justify-content-between align-items-start mb-2">
+                    <strong>Punto ${index + 1}</strong>
+                    <span class="timeline-time">${formatDateTime(t.TIMESTAMP)}</span>
                 </div>
-            `).join('')}
+                <div class="text-muted">
+                    <small>📍 Lat: ${Number(t.Latitudine).toFixed(6)}, Lon: ${Number(t.Longitudine).toFixed(6)}</small>
+                </div>
+            </div>
         </div>
     `;
 }
@@ -425,39 +460,69 @@ function displayTimeline(tracce) {
 // ============================================
 function startLiveTracking(missionId) {
     // Ferma eventuali aggiornamenti precedenti
-    if (updateInterval) {
-        clearInterval(updateInterval);
-    }
+    stopLiveTracking();
     
     // Mostra indicatore live
     const indicator = document.getElementById('live-indicator');
+    indicator.classList.remove('badge-gray');
     indicator.classList.add('badge-success');
     indicator.textContent = '🟢 LIVE';
     
-    // Aggiorna ogni 5 secondi
-    updateInterval = setInterval(async () => {
+    // Il server invia solo i punti successivi all'ultimo già caricato;
+    // in caso di riconnessione il browser riprende da Last-Event-ID
+    const last = currentTracce[currentTracce.length - 1];
+    const since = last ? `?since=${encodeURIComponent(last.TIMESTAMP)}` : '';
+    liveSource = new EventSource(`${API_BASE_URL}/tracce/stream/${missionId}${since}`);
+    
+    liveSource.onmessage = (event) => {
         try {
-            const response = await fetch(`${API_BASE_URL}/tracce/ultima/${missionId}`);
-            const lastTrace = await response.json();
-            
-            if (lastTrace && droneMarker) {
-                // Aggiorna posizione marker
-                const newLatLng = [lastTrace.Latitudine, lastTrace.Longitudine];
-                droneMarker.setLatLng(newLatLng);
-                
-                // Aggiorna percorso
-                await loadMissionTracking(missionId, 'in corso');
-            }
+            appendTrace(JSON.parse(event.data));
         } catch (error) {
             console.error('Errore aggiornamento live:', error);
         }
-    }, 5000);
+    };
+    
+    liveSource.onerror = () => {
+        if (liveSource.readyState !== EventSource.CLOSED) {
+            console.warn('Stream live interrotto, riconnessione in corso...');
+            return;
+        }
+        // Risposta non valida (es. 503 con troppi stream aperti): il browser non riprova da solo
+        console.warn('Stream live non disponibile, nuovo tentativo tra 30 secondi');
+        const source = liveSource;
+        setTimeout(() => {
+            if (liveSource === source) startLiveTracking(missionId);
+        }, 30000);
+    };
+}
+
+function appendTrace(trace) {
+    const last = currentTracce[currentTracce.length - 1];
+    if (last && trace.TIMESTAMP <= last.TIMESTAMP) return;
+    
+    currentTracce.push(trace);
+    const latLng = [Number(trace.Latitudine), Number(trace.Longitudine)];
+    
+    if (!map) {
+        initMap(currentTracce);
+        displayTimeline(currentTracce);
+        return;
+    }
+    
+    // Aggiorna solo il nuovo punto: marker, percorso e timeline
+    droneMarker.setLatLng(latLng);
+    routeLine.addLatLng(latLng);
+    
+    const list = document.getElementById('timeline-list');
+    if (list) {
+        list.insertAdjacentHTML('beforeend', timelineItem(trace, currentTracce.length - 1));
+    }
 }
 
 function stopLiveTracking() {
-    if (updateInterval) {
-        clearInterval(updateInterval);
-        updateInterval = null;
+    if (liveSource) {
+        liveSource.close();
+        liveSource = null;
     }
     
     const indicator = document.getElementById('live-indicator');
@@ -608,14 +673,15 @@ async function handleRatingSubmit(e) {
         showLoading(true);
         const response = await fetch(`${API_BASE_URL}/missioni/${currentMissionId}/valutazione`, {
             method: 'POST',
-            headers: {
+            headers: authHeaders({
                 'Content-Type': 'application/json',
-            },
+            }),
             body: JSON.stringify({
                 Valutazione: rating,
                 Commento: comment
             })
         });
+        if (!checkAuth(response)) return;
         
         const result = await response.json();
         
@@ -0,0 +1,6 @@
+"""
+Entry point WSGI di produzione:
+    gunicorn wsgi:app
+(parametri in gunicorn.conf.py)
+"""
+from backend.app import app